@@ -0,0 +1,169 @@
+# Developers:   Yang Hu, et al.
+# Email:    huyang0905@gmail.com
+
+import os
+import json
+import sqlite3
+import hashlib
+from collections import OrderedDict
+
+
+def get_hash(s):
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+
+def connect_db(db_path, create_table_sql):
+    conn = sqlite3.connect(db_path, timeout=60)
+    conn.execute("PRAGMA journal_mode=WAL")
+    # Each entry is committed on its own, which need not wait for the disk with WAL
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(create_table_sql)
+    conn.commit()
+    return conn
+
+
+class TestResultCache:
+    """Test results of programs, keyed by the hash of the regularized code and of the test suite.
+        The most recently used results are kept in memory, and all results are stored in an SQLite
+        file if db_path is given, so that later runs skip the programs they have already tested.
+    """
+    def __init__(self, suite_hash, db_path=None, max_size=4096):
+        self.__suite_hash = suite_hash
+        self.__db_path = db_path
+        self.__max_size = max_size
+
+        # key -> (tr_dict, is_full), in the order of use
+        self.__tr_map = OrderedDict()
+
+        self.__pid = None
+        self.__conn = None
+
+    def get_key(self, code, timeout):
+        return get_hash(self.__suite_hash + "\n" + str(timeout) + "\n" + code)
+
+    def get(self, key, is_fail_fast=False):
+        """Return a copy of the cached test results, None if there are none.
+            Results of a fail-fast run only cover part of the test cases, and are only returned
+            to fail-fast runs.
+        """
+        if key in self.__tr_map.keys():
+            self.__tr_map.move_to_end(key)
+            tr_dict, is_full = self.__tr_map[key]
+        else:
+            conn = self.__get_conn()
+            if conn is None:
+                return None
+
+            row = conn.execute("SELECT tr, is_full FROM test_result WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+
+            tr_dict, is_full = json.loads(row[0]), bool(row[1])
+            self.__put_mem(key, tr_dict, is_full)
+
+        if not (is_full or is_fail_fast):
+            return None
+        return dict(tr_dict)
+
+    def put(self, key, tr_dict, is_full):
+        self.__put_mem(key, dict(tr_dict), is_full)
+
+        conn = self.__get_conn()
+        if conn is not None:
+            conn.execute("INSERT OR REPLACE INTO test_result VALUES (?, ?, ?)",
+                         (key, json.dumps(tr_dict), int(is_full)))
+            conn.commit()
+
+    def __put_mem(self, key, tr_dict, is_full):
+        self.__tr_map[key] = (tr_dict, is_full)
+        self.__tr_map.move_to_end(key)
+        while len(self.__tr_map) > self.__max_size:
+            self.__tr_map.popitem(last=False)
+
+    def __get_conn(self):
+        if self.__db_path is None:
+            return None
+
+        if os.getpid() != self.__pid:
+            # A connection must not be shared with a forked process
+            self.__pid = os.getpid()
+            self.__conn = connect_db(self.__db_path, "CREATE TABLE IF NOT EXISTS test_result "
+                                                     "(key TEXT PRIMARY KEY, tr TEXT, is_full INTEGER)")
+        return self.__conn
+
+    def close(self):
+        if self.__conn is not None and os.getpid() == self.__pid:
+            self.__conn.close()
+        self.__pid = None
+        self.__conn = None
+
+
+class TransitionCache:
+    """Codes refactored from a code by a rule, keyed by the hash of the code, of the rule id and of
+        the rules, which are pure functions of the code. The most recently used transitions are kept
+        in memory, and all transitions are stored in an SQLite file if db_path is given, so that they
+        are shared by the runs on all sampling rates of a question.
+        Forked processes only share the transitions they make through the SQLite file.
+    """
+    def __init__(self, rules_hash, db_path=None, max_size=8192):
+        self.__rules_hash = rules_hash
+        self.__db_path = db_path
+        self.__max_size = max_size
+
+        # key -> refactored code list, in the order of use
+        self.__rft_map = OrderedDict()
+
+        self.__pid = None
+        self.__conn = None
+
+    def get_key(self, code, rule_id):
+        return get_hash(self.__rules_hash + "\n" + str(rule_id) + "\n" + code)
+
+    def get(self, key):
+        """Return the cached refactored code list, None if there is none"""
+        if key in self.__rft_map.keys():
+            self.__rft_map.move_to_end(key)
+            return self.__rft_map[key]
+
+        conn = self.__get_conn()
+        if conn is None:
+            return None
+
+        row = conn.execute("SELECT rft_code_list FROM transition WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+
+        rft_code_list = json.loads(row[0])
+        self.__put_mem(key, rft_code_list)
+        return rft_code_list
+
+    def put(self, key, rft_code_list):
+        self.__put_mem(key, rft_code_list)
+
+        conn = self.__get_conn()
+        if conn is not None:
+            conn.execute("INSERT OR REPLACE INTO transition VALUES (?, ?)", (key, json.dumps(rft_code_list)))
+            conn.commit()
+
+    def __put_mem(self, key, rft_code_list):
+        self.__rft_map[key] = rft_code_list
+        self.__rft_map.move_to_end(key)
+        while len(self.__rft_map) > self.__max_size:
+            self.__rft_map.popitem(last=False)
+
+    def __get_conn(self):
+        if self.__db_path is None:
+            return None
+
+        if os.getpid() != self.__pid:
+            # A connection must not be shared with a forked process
+            self.__pid = os.getpid()
+            self.__conn = connect_db(self.__db_path, "CREATE TABLE IF NOT EXISTS transition "
+                                                     "(key TEXT PRIMARY KEY, rft_code_list TEXT)")
+        return self.__conn
+
+    def close(self):
+        if self.__conn is not None and os.getpid() == self.__pid:
+            self.__conn.close()
+        self.__pid = None
+        self.__conn = None
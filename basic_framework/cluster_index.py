@@ -0,0 +1,176 @@
+# Developers:   Yang Hu, et al.
+# Email:    huyang0905@gmail.com
+
+import sys
+import bisect
+import Levenshtein
+from array import array
+from basic_framework.distance import cpr_stru_list, token_id_map, intern_token_list, lev_id_dist
+from basic_framework.statement import get_token_list
+
+
+def add_cluster_token_ids(cluster_list_map, token_str_list=None):
+    """Tokenize the codes of each cluster into cluster["token_ids"], one array of ids per code,
+        so that they are stored along with the clusters. The ids are local to cluster_list_map,
+        and the token strings they stand for are returned.
+        If token_str_list was returned before for these clusters, only the codes added since are tokenized.
+    """
+    local_id_map = {}
+    if token_str_list is not None:
+        local_id_map = {token_str: local_id for local_id, token_str in enumerate(token_str_list)}
+
+    for cluster_list in cluster_list_map.values():
+        for cluster in cluster_list:
+            if token_str_list is None or "token_ids" not in cluster.keys():
+                cluster["token_ids"] = []
+            for code in cluster["code"][len(cluster["token_ids"]):]:
+                cluster["token_ids"].append(array('i', [local_id_map.setdefault(token.string, len(local_id_map))
+                                                        for token in get_token_list(code)]))
+
+    token_str_list = [None] * len(local_id_map)
+    for token_str, local_id in local_id_map.items():
+        token_str_list[local_id] = token_str
+    return token_str_list
+
+
+class BKTree:
+    """Burkhard-Keller tree over strings with the Levenshtein distance, each string
+        holding the indices of the items it stands for
+    """
+    def __init__(self):
+        # [string, idx_list, {distance: child node}]
+        self.__root = None
+
+    def add(self, s, idx):
+        if self.__root is None:
+            self.__root = [s, [idx], {}]
+            return
+
+        node = self.__root
+        while True:
+            d = Levenshtein.distance(s, node[0])
+            if d == 0:
+                node[1].append(idx)
+                return
+            if d not in node[2].keys():
+                node[2][d] = [s, [idx], {}]
+                return
+            node = node[2][d]
+
+    def get_nearest_idx(self, s):
+        """Return the smallest index among the strings nearest to s, None if the tree is empty"""
+        if self.__root is None:
+            return None
+
+        min_d, min_node = sys.maxsize, None
+        stack = [(self.__root, 0)]
+        while len(stack) > 0:
+            node, lower_d = stack.pop()
+            if lower_d > min_d:
+                continue
+
+            d = Levenshtein.distance(s, node[0])
+            if d < min_d or (d == min_d and node[1][0] < min_node[1][0]):
+                min_d, min_node = d, node
+
+            # By the triangle inequality, a child at distance child_d from this node
+            # is at least |d - child_d| away from s
+            for child_d, child in node[2].items():
+                if abs(d - child_d) <= min_d:
+                    stack.append((child, abs(d - child_d)))
+        return min_node[1][0]
+
+
+class ClusterIndex:
+    """Index of the clusters of refactored programs, see Refactoring.ofl_bfs, to select the
+        correct program closest to a buggy one without scanning all of them.
+        Clusters are found by their structure, exactly or by the nearest compressed structure,
+        and the programs of a cluster are visited by their number of tokens, nearest first.
+        Ties are broken by the order of cluster_list_map, like a linear scan.
+        If the clusters were stored with add_cluster_token_ids, token_str_list is the list it returned,
+        and their codes are never tokenized again.
+    """
+    def __init__(self, cluster_list_map, token_str_list=None):
+        self.cluster_list_map = cluster_list_map
+
+        # local token id -> token id of this process, see intern_token_list
+        self.__token_id_list = None
+        if token_str_list is not None:
+            self.__token_id_list = [token_id_map.setdefault(token_str, len(token_id_map))
+                                    for token_str in token_str_list]
+
+        # func_name -> {(stru, indent): idx of the first cluster with them}
+        self.__stru_map = {}
+
+        # func_name -> BKTree of the compressed structures of the clusters
+        self.__bk_tree_map = {}
+
+        # (func_name, cluster idx) -> ([token count], [code idx], [token ids]), sorted by token count.
+        # Built when the cluster is first selected.
+        self.__bucket_map = {}
+
+        for func_name, cluster_list in cluster_list_map.items():
+            stru_map = {}
+            bk_tree = BKTree()
+            for i in range(len(cluster_list)):
+                cluster = cluster_list[i]
+                stru_map.setdefault((tuple(cluster["stru"]), tuple(cluster["indent"])), i)
+                bk_tree.add(cpr_stru_list(cluster["stru"]), i)
+
+            self.__stru_map[func_name] = stru_map
+            self.__bk_tree_map[func_name] = bk_tree
+
+    def has_func(self, func_name):
+        return func_name in self.cluster_list_map.keys()
+
+    def get_cluster_idx(self, func_name, stru_list, indent_list):
+        """Return the index of the cluster of the same structure, or else of the nearest structure,
+            None if the function has no cluster
+        """
+        key = (tuple(stru_list), tuple(indent_list))
+        if key in self.__stru_map[func_name].keys():
+            return self.__stru_map[func_name][key]
+        return self.__bk_tree_map[func_name].get_nearest_idx(cpr_stru_list(stru_list))
+
+    def get_code_idx(self, func_name, cluster_idx, token_ids):
+        """Return the index of the code in the cluster with the fewest token edits from token_ids"""
+        len_list, code_idx_list, ids_list = self.__get_buckets(func_name, cluster_idx)
+
+        min_d, min_code_idx = None, None
+
+        # Visit the codes outwards from the token count of token_ids, so that the differences
+        # in token count never decrease, and stop when it alone exceeds the best distance
+        n = len(token_ids)
+        hi = bisect.bisect_left(len_list, n)
+        lo = hi - 1
+        while lo >= 0 or hi < len(len_list):
+            if hi >= len(len_list) or (lo >= 0 and n - len_list[lo] <= len_list[hi] - n):
+                i = lo
+                lo -= 1
+            else:
+                i = hi
+                hi += 1
+
+            if min_d is not None and abs(len_list[i] - n) > min_d:
+                break
+
+            d = lev_id_dist(token_ids, ids_list[i], min_d)
+            if min_d is None or d < min_d or (d == min_d and code_idx_list[i] < min_code_idx):
+                min_d, min_code_idx = d, code_idx_list[i]
+        return min_code_idx
+
+    def __get_buckets(self, func_name, cluster_idx):
+        key = (func_name, cluster_idx)
+        if key not in self.__bucket_map.keys():
+            cluster = self.cluster_list_map[func_name][cluster_idx]
+            code_list = cluster["code"]
+            if self.__token_id_list is not None and "token_ids" in cluster.keys():
+                ids_list = [tuple(self.__token_id_list[local_id] for local_id in local_ids)
+                            for local_ids in cluster["token_ids"]]
+            else:
+                ids_list = [intern_token_list(get_token_list(code)) for code in code_list]
+            order = sorted(range(len(code_list)), key=lambda i: len(ids_list[i]))
+            self.__bucket_map[key] = ([len(ids_list[i]) for i in order],
+                                      order,
+                                      [ids_list[i] for i in order])
+        return self.__bucket_map[key]
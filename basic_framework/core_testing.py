@@ -2,14 +2,47 @@
 # Email:    huyang0905@gmail.com
 
 import os
-from basic_framework.holes import Holes
+from basic_framework.holes import Holes, get_syn_ctx
 from basic_framework.utils import regularize
-from basic_framework.exec import run_program_to
+from basic_framework.exec import run_program_to, ExecPool, compile_code, compile_program, compile_entry
 from basic_framework.hole_injection import add_iil_holes
+from basic_framework.cache import TestResultCache, get_hash
+
+
+class TestCase:
+    """A test case loaded in memory, with its entry code compiled and its expected output evaluated"""
+    def __init__(self, tc_id, entry_code, exp_output_str):
+        self.tc_id = tc_id
+        self.entry_code = entry_code
+        self.entry_code_obj = compile_entry(entry_code)
+        self.is_print_entry = "print(" in entry_code
+        self.exp_value = eval(exp_output_str.strip())
+        self.exp_output = str(self.exp_value) + "\n"
+
+    def is_pass(self, real_value, real_output):
+        """Compare the value returned by the entry code with the expected one,
+            falling back to the output the entry code would have printed
+        """
+        if not self.is_print_entry:
+            if real_output == "" and Holes.is_object_equal(real_value, self.exp_value):
+                return True
+            real_output += str(real_value) + "\n"
+        return self.is_output_pass(real_output)
+
+    def is_output_pass(self, real_output):
+        if real_output == self.exp_output:
+            return True
+
+        if "{" in real_output and "{" in self.exp_output:
+            try:
+                return eval(real_output.strip()) == self.exp_value
+            except:
+                pass
+        return False
 
 
 class Tester:
-    def __init__(self, ques_dir_path):
+    def __init__(self, ques_dir_path, pool_size=0, is_disk_cache=False, jobs=1):
         self.__ques_dir_path = ques_dir_path
         self.__ans_dir_path = ques_dir_path + "/ans"
 
@@ -19,6 +52,14 @@ class Tester:
                 len(list(self.__output_dict.keys())) == 0:
             raise Tester.NoTestCaseException()
 
+        # Load the whole test suite once, so that running a test case reads no file
+        self.__tc_map = {}
+        for tc_id in self.__input_dict.keys():
+            self.__tc_map[tc_id] = self.__load_tc(tc_id)
+
+        # How many times each test case failed, to run the most discriminating ones first
+        self.__fail_cnt_map = {tc_id: 0 for tc_id in self.__tc_map.keys()}
+
         self.__front_code = ""
         if os.path.isfile(ques_dir_path + "/code/global.py"):
             with open(ques_dir_path + "/code/global.py", "r") as f:
@@ -31,6 +72,26 @@ class Tester:
                 self.__end_code += f.read()
                 self.__end_code += "\n"
 
+        # global.py and global_append.py are compiled once for all programs
+        self.__front_code_obj = compile_code(self.__front_code)
+        self.__end_code_obj = compile_code(self.__end_code)
+
+        # Test cases are run in the current process unless a pool size is given
+        self.__exec_pool = None
+        if pool_size is None or pool_size > 0:
+            # The workers are forked with the test suite, which they share read-only.
+            # Each of jobs processes forked to repair programs starts its share of them.
+            self.__exec_pool = ExecPool(pool_size, self.__tc_map, jobs)
+
+        # Test results are cached, on disk as well if is_disk_cache is set
+        db_path = None
+        if is_disk_cache:
+            refactor_dir_path = ques_dir_path + "/code/refactor"
+            if not os.path.isdir(refactor_dir_path):
+                os.makedirs(refactor_dir_path)
+            db_path = refactor_dir_path + "/test_result.sqlite"
+        self.__tr_cache = TestResultCache(self.__get_suite_hash(), db_path)
+
     class NoTestCaseException(Exception):
         pass
 
@@ -51,8 +112,18 @@ class Tester:
                     res[tc_id] = curr_path
         return res
 
-    def tv_code(self, code, timeout=2):
+    def tv_code(self, code, timeout=2, is_fail_fast=False):
+        """Return the test results of code, keyed by test case id.
+            In fail-fast mode, the test cases that failed most often run first and the run stops
+            at the first failure, so the result only covers the test cases that were run.
+        """
         code = regularize(code)
+
+        cache_key = self.__tr_cache.get_key(code, timeout)
+        tr_dict = self.__tr_cache.get(cache_key, is_fail_fast)
+        if tr_dict is not None:
+            return tr_dict
+
         try:
             code = add_iil_holes(code)
         except:
@@ -60,54 +131,95 @@ class Tester:
             print(code)
             return {}
 
-        tr_dict = {}
-        for tc_id in self.get_tc_id_list():
-            Holes.init_global_vars()
-            real_output, exp_output = self.run_tc(code, tc_id, timeout)
-
-            # Debug
-            #if real_output != exp_output:
-            #    print(real_output)
-            #    print(exp_output)
-
-            tr_dict[tc_id] = (real_output == exp_output)
+        tc_id_list = []
+        if is_fail_fast:
+            tc_id_list = self.get_ordered_tc_id_list()
+        else:
+            tc_id_list = self.get_tc_id_list()
 
-            if "{" in real_output and "{" in exp_output:
-                a, b = None, None
+        tr_dict = self.tv_prog(self.compile_program(code), tc_id_list, timeout, is_fail_fast)
 
-                try:
-                    a = eval(real_output.strip())
-                except:
-                    pass
-
-                try:
-                    b = eval(exp_output.strip())
-                except:
-                    pass
-                #print(a)
-                #print(b)
-                tr_dict[tc_id] = tr_dict[tc_id] or (a == b)
+        # A fail-fast run that passed has run all test cases
+        self.__tr_cache.put(cache_key, tr_dict, not is_fail_fast or self.is_pass(tr_dict))
 
+        for tc_id, is_tc_pass in tr_dict.items():
+            if not is_tc_pass:
+                self.__fail_cnt_map[tc_id] += 1
         return tr_dict
 
     def get_tc_id_list(self):
-        tc_id_list = list(self.__input_dict.keys())
+        tc_id_list = list(self.__tc_map.keys())
         tc_id_list.sort()
         return tc_id_list
 
-    def run_tc(self, code, tc_id, timeout):
+    def get_ordered_tc_id_list(self):
+        """Test case ids, the ones that failed most often first"""
+        tc_id_list = self.get_tc_id_list()
+        tc_id_list.sort(key=lambda tc_id: -self.__fail_cnt_map[tc_id])
+        return tc_id_list
+
+    def get_tc(self, tc_id):
+        return self.__tc_map[tc_id]
+
+    def __load_tc(self, tc_id):
         input_path = self.__input_dict[tc_id]
         entry_code = ""
         with open(input_path, "r") as f:
             entry_code += f.read()
 
         output_path = self.__output_dict[tc_id]
-        exp_output = ""
+        exp_output_str = ""
         with open(output_path, "r") as f:
-            exp_output += str(eval(f.read().strip())) + "\n"
+            exp_output_str += f.read()
+        return TestCase(tc_id, entry_code, exp_output_str)
+
+    def __get_suite_hash(self):
+        """Hash of the test suite and of the code around the tested programs"""
+        str_list = [self.__front_code, self.__end_code]
+        for tc_id in self.get_tc_id_list():
+            tc = self.__tc_map[tc_id]
+            str_list.extend([tc_id, tc.entry_code, tc.exp_output])
+        return get_hash("\0".join(str_list))
+
+    def compile_program(self, code):
+        """Compile code once, so that it can be run on every test case"""
+        return compile_program(code, self.__front_code_obj, self.__end_code_obj)
+
+    def run_tc(self, prog, tc_id, timeout, is_pool=False):
+        """Run a program compiled by compile_program on a test case in the current process,
+            or in the exec pool if is_pool is set, and return whether it passes.
+            Synthesis and tracing read the state of Holes afterwards, so they must not use the pool.
+        """
+        if is_pool and self.__exec_pool is not None:
+            return self.__exec_pool.run_program_to(prog, tc_id, timeout)
+        return run_program_to(prog, self.__tc_map[tc_id], timeout)
+
+    def tv_prog(self, prog, tc_id_list, timeout, is_fail_fast=False):
+        """Run a compiled program on test cases, spreading them over the exec pool if any"""
+        tr_dict = {}
+        if self.__exec_pool is None:
+            for tc_id in tc_id_list:
+                get_syn_ctx().reset()
+                tr_dict[tc_id] = self.run_tc(prog, tc_id, timeout)
+                if is_fail_fast and not tr_dict[tc_id]:
+                    break
+            return tr_dict
+
+        stop_func = None
+        if is_fail_fast:
+            stop_func = lambda j_idx, is_tc_pass: not is_tc_pass
+
+        tr_list = self.__exec_pool.run_program_list(prog, tc_id_list, timeout, stop_func)
+        for tc_id, is_tc_pass in zip(tc_id_list, tr_list):
+            if is_tc_pass is not None:
+                tr_dict[tc_id] = is_tc_pass
+        return tr_dict
 
-        real_output = run_program_to(code, self.__front_code, self.__end_code, entry_code, timeout)
-        return real_output, exp_output
+    def close(self):
+        if self.__exec_pool is not None:
+            self.__exec_pool.close()
+            self.__exec_pool = None
+        self.__tr_cache.close()
 
     def is_pass(self, tr):
         return all(list(tr.values()))
@@ -121,7 +233,7 @@ class Tester:
             with open(corr_file_path, "r") as f:
                 code += f.read()
 
-            tr = self.tv_code(code)
+            tr = self.tv_code(code, is_fail_fast=True)
             if not self.is_pass(tr):
                 print(corr_file_name, "not passed")
                 print(code)
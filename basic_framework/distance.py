@@ -10,47 +10,41 @@ from basic_framework.statement import get_token_list
 from fastcache import clru_cache
 
 
-def multi_func_stru_dist(cfs_map_a, cfs_map_b):
-    func_name_set = set(cfs_map_a.keys()).union(set(cfs_map_b.keys()))
-
-    sum_d = 0
-    for func_name in func_name_set:
-        stru_list_a = []
-        if func_name in cfs_map_a.keys():
-            _, stru_list_a,_ = cfs_map_a[func_name]
-
-        stru_list_b = []
-        if func_name in cfs_map_b.keys():
-            _, stru_list_b, _ = cfs_map_b[func_name]
-
-        sum_d += stru_dist(stru_list_a, stru_list_b)
-    return sum_d
-
-
-def stru_dist(stru_list_a, stru_list_b):
-    str_stru_a = cpr_stru_list(stru_list_a)
-    str_stru_b = cpr_stru_list(stru_list_b)
-    return Levenshtein.distance(str_stru_a, str_stru_b)
+def multi_func_stru_dist_list(stru_str_map, stru_str_map_list):
+    """Return the structure distances of stru_str_map to each of stru_str_map_list, see get_stru_str_map.
+        Each distinct structure of a function is only compared once.
+    """
+    d_list = [0] * len(stru_str_map_list)
+    for i in range(len(stru_str_map_list)):
+        for func_name, stru_str_b in stru_str_map_list[i].items():
+            if func_name not in stru_str_map.keys():
+                d_list[i] += len(stru_str_b)
+
+    for func_name, stru_str_a in stru_str_map.items():
+        # compressed structure -> distance to stru_str_a
+        d_map = {}
+        for i in range(len(stru_str_map_list)):
+            stru_str_b = stru_str_map_list[i].get(func_name, "")
+            if stru_str_b not in d_map.keys():
+                # Not bit-parallel over integer-encoded structures, as lev_id_dist is for token ids:
+                # the structures are short strings, which OnlineRefactoring keeps for each code in its
+                # node map, and Levenshtein's C distance on them is about 40x faster than lev_id_dist in Python.
+                d_map[stru_str_b] = Levenshtein.distance(stru_str_a, stru_str_b)
+            d_list[i] += d_map[stru_str_b]
+    return d_list
+
+
+def get_stru_str_map(cfs_map):
+    """Map each function of cfs_map to its compressed structure, see cpr_stru_list"""
+    return {func_name: cpr_stru_list(stru_list) for func_name, (_, stru_list, _) in cfs_map.items()}
+
+
+# structure -> its character in compressed structures
+stru_char_map = {"bb": "b", "sig": "s", "for": "f", "while": "w", "if": "i", "elif": "e", "else": "l"}
 
 
 def cpr_stru_list(stru_list):
-    cpr_str = ""
-    for stru in stru_list:
-        if stru == "bb":
-            cpr_str += "b"
-        elif stru == "sig":
-            cpr_str += "s"
-        elif stru == "for":
-            cpr_str += "f"
-        elif stru == "while":
-            cpr_str += "w"
-        elif stru == "if":
-            cpr_str += "i"
-        elif stru == "elif":
-            cpr_str += "e"
-        elif stru == "else":
-            cpr_str += "l"
-    return cpr_str
+    return "".join([stru_char_map.get(stru, "") for stru in stru_list])
 
 
 def str_node(node):
@@ -177,64 +171,131 @@ def zss_code_ast_edit(code_a, code_b):
     return cost, ops
 
 
+# token string -> id, shared by all token id sequences so that they can be compared
+token_id_map = {}
+
+
+def intern_token_list(token_list):
+    return tuple(token_id_map.setdefault(token.string, len(token_id_map)) for token in token_list)
+
+
+@clru_cache(maxsize=1024)
+def get_token_ids(code):
+    return intern_token_list(get_token_list(code))
+
+
+def lev_id_dist(ids_a, ids_b, limit=None):
+    """Levenshtein distance between two token id sequences, computed with the bit-parallel
+        algorithm of Myers and Hyyro, one bit per token of ids_a.
+        If limit is given, limit + 1 is returned as soon as the distance is known to exceed it.
+    """
+    len_a, len_b = len(ids_a), len(ids_b)
+    if limit is not None and abs(len_a - len_b) > limit:
+        return limit + 1
+    if len_a == 0:
+        return len_b
+
+    # A narrow band is cheaper than a pass over all bits of a long sequence
+    if limit is not None and (2 * limit + 1) * 32 < max(len_a, len_b):
+        return band_lev_id_dist(ids_a, ids_b, limit)
+
+    peq = {}
+    for i in range(len_a):
+        peq[ids_a[i]] = peq.get(ids_a[i], 0) | (1 << i)
+
+    mask = (1 << len_a) - 1
+    last_bit = 1 << (len_a - 1)
+    pv, mv = mask, 0
+    score = len_a
+
+    # The cell of the current column on the diagonal ending at the final cell.
+    # Distances never decrease along a diagonal, so it bounds the final distance.
+    diag_off = len_a - len_b
+    diag = diag_off
+    for j in range(len_b):
+        eq = peq.get(ids_b[j], 0)
+        xv = eq | mv
+        xh = (((eq & pv) + pv) ^ pv) | eq
+        ph = mv | ~(xh | pv)
+        mh = pv & xh
+        if ph & last_bit:
+            score += 1
+        elif mh & last_bit:
+            score -= 1
+
+        if limit is not None:
+            r = j + diag_off
+            if r == -1:
+                diag = j + 1
+            elif r >= 0:
+                diag += ((pv >> r) & 1) - ((mv >> r) & 1) + ((ph >> r) & 1) - ((mh >> r) & 1)
+            if diag > limit:
+                return limit + 1
+
+        ph = (ph << 1) | 1
+        mh = mh << 1
+        pv = (mh | ~(xv | ph)) & mask
+        mv = ph & xv & mask
+
+    if limit is not None and score > limit:
+        return limit + 1
+    return score
+
+
+def band_lev_id_dist(ids_a, ids_b, limit):
+    """Levenshtein distance between two token id sequences, computed by Ukkonen's algorithm
+        only on the band of 2 * limit + 1 diagonals around the main one.
+        limit + 1 is returned as soon as every cell of a row exceeds limit.
+    """
+    len_a, len_b = len(ids_a), len(ids_b)
+    big = limit + 1
+    if abs(len_a - len_b) > limit:
+        return big
+
+    prev = list(range(len_b + 1))
+    for j in range(limit + 1, len_b + 1):
+        prev[j] = big
+    cur = [big] * (len_b + 1)
+
+    for i in range(1, len_a + 1):
+        lo = max(1, i - limit)
+        hi = min(len_b, i + limit)
+        if lo == 1:
+            cur[0] = i
+            row_min = i
+        else:
+            cur[lo - 1] = big
+            row_min = big
+
+        id_a = ids_a[i - 1]
+        for j in range(lo, hi + 1):
+            d = prev[j - 1] if id_a == ids_b[j - 1] else prev[j - 1] + 1
+            if prev[j] + 1 < d:
+                d = prev[j] + 1
+            if cur[j - 1] + 1 < d:
+                d = cur[j - 1] + 1
+            cur[j] = d
+            if d < row_min:
+                row_min = d
+
+        if row_min > limit:
+            return big
+        if hi < len_b:
+            cur[hi + 1] = big
+        prev, cur = cur, prev
+    return min(prev[len_b], big)
+
+
 def lev_tl_dist(token_list_a, token_list_b):
-    size_x = len(token_list_a) + 1
-    size_y = len(token_list_b) + 1
-    matrix = numpy.zeros((size_x, size_y))
-    for x in range(size_x):
-        matrix [x, 0] = x
-    for y in range(size_y):
-        matrix [0, y] = y
-
-    for x in range(1, size_x):
-        for y in range(1, size_y):
-            if token_list_a[x-1].string == token_list_b[y-1].string:
-                matrix[x,y] = min(
-                    matrix[x-1, y] + 1,
-                    matrix[x-1, y-1],
-                    matrix[x, y-1] + 1
-                )
-            else:
-                matrix[x,y] = min(
-                    matrix[x-1,y] + 1,
-                    matrix[x-1,y-1] + 1,
-                    matrix[x,y-1] + 1
-                )
-    return matrix[size_x - 1, size_y - 1]
+    return lev_id_dist(intern_token_list(token_list_a), intern_token_list(token_list_b))
 
 
 def smt_lev_tl_dist(token_list_a, token_list_b, limit):
-    size_x = len(token_list_a) + 1
-    size_y = len(token_list_b) + 1
-    matrix = numpy.zeros((size_x, size_y))
-    for x in range(size_x):
-        matrix[x, 0] = x
-    for y in range(size_y):
-        matrix[0, y] = y
-
-    for x in range(1, size_x):
-        for y in range(1, size_y):
-            if token_list_a[x - 1].string == token_list_b[y - 1].string:
-                matrix[x, y] = min(
-                    matrix[x - 1, y] + 1,
-                    matrix[x - 1, y - 1],
-                    matrix[x, y - 1] + 1
-                )
-            else:
-                matrix[x, y] = min(
-                    matrix[x - 1, y] + 1,
-                    matrix[x - 1, y - 1] + 1,
-                    matrix[x, y - 1] + 1
-                )
-        if all(matrix[x, y] > limit for y in range(size_y)):
-            return limit + 1
-    return matrix[size_x - 1, size_y - 1]
+    return lev_id_dist(intern_token_list(token_list_a), intern_token_list(token_list_b), limit)
 
 
 def lev_code_distance(func_code_a, func_code_b):
-    token_list_a = get_token_list(func_code_a)
-    token_list_b = get_token_list(func_code_b)
-    return lev_tl_dist(token_list_a, token_list_b)
+    return lev_id_dist(get_token_ids(func_code_a), get_token_ids(func_code_b))
 
 
 def lev_multi_func_code_distance(code_a, code_b):
@@ -242,9 +303,7 @@ def lev_multi_func_code_distance(code_a, code_b):
 
 
 def smt_lev_multi_func_code_distance(code_a, code_b, limit):
-    token_list_a = get_token_list(code_a)
-    token_list_b = get_token_list(code_b)
-    return smt_lev_tl_dist(token_list_a, token_list_b, limit)
+    return lev_id_dist(get_token_ids(code_a), get_token_ids(code_b), limit)
 
 
 def apted_ast_visit(ast_node):
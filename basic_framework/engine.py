@@ -0,0 +1,37 @@
+# Developers:   Yang Hu, et al.
+# Email:    huyang0905@gmail.com
+
+from basic_framework.repair import BlockRepair
+
+
+class RepairEngine:
+    """Keeps everything repairs need resident, per question: the BlockRepair with its Tester,
+        whose test suite and global code are compiled, and the offline refactoring results.
+        Repairing a submission then only costs the repair itself.
+    """
+    def __init__(self, data_dir_path, is_mutation=False, pool_size=0, is_disk_cache=False):
+        self.__data_dir_path = data_dir_path
+        self.__is_mutation = is_mutation
+        self.__pool_size = pool_size
+        self.__is_disk_cache = is_disk_cache
+
+        # ques_name -> (BlockRepair, (cluster_index, temp_list, const_list, corr_code_list))
+        self.__ques_map = {}
+
+    def load_ques(self, ques_name, sr=100, exp_idx=0):
+        """Load a question, whose programs must have been refactored offline with sr and exp_idx"""
+        ques_dir_path = self.__data_dir_path + "/" + ques_name
+        br = BlockRepair(ques_dir_path, is_offline_ref=True, is_online_ref=False, is_mutation=self.__is_mutation,
+                         sr_list=[sr], exp_time=1, pool_size=self.__pool_size, is_disk_cache=self.__is_disk_cache)
+        self.__ques_map[ques_name] = (br, br.load_ofl_ref(sr, exp_idx))
+
+    def has_ques(self, ques_name):
+        return ques_name in self.__ques_map.keys()
+
+    def get_ques_name_list(self):
+        return list(self.__ques_map.keys())
+
+    def repair(self, ques_name, bug_code, timeout=60):
+        """Repair a single submission of a loaded question and return its code_perf_map"""
+        br, ofl_ref = self.__ques_map[ques_name]
+        return br.ofl_rep_code(bug_code, ofl_ref, timeout)
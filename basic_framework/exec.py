@@ -9,45 +9,117 @@ import psutil
 import threading
 import traceback
 import resource
+import marshal
+import contextvars
+import multiprocessing
 from io import StringIO
+from multiprocessing.connection import wait
 
 
-def run_program_to(code, front_code, end_code, entry_code, timeout):
-    from basic_framework.holes import Holes
+hole_hdr_code = "from basic_framework.holes import *\n"
 
-    thd = threading.Thread(target=run_core,
-                           args=(code, front_code, end_code, entry_code))
+hdr_var_dict = None
 
-    Holes.is_stop = False
-    Holes.real_output = ""
+# The buffer capturing the output of the program run in the current context
+out_buf_var = contextvars.ContextVar("out_buf", default=None)
+
+
+class OutputRouter:
+    """Stands for sys.stdout, so that programs run concurrently each capture their own output"""
+    def __init__(self, stdout):
+        self.stdout = stdout
+
+    def write(self, s):
+        out_buf = out_buf_var.get()
+        if out_buf is None:
+            return self.stdout.write(s)
+        return out_buf.write(s)
+
+    def flush(self):
+        if out_buf_var.get() is None:
+            self.stdout.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stdout, name)
+
+
+def compile_code(code):
+    """Compile code into a code object, None if it does not compile"""
+    try:
+        return compile(code, "<string>", "exec")
+    except Exception:
+        return None
+
+
+def compile_program(code, front_code_obj, end_code_obj):
+    """A compiled program is the tuple of code objects executed before the entry code"""
+    return front_code_obj, compile_code(code), end_code_obj
+
+
+def compile_entry(entry_code):
+    """Compile the entry code of a test case in eval mode to capture its value, unless it prints by itself"""
+    if "print(" in entry_code:
+        return compile_code(entry_code)
+    try:
+        return compile(entry_code.strip(), "<string>", "eval")
+    except Exception:
+        return None
+
+
+def new_var_dict():
+    """Return a fresh copy of the namespace holding the imports of hole_hdr_code"""
+    global hdr_var_dict
+
+    if hdr_var_dict is None:
+        hdr_var_dict = {}
+        exec(compile_code(hole_hdr_code), hdr_var_dict)
+    return dict(hdr_var_dict)
+
+
+def run_program_to(prog, tc, timeout):
+    """Run a compiled program on a test case in a thread and return whether it passes.
+        The thread shares the synthesis context of the caller.
+    """
+    from basic_framework.holes import get_syn_ctx
+
+    syn_ctx = get_syn_ctx()
+    thd = threading.Thread(target=contextvars.copy_context().run,
+                           args=(run_core, prog, tc))
+
+    syn_ctx.is_stop = False
+    syn_ctx.real_output = ""
+    syn_ctx.is_tc_pass = False
     thd.start()
     thd.join(timeout=timeout)
-    Holes.is_stop = True
+    syn_ctx.is_stop = True
     while thd.is_alive():
         time.sleep(0.2)
-    Holes.is_stop = False
-    return Holes.real_output
+    syn_ctx.is_stop = False
+    return syn_ctx.is_tc_pass
 
 
-def run_core(code, front_code, end_code, entry_code):
+def run_core(prog, tc):
     from basic_framework.f1x import DepthTrace
-    from basic_framework.holes import Holes
+    from basic_framework.holes import Holes, get_syn_ctx
 
-    backup_stdout = sys.stdout
-    sys.stdout = StringIO()
+    if not isinstance(sys.stdout, OutputRouter):
+        sys.stdout = OutputRouter(sys.stdout)
+    router = sys.stdout
+    out_buf = StringIO()
+    token = out_buf_var.set(out_buf)
 
-    hole_hdr_code = "from basic_framework.holes import *\n"
+    is_tc_pass = None
+    try:
+        if tc.entry_code_obj is None or any(code_obj is None for code_obj in prog):
+            raise SyntaxError()
 
-    if "print(" not in entry_code:
-        entry_code = "print(" + entry_code.strip() + ")\n"
+        var_dict = new_var_dict()
+        for code_obj in prog:
+            exec(code_obj, var_dict)
+        real_value = eval(tc.entry_code_obj, var_dict)
 
-    final_code = hole_hdr_code + "\n\n" + \
-                 front_code + "\n\n" + \
-                 code + "\n\n" + \
-                 end_code + "\n\n" + \
-                 entry_code
-    try:
-        exec(final_code, globals())
+        # Compared here, as formatting the value may run the program's code
+        is_tc_pass = tc.is_pass(real_value, out_buf.getvalue())
     except DepthTrace.MaxDepthException:
         print("Reach max depth.", file=sys.stderr)
     except Holes.NoCandidateException:
@@ -55,13 +127,184 @@ def run_core(code, front_code, end_code, entry_code):
     except Exception as e:
         pass
 
-    real_output = sys.stdout.getvalue()
+    real_output = out_buf.getvalue()
+
+    out_buf_var.reset(token)
+    if sys.stdout is not router:
+        sys.stdout = router
+
+    if is_tc_pass is None:
+        # The entry code did not return, only what was printed so far counts
+        is_tc_pass = tc.is_output_pass(real_output)
+
+    syn_ctx = get_syn_ctx()
+    syn_ctx.real_output = real_output
+    syn_ctx.is_tc_pass = is_tc_pass
+
+
+def exec_worker(conn, tc_map):
+    """Loop of a pre-forked worker: run each received program and send back whether it passes.
+        tc_map is inherited from the parent when the worker is forked.
+    """
+    from basic_framework.holes import get_syn_ctx
+
+    syn_ctx = get_syn_ctx()
+    prog_bytes, prog = None, None
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:
+            break
+        if job is None:
+            break
+
+        # The same program is usually sent for all test cases, only unmarshal it once
+        if job[0] != prog_bytes:
+            prog_bytes = job[0]
+            prog = marshal.loads(prog_bytes)
+        tc = tc_map[job[1]]
+
+        syn_ctx.reset()
+        syn_ctx.is_stop = False
+        run_core(prog, tc)
+        conn.send(syn_ctx.is_tc_pass)
+    conn.close()
+
+
+class ExecPool:
+    """A pool of pre-forked processes running test cases, killed on timeout.
+        A process forked with the pool, e.g. one of jobs repairing programs in parallel,
+        starts its own workers, pool_size // jobs of them.
+    """
+    def __init__(self, pool_size, tc_map, jobs=1):
+        if pool_size is None:
+            pool_size = os.cpu_count()
+        assert (pool_size > 0)
+
+        self.__pool_size = pool_size
+        self.__fork_pool_size = max(1, pool_size // jobs)
+        self.__tc_map = tc_map
+        self.__mp_ctx = multiprocessing.get_context("fork")
+        self.__pid = None
+        self.__worker_list = []
+        self.__start()
+
+    def __start(self):
+        # Make sure that the workers are forked with basic_framework.holes imported
+        import basic_framework.holes
+
+        if self.__pid is not None:
+            # The workers of the parent process are not ours to stop, only close our copies of their pipes
+            for _, conn in self.__worker_list:
+                conn.close()
+            self.__pool_size = self.__fork_pool_size
+
+        self.__pid = os.getpid()
+        self.__worker_list = [self.__spawn() for _ in range(self.__pool_size)]
+
+    def __spawn(self):
+        parent_conn, child_conn = self.__mp_ctx.Pipe()
+        p = self.__mp_ctx.Process(target=exec_worker, args=(child_conn, self.__tc_map), daemon=True)
+        p.start()
+        child_conn.close()
+        return p, parent_conn
+
+    def __respawn(self, w_idx):
+        p, conn = self.__worker_list[w_idx]
+        if p.is_alive():
+            p.kill()
+        p.join()
+        conn.close()
+        self.__worker_list[w_idx] = self.__spawn()
+
+    def get_pool_size(self):
+        return self.__pool_size
+
+    def run_program_to(self, prog, tc_id, timeout):
+        return self.run_program_list(prog, [tc_id], timeout)[0]
+
+    def run_program_list(self, prog, tc_id_list, timeout, stop_func=None):
+        """Run the compiled program on each test case and return whether it passes, in order.
+            Once stop_func(j_idx, is_tc_pass) returns True, no further test case is dispatched,
+            the workers still running one are respawned, and the results of the test cases left are None.
+        """
+        if os.getpid() != self.__pid:
+            # The pool was inherited by a forked process, whose pipes are not ours
+            self.__start()
+
+        # Code objects cannot be pickled, ship them marshalled
+        prog_bytes = marshal.dumps(prog)
+        job_list = [(prog_bytes, tc_id) for tc_id in tc_id_list]
+
+        tr_list = [None for _ in range(len(job_list))]
+        pending_list = list(range(len(job_list)))
+        pending_list.reverse()
+        idle_list = list(range(self.__pool_size))
+        busy_map = {}
+
+        while len(pending_list) > 0 or len(busy_map) > 0:
+            while len(pending_list) > 0 and len(idle_list) > 0:
+                w_idx = idle_list.pop()
+                j_idx = pending_list.pop()
+                try:
+                    self.__worker_list[w_idx][1].send(job_list[j_idx])
+                except (BrokenPipeError, OSError):
+                    self.__respawn(w_idx)
+                    self.__worker_list[w_idx][1].send(job_list[j_idx])
+                busy_map[w_idx] = (j_idx, time.monotonic() + timeout)
+
+            min_deadline = min(deadline for _, deadline in busy_map.values())
+            conn_map = {self.__worker_list[w_idx][1]: w_idx for w_idx in busy_map.keys()}
+            ready_list = wait(list(conn_map.keys()), timeout=max(0, min_deadline - time.monotonic()))
+
+            done_list = []
+            for conn in ready_list:
+                w_idx = conn_map[conn]
+                j_idx, _ = busy_map.pop(w_idx)
+                is_tc_pass = False
+                try:
+                    is_tc_pass = conn.recv()
+                except EOFError:
+                    # The worker died, e.g. the program called exit()
+                    self.__respawn(w_idx)
+                done_list.append((j_idx, is_tc_pass))
+                idle_list.append(w_idx)
+
+            curr_time = time.monotonic()
+            for w_idx, (j_idx, deadline) in list(busy_map.items()):
+                if deadline <= curr_time:
+                    # Hard kill the runaway program
+                    del busy_map[w_idx]
+                    self.__respawn(w_idx)
+                    done_list.append((j_idx, False))
+                    idle_list.append(w_idx)
 
-    if sys.stdout != backup_stdout:
-        sys.stdout.close()
-        sys.stdout = backup_stdout
+            for j_idx, is_tc_pass in done_list:
+                tr_list[j_idx] = is_tc_pass
+                if stop_func is not None and stop_func(j_idx, is_tc_pass):
+                    pending_list = []
+                    # Nor wait for the test cases in flight until their deadline
+                    for w_idx in list(busy_map.keys()):
+                        del busy_map[w_idx]
+                        self.__respawn(w_idx)
+                        idle_list.append(w_idx)
+        return tr_list
 
-    Holes.real_output = real_output
+    def close(self):
+        if os.getpid() != self.__pid:
+            return
+        for p, conn in self.__worker_list:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+        for p, conn in self.__worker_list:
+            p.join(timeout=1)
+            if p.is_alive():
+                p.kill()
+                p.join()
+            conn.close()
+        self.__worker_list = []
 
 
 def fast_eval(expr, var_dict):
@@ -146,13 +146,13 @@ class ExprGenerator:
         return FuncVisitor().run(expr)
 
     def gen_expr_list_from_templates(self, var_dict):
-        from basic_framework.holes import Holes
+        from basic_framework.holes import get_syn_ctx
 
         expr_list = []
         type_dict = {}
 
         vari_nam_list = list(var_dict.keys())
-        for vari_num, template_str in Holes.template_list:
+        for vari_num, template_str in get_syn_ctx().template_list:
             vari_tuple_list = list(combinations(vari_nam_list, vari_num))
 
             for vari_tuple in vari_tuple_list:
@@ -228,8 +228,8 @@ class ExprGenerator:
             expr_list.append(expr)
 
         # Misuse based expression
-        from basic_framework.holes import Holes
-        for constant in Holes.constant_list:
+        from basic_framework.holes import get_syn_ctx
+        for constant in get_syn_ctx().constant_list:
             for i in range(len(token_list)):
                 token = token_list[i]
                 if tok_name[token.exact_type] in ["NUMBER", "STRING"]:
@@ -260,8 +260,8 @@ class ExprGenerator:
                     cond = pre_cond_str[:t_start] + op + pre_cond_str[t_end:]
                     cond_set.add(cond)
 
-        from basic_framework.holes import Holes
-        for constant in Holes.constant_list:
+        from basic_framework.holes import get_syn_ctx
+        for constant in get_syn_ctx().constant_list:
             for i in range(len(token_list)):
                 token = token_list[i]
                 if tok_name[token.exact_type] in ["NUMBER", "STRING"]:
@@ -369,7 +369,7 @@ class TERelation:
             score = score_list[i]
             var_dict = copy.deepcopy(bk_var_dict)
             self.add_expr(expr, score, var_dict)
-            bfh.Holes.mg.memory_guarder()
+            bfh.get_syn_ctx().mg.memory_guarder()
 
     def add_expr(self, expr, score, var_dict):
         try:
@@ -543,6 +543,7 @@ class ExprGroup:
                 else:
                     self.expr_dict[times_list[j + 1]][1] += 1
                     import basic_framework.holes as bfh
-                    if times_list[j] in bfh.Holes.curr_eg.expr_dict.keys():
-                        del bfh.Holes.curr_eg.expr_dict[times_list[j]]
+                    curr_eg = bfh.get_syn_ctx().curr_eg
+                    if times_list[j] in curr_eg.expr_dict.keys():
+                        del curr_eg.expr_dict[times_list[j]]
         return True
\ No newline at end of file
@@ -11,6 +11,7 @@ import pickle
 from tokenize import tokenize
 import time
 import keyword
+import contextvars
 from token import *
 from builtins import open as _builtin_open
 from basic_framework.f1x import SearchSpaceList, ExprGroup, ExprGenerator, SearchSpace, DepthTrace, TERelation
@@ -18,61 +19,58 @@ from basic_framework.utils import FastEvaluator, get_token_list
 from basic_framework.exec import MemoryGuarder, fast_eval
 
 
-class Holes:
-    token_list_map = {}
-
-    expr_cache = {}
-
-    is_stop = False
-
-    template_list = []
-
-    constant_list = []
-
-    vari_hist = {}
-
-    hist_stop = False
-
-    mg = MemoryGuarder()
-
-    expr_gen = ExprGenerator()
-
-    ssl = SearchSpaceList() # search space list
+class SynthesisContext:
+    """The state of the holes run by a program under test, one per synthesis.
+        Holes reach it through syn_ctx_var, so that threads and asyncio tasks can synthesize concurrently.
+    """
+    def __init__(self):
+        self.is_stop = False
+        self.template_list = []
+        self.constant_list = []
+        self.reset()
+
+    def reset(self):
+        """Reset everything but the templates, constants and stop flag"""
+        self.vari_hist = {}
+        self.mg = MemoryGuarder()
+        self.ssl = SearchSpaceList()  # search space list
+        self.curr_ss = SearchSpace()
+        self.curr_eg = ExprGroup()
+        self.expr_gen = ExprGenerator()
+        self.dt = DepthTrace()
+        self.ldt_dict = {} # restrict the loop number
+        self.comp_dict = {}
+        self.curr_tc_id = 0
+        self.hist_stop = False
+        self.expr_cache = {}
+        self.token_list_map = {}
+        self.in_genhole_time = 0
+        self.real_output = ""
+        self.is_tc_pass = False
+
+
+syn_ctx_var = contextvars.ContextVar("syn_ctx")
+
+
+def get_syn_ctx():
+    """Return the synthesis context of the current thread or task, a new one if it has none"""
+    try:
+        return syn_ctx_var.get()
+    except LookupError:
+        syn_ctx = SynthesisContext()
+        syn_ctx_var.set(syn_ctx)
+        return syn_ctx
+
+
+def set_syn_ctx(syn_ctx):
+    """Make syn_ctx the synthesis context of the current thread or task.
+        Threads started with a copy of the context and tasks share the context of their creator,
+        so each synthesis sets its own before it starts, as BlockRepair.rep_bug_code does.
+    """
+    syn_ctx_var.set(syn_ctx)
 
-    curr_ss = SearchSpace()
-
-    curr_eg = ExprGroup()
-
-    dt = DepthTrace()
-
-    ldt_dict = {} # restrict the loop number
-
-    comp_dict = {}
-
-    curr_tc_id = 0
-
-    in_genhole_time = 0
-
-    real_output = ""
-
-    @classmethod
-    def init_global_vars(cls):
-        cls.vari_hist = {}
-        cls.mg = MemoryGuarder()
-        cls.ssl = SearchSpaceList()  # search space list
-        cls.curr_ss = SearchSpace()
-        cls.curr_eg = ExprGroup()
-        cls.expr_gen = ExprGenerator()
-        cls.dt = DepthTrace()
-        cls.ldt_dict = {}
-        cls.comp_dict = {}
-        cls.curr_tc_id = 0
-        cls.hist_stop = False
-        cls.expr_cache = {}
-        cls.token_list_map = {}
-        cls.in_genhole_time = 0
-        cls.real_output = ""
 
+class Holes:
     @classmethod
     def expr_wrapper(cls, expr_str, var_dict):
         token_list = get_token_list(expr_str)
@@ -106,7 +104,8 @@ class Holes:
 
     @classmethod
     def generic_hole(cls, ln, pre_expr_str, var_dict, ssf):
-        if cls.is_stop:
+        syn_ctx = get_syn_ctx()
+        if syn_ctx.is_stop:
             raise cls.StopException()
 
         start_time = time.process_time()
@@ -116,35 +115,35 @@ class Holes:
 
         # Wrap pre_expr_str and get the time of execution
         pre_expr_str = cls.expr_wrapper(pre_expr_str, var_dict)
-        times = cls.dt.get_times()
+        times = syn_ctx.dt.get_times()
 
         # Test-equivalent analysis
-        if not cls.curr_eg.lt_exists(times, ln):
+        if not syn_ctx.curr_eg.lt_exists(times, ln):
             expr_list = []
             score_list = []
 
-            times_list = list(cls.curr_eg.expr_dict.keys())
+            times_list = list(syn_ctx.curr_eg.expr_dict.keys())
             times_list.sort()
             for times_a in times_list:
                 if times_a > times and \
-                        ln == cls.curr_eg.expr_dict[times_a][2]:
+                        ln == syn_ctx.curr_eg.expr_dict[times_a][2]:
 
-                    expr_rec = cls.curr_eg.get_expr_rec(times_a, ln)
+                    expr_rec = syn_ctx.curr_eg.get_expr_rec(times_a, ln)
                     expr_list = expr_rec.repr_expr_list
                     score_list = expr_rec.repr_score_list
                     break
             if len(expr_list) == 0:
-                if cls.curr_ss.ln_exists(ln):
-                    expr_list = cls.curr_ss.get_expr_list(ln)
-                    score_list = cls.curr_ss.get_score_list(ln)
+                if syn_ctx.curr_ss.ln_exists(ln):
+                    expr_list = syn_ctx.curr_ss.get_expr_list(ln)
+                    score_list = syn_ctx.curr_ss.get_score_list(ln)
                 else:
 
                     if ssf == "cond":
-                        expr_list, score_list = cls.expr_gen.gen_cond_ss(pre_expr_str, var_dict, k_best = 50)
+                        expr_list, score_list = syn_ctx.expr_gen.gen_cond_ss(pre_expr_str, var_dict, k_best = 50)
                     elif ssf == "assign":
-                        expr_list, score_list = cls.expr_gen.gen_assign_ss(pre_expr_str, var_dict, k_best = 10)
+                        expr_list, score_list = syn_ctx.expr_gen.gen_assign_ss(pre_expr_str, var_dict, k_best = 10)
                     elif ssf == "simple_assign":
-                        expr_list, score_list = cls.expr_gen.gen_assign_ss(pre_expr_str, var_dict, k_best=5, is_simple=True)
+                        expr_list, score_list = syn_ctx.expr_gen.gen_assign_ss(pre_expr_str, var_dict, k_best=5, is_simple=True)
                     elif ssf == "init":
                         expr_list, score_list = cls.expr_gen_init_ss(var_dict)
                     else:
@@ -156,17 +155,17 @@ class Holes:
             expr_rec_list = ter.get_expr_rec_list()
 
             if len(expr_rec_list) > 0:
-                cls.curr_eg.add_expr_rec_list(times, ln, expr_rec_list)
+                syn_ctx.curr_eg.add_expr_rec_list(times, ln, expr_rec_list)
             else:
                 raise cls.NoCandidateException()
 
         # Select one expr and run
-        selected_expr = cls.curr_eg.get_expr_rec(times, ln).expr
+        selected_expr = syn_ctx.curr_eg.get_expr_rec(times, ln).expr
 
         res = fast_eval(selected_expr, var_dict)
-        cls.dt.update_times()
+        syn_ctx.dt.update_times()
 
-        cls.in_genhole_time += (time.process_time() - start_time)
+        syn_ctx.in_genhole_time += (time.process_time() - start_time)
         return res
 
 
@@ -211,14 +210,15 @@ class Holes:
         """This hole is used to sense large or infinite loop
             "iil" means "immune to infinite loop"
         """
-        if ln not in cls.ldt_dict.keys():
-            cls.ldt_dict[ln] = DepthTrace()
-            cls.ldt_dict[ln].set_max_depth()
-        cls.ldt_dict[ln].update_times()
+        syn_ctx = get_syn_ctx()
+        if ln not in syn_ctx.ldt_dict.keys():
+            syn_ctx.ldt_dict[ln] = DepthTrace()
+            syn_ctx.ldt_dict[ln].set_max_depth()
+        syn_ctx.ldt_dict[ln].update_times()
 
-        if cls.is_stop:
+        if syn_ctx.is_stop:
             raise cls.StopException()
-        if cls.hist_stop:
+        if syn_ctx.hist_stop:
             raise cls.HistTLEException()
 
     class StopException(Exception):
@@ -246,18 +246,19 @@ class Holes:
 
     @classmethod
     def vari_hist_hole(cls, var_dict):
-        if cls.is_stop:
+        syn_ctx = get_syn_ctx()
+        if syn_ctx.is_stop:
             raise cls.StopException()
 
-        if cls.hist_stop:
+        if syn_ctx.hist_stop:
             raise cls.HistTLEException()
 
         for k, v in var_dict.items():
-            if k not in cls.vari_hist.keys():
-                cls.vari_hist[k] = []
-            if len(cls.vari_hist[k]) == 0 or \
-                    not cls.is_object_equal(cls.vari_hist[k][-1], v):
-                cls.vari_hist[k].append(v)
+            if k not in syn_ctx.vari_hist.keys():
+                syn_ctx.vari_hist[k] = []
+            if len(syn_ctx.vari_hist[k]) == 0 or \
+                    not cls.is_object_equal(syn_ctx.vari_hist[k][-1], v):
+                syn_ctx.vari_hist[k].append(v)
 
         for k1, v1 in var_dict.items():
             for k2, v2 in var_dict.items():
@@ -270,10 +271,10 @@ class Holes:
                     except:
                         comb_v = None
                     if comb_v is not None:
-                        if expr_str not in cls.vari_hist.keys():
-                            cls.vari_hist[expr_str] = []
-                        if len(cls.vari_hist[expr_str]) == 0 or not cls.is_object_equal(cls.vari_hist[expr_str][-1], comb_v):
-                            cls.vari_hist[expr_str].append(comb_v)
+                        if expr_str not in syn_ctx.vari_hist.keys():
+                            syn_ctx.vari_hist[expr_str] = []
+                        if len(syn_ctx.vari_hist[expr_str]) == 0 or not cls.is_object_equal(syn_ctx.vari_hist[expr_str][-1], comb_v):
+                            syn_ctx.vari_hist[expr_str].append(comb_v)
 
 
     class HistTLEException(Exception):
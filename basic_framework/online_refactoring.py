@@ -0,0 +1,275 @@
+# Developers:   Yang Hu, et al.
+# Email:    huyang0905@gmail.com
+
+import heapq
+from collections import OrderedDict
+from fastcache import clru_cache
+from basic_framework.cfs import get_cfs_map, get_func_map
+from basic_framework.distance import multi_func_stru_dist_list, get_stru_str_map, lev_multi_func_code_distance, \
+    smt_lev_multi_func_code_distance
+from basic_framework.refactoring import get_del_func_name_list
+from basic_framework.refactoring_ast import astRefactor
+
+
+class RefactoredCode:
+    def __init__(self, corr_code, fname, rname):
+        self.corr_code = corr_code
+        self.fname = fname # Original correct code file name
+        self.rname = rname # Set of rules applied
+
+    def get_depth(self):
+        """The number of rules applied"""
+        if self.rname == "":
+            return 0
+        return len(self.rname.split(","))
+
+    def __lt__(self, other):
+        return len(self.rname.split(",")) < len(other.rname.split(","))
+
+    def __eq__(self, other):
+        return len(self.rname.split(",")) == len(other.rname.split(","))
+
+
+class HeapUnit:
+    def __init__(self, rc, bd, stru_key, idx):
+        self.rc = rc
+        self.bd = bd # structure distance to the buggy code, the heuristic
+        self.w = rc.get_depth() + bd # plus the path cost
+        self.stru_key = stru_key
+        self.idx = idx # order of generation, to break ties
+
+    def __lt__(self, other):
+        return (self.w, self.bd, self.idx) < (other.w, other.bd, other.idx)
+
+    def __eq__(self, other):
+        return (self.w, self.bd, self.idx) == (other.w, other.bd, other.idx)
+
+
+def get_cfs_stru_key(cfs_map):
+    """Hashable structure of the functions of cfs_map, with their indentation"""
+    return tuple(sorted((func_name, tuple(stru_list), tuple(indent_list))
+                        for func_name, (_, stru_list, indent_list) in cfs_map.items()))
+
+
+def get_corr_func_list_map(corr_code_map):
+    corr_func_list_map = {}
+    for file_name, corr_code in corr_code_map.items():
+        func_code_map = get_func_map(corr_code)
+
+        for func_name in func_code_map.keys():
+            func_code = func_code_map[func_name]
+            if func_name not in corr_func_list_map.keys():
+                corr_func_list_map[func_name] = []
+            corr_func_list_map[func_name].append((file_name, func_code))
+
+    for func_name in get_del_func_name_list({func_name: len(corr_func_list)
+                                             for func_name, corr_func_list in corr_func_list_map.items()}):
+        del corr_func_list_map[func_name]
+
+    return corr_func_list_map
+
+
+class OnlineRefactoring:
+    """Online refactoring of the correct programs towards the structure of a buggy program,
+        by a best-first search over the rules of astRefactor.
+        The codes refactored by the searches are kept as a graph shared by all the buggy programs
+        of a question: a code is only refactored once, and a buggy function whose structure was
+        already reached from the selected correct programs is looked up instead of searched.
+        Forked processes only share the part of the graph built before they were forked.
+        Only the max_size most recently used codes and structures are kept, so that a server
+        repairing submissions for long does not keep growing.
+    """
+    def __init__(self, rft_cache=None, max_size=8192):
+        # TransitionCache of the rules, if any
+        self.__rft_cache = rft_cache
+        self.__max_size = max_size
+
+        # code -> (structure key, compressed structure of each function)
+        self.__get_node = clru_cache(maxsize=max_size)(self.__new_node)
+
+        # code -> [(rule id, refactored code)], the refactored codes kept by the search
+        self.__get_succ_list = clru_cache(maxsize=max_size)(self.__new_succ_list)
+
+        # structure key -> {(correct file name, code): RefactoredCode}, the codes reached so far,
+        # in the order of use
+        self.__stru_rc_map = OrderedDict()
+
+    def __new_node(self, code):
+        cfs_map = get_cfs_map(code)
+        return get_cfs_stru_key(cfs_map), get_stru_str_map(cfs_map)
+
+    def __new_succ_list(self, code):
+        succ_list = []
+        rule_appls = astRefactor.getRuleAppls(code, self.__rft_cache)
+        for rname in rule_appls:
+            for refactoredCode in rule_appls[rname]:
+                if "    def " in refactoredCode:
+                    continue
+                elif "\nif " in refactoredCode:
+                    continue
+                succ_list.append((rname, refactoredCode))
+        return succ_list
+
+    def __add_rc(self, stru_key, rc):
+        self.__stru_rc_map.setdefault(stru_key, {}).setdefault((rc.fname, rc.corr_code), rc)
+        self.__stru_rc_map.move_to_end(stru_key)
+        while len(self.__stru_rc_map) > self.__max_size:
+            self.__stru_rc_map.popitem(last=False)
+
+    def __lookup(self, stru_key, fname_corrFuncCode):
+        """Return the codes of structure stru_key reached so far from the correct codes
+            of fname_corrFuncCode
+        """
+        if stru_key not in self.__stru_rc_map.keys():
+            return []
+        self.__stru_rc_map.move_to_end(stru_key)
+        return [rc for (fname, _), rc in self.__stru_rc_map[stru_key].items()
+                if fname in fname_corrFuncCode.keys()]
+
+    # single function astar refactoring
+    def astar_ol_rfty_func(self, bug_func_code, fname_corrFuncCode, max_step=100, is_lookup=True):
+        """Return the refactored codes with the least structure distance to bug_func_code,
+            and the number of codes expanded, at most max_step.
+            Codes are expanded by the number of rules applied plus their structure distance, and
+            a structure is only expanded once. If the structure of bug_func_code was reached before
+            from the correct codes, those codes are returned without searching, unless is_lookup is not set.
+        """
+        h = []
+        rc_list = []
+
+        bug_stru_key, bug_stru_str_map = self.__get_node(bug_func_code)
+
+        # build min binary heap
+        best_d, best_rc_list = None, []
+        seen_code_set = set()
+        unit_list = []
+        for fname, corrCode in fname_corrFuncCode.items():
+            rc = RefactoredCode(corrCode, fname, "")
+            stru_key, _ = self.__get_node(corrCode)
+            self.__add_rc(stru_key, rc)
+            if stru_key == bug_stru_key:
+                rc_list.append(rc)
+            else:
+                unit_list.append((rc, stru_key, len(seen_code_set)))
+                seen_code_set.add(corrCode)
+
+        if len(rc_list) > 0:
+            return rc_list, 0
+
+        # the structure was reached by an earlier search
+        if is_lookup:
+            rc_list = self.__lookup(bug_stru_key, fname_corrFuncCode)
+            if len(rc_list) > 0:
+                return rc_list, 0
+
+        d_list = multi_func_stru_dist_list(bug_stru_str_map,
+                                           [self.__get_node(rc.corr_code)[1] for rc, _, _ in unit_list])
+        for (rc, stru_key, idx), d in zip(unit_list, d_list):
+            heapq.heappush(h, HeapUnit(rc, d, stru_key, idx))
+
+            if best_d is None or d < best_d:
+                best_d, best_rc_list = d, []
+            if d == best_d:
+                best_rc_list.append(rc)
+
+        # heuristic-guided search (astar alg.)
+        step = 0
+        closed_stru_set = set()
+        while len(h) > 0 and step < max_step and best_d > 0:
+            hu = heapq.heappop(h)
+            if hu.stru_key in closed_stru_set:
+                continue
+            closed_stru_set.add(hu.stru_key)
+
+            unit_list = []
+            for rname, refactoredCode in self.__get_succ_list(hu.rc.corr_code):
+                if refactoredCode in seen_code_set:
+                    continue
+
+                stru_key, _ = self.__get_node(refactoredCode)
+                if stru_key in closed_stru_set:
+                    continue
+
+                n_rname = hu.rc.rname
+                if n_rname == "":
+                    n_rname = rname
+                else:
+                    n_rname += "," + rname
+
+                n_rc = RefactoredCode(refactoredCode, hu.rc.fname, n_rname)
+                self.__add_rc(stru_key, n_rc)
+                unit_list.append((n_rc, stru_key, len(seen_code_set)))
+                seen_code_set.add(refactoredCode)
+
+            # the distances of the refactored codes are computed together
+            d_list = multi_func_stru_dist_list(bug_stru_str_map,
+                                               [self.__get_node(n_rc.corr_code)[1] for n_rc, _, _ in unit_list])
+            for (n_rc, stru_key, idx), n_d in zip(unit_list, d_list):
+                heapq.heappush(h, HeapUnit(n_rc, n_d, stru_key, idx))
+
+                if n_d < best_d:
+                    best_d, best_rc_list = n_d, []
+                if n_d == best_d:
+                    best_rc_list.append(n_rc)
+            step += 1
+
+        # code candidates
+        assert (len(best_rc_list) > 0)
+        return best_rc_list, step
+
+    def astar_ol_rfty(self, bug_code, fname_corrCode, max_step=100):
+        """Refactor towards each function of bug_code, expanding at most max_step codes per function
+            on average. The steps a function does not use are shared by the functions after it.
+            A max_step of 0 disables online refactoring, including the lookup of structures reached
+            before, which a function whose share of the steps is used up still does.
+        """
+        # extract func definition from bug code
+        bug_func_map = get_func_map(bug_code)
+        corr_func_list_map = get_corr_func_list_map(fname_corrCode)
+
+        step_left = max_step * len(bug_func_map)
+
+        rc_list_map = {}
+        for i, (func_name, bug_func_code) in enumerate(bug_func_map.items()):
+            corr_func_code_map = dict(corr_func_list_map[func_name])
+            rc_list, step = self.astar_ol_rfty_func(bug_func_code, corr_func_code_map,
+                                                    step_left // (len(bug_func_map) - i), max_step > 0)
+            rc_list_map[func_name] = rc_list
+            step_left -= step
+
+        return rc_list_map
+
+    def astar_get_cls_rc(self, bug_code, rc_list_map):
+        bug_func_map = get_func_map(bug_code)
+
+        code_map = {}
+        file_map = {}
+        rule_map = {}
+        for func_name, bug_func_code in bug_func_map.items():
+            func_rc_list = rc_list_map[func_name]
+            best_func_rc = self.astar_get_cls_func_rc(bug_func_code, func_rc_list)
+
+            code_map[func_name] = best_func_rc.corr_code
+            file_map[func_name] = best_func_rc.fname
+            rule_map[func_name] = best_func_rc.rname
+
+        final_corr_code = "\n\n".join(code_map.values())
+        final_fname = str(file_map)
+        final_rule = str(rule_map)
+        best_rc = RefactoredCode(final_corr_code, final_fname, final_rule)
+
+        return best_rc
+
+    def astar_get_cls_func_rc(self, bug_func_code, rc_list):
+        # choose best one based on ted
+        min_ted, best_rc = None, None
+        for rc in rc_list:
+            if min_ted is None:
+                min_ted = lev_multi_func_code_distance(bug_func_code, rc.corr_code)
+                best_rc = rc
+            else:
+                ted = smt_lev_multi_func_code_distance(bug_func_code, rc.corr_code, min_ted)
+                if ted < min_ted:
+                    min_ted = ted
+                    best_rc = rc
+        return best_rc
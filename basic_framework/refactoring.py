@@ -1,10 +1,14 @@
 # Developers:   Yang Hu, et al.
 # Email:    huyang0905@gmail.com
 
+import os
 import csv
 import time
+import pickle
+import multiprocessing
 from basic_framework.statement import get_token_list
 from basic_framework.cfs import get_cfs_map, get_func_cfs, get_func_map
+from basic_framework.cache import get_hash
 
 
 class Reporter:
@@ -63,8 +67,257 @@ class Reporter:
             print("Mathing Rate: %.4f," % mr, "# Structures: " + str(stru_cnt), end='\r')
 
 
+def normalize_code(code):
+    """Drop trailing spaces and blank lines, which refactoring rules may leave behind"""
+    return "\n".join(line.rstrip() for line in code.split("\n") if len(line.strip()) > 0)
+
+
+def get_code_features(code):
+    """Count the structures of code, its depth of nested structures and whether it has jump statements"""
+    feature_map = {"if": 0, "elif": 0, "else": 0, "for": 0, "while": 0, "depth": 0}
+
+    for bb_list, stru_list, indent_list in get_cfs_map(code).values():
+        for stru in ["if", "elif", "else", "for", "while"]:
+            feature_map[stru] += stru_list.count(stru)
+
+        # nested functions are counted as nested structures
+        if "sig" in stru_list:
+            feature_map["depth"] = max(feature_map["depth"], (max(indent_list) - min(indent_list)) // 4 - 1)
+    feature_map["loop"] = feature_map["for"] + feature_map["while"]
+
+    # Also found in names, strings and comments, which only keeps more rules
+    feature_map["return"] = int("return" in code)
+    feature_map["jump"] = int(feature_map["return"] or "break" in code or "continue" in code)
+    return feature_map
+
+
+# rule id -> the least counts of the features of the codes it can refactor,
+# rules that are not implemented are left out
+rule_feature_map = {
+    2: {"if": 1, "jump": 1},
+    3: {"if": 1, "return": 1},
+    4: {},
+    5: {},
+    6: {"if": 1},
+    7: {"if": 2, "depth": 2},
+    8: {"elif": 1},
+    9: {"else": 1, "if": 1, "depth": 2},
+    11: {"loop": 1},
+    12: {"while": 1},
+    13: {"if": 1},
+    17: {},
+    21: {"else": 1}
+}
+
+
+def is_rule_applicable(rule_id, feature_map):
+    if rule_id not in rule_feature_map.keys():
+        return False
+    return all(feature_map[feature] >= cnt for feature, cnt in rule_feature_map[rule_id].items())
+
+
+def get_del_func_name_list(func_cnt_map):
+    """Functions defined by more than 5 fewer programs than the most defined function are not refactored"""
+    if len(func_cnt_map) == 0:
+        return []
+
+    max_len = max(func_cnt_map.values())
+    return [func_name for func_name, cnt in func_cnt_map.items() if max_len - cnt > 5]
+
+
+def get_rules_hash():
+    """Hash of the sources of the refactoring rules, offline and online, which the cached
+        transitions of TransitionCache depend on
+    """
+    dir_path = os.path.dirname(os.path.abspath(__file__))
+    src_list = []
+    for file_path in [dir_path + "/refactoring.py"] + \
+                     [dir_path + "/refactoring_ast/" + file_name
+                      for file_name in ["astRefactor.py", "rule.py", "ruleMatcher.py", "ruleAction.py"]]:
+        with open(file_path, "r") as f:
+            src_list.append(f.read())
+    return get_hash("\n".join(src_list))
+
+
+def get_transition_db_path(ques_dir_path, is_disk_cache):
+    """Path of the SQLite file of the TransitionCache of a question, None if not cached on disk"""
+    if not is_disk_cache:
+        return None
+
+    refactor_dir_path = ques_dir_path + "/code/refactor"
+    if not os.path.isdir(refactor_dir_path):
+        os.makedirs(refactor_dir_path)
+    return refactor_dir_path + "/transition.sqlite"
+
+
+# The Refactoring whose rules are applied by the refactoring workers, inherited when they are forked
+curr_rft = None
+
+
+def rft_worker(code):
+    """Apply rules 1..21 to code, return the refactored codes of each rule and the time it took.
+        An exception is returned in place of the codes, to be raised when the results of the codes
+        before it have been merged, as without workers.
+    """
+    start_time = time.process_time()
+    try:
+        rft_code_lists = curr_rft.refactor_all(code)
+    except Exception as e:
+        rft_code_lists = e
+    return rft_code_lists, time.process_time() - start_time
+
+
+# The RefactoringStore whose programs are refactored by the store workers, inherited when they are forked
+curr_store = None
+
+
+def store_worker(task):
+    file_name, code, csv_report = task
+    return curr_store.refactor_file(file_name, code, csv_report)
+
+
+class RefactoringStore:
+    """Offline refactoring results of each correct program on its own, so that those of any sample
+        of the programs, e.g. for each sampling rate and experiment, are merged from them instead of
+        refactored again. They are stored in store_path, and dropped if the rules or max_depth change.
+        The merged clusters are not always those of ofl_bfs on the sample, see get_refactoring.
+    """
+    def __init__(self, store_path, timeout=None, max_depth=2, jobs=1, rft_cache=None):
+        self.__store_path = store_path
+        self.__timeout = timeout
+        self.__max_depth = max_depth
+        self.__jobs = jobs
+        self.__rft_cache = rft_cache
+
+        self.__version = (get_rules_hash(), max_depth)
+
+        # file name -> (hash of the code, cluster_list_map of the code alone, csv_record_list or None if not reported)
+        self.__entry_map = {}
+        if os.path.isfile(store_path):
+            with open(store_path, 'rb') as f:
+                version, entry_map = pickle.load(f)
+            if version == self.__version:
+                self.__entry_map = entry_map
+
+    def __has(self, file_name, code, csv_report):
+        if file_name not in self.__entry_map.keys():
+            return False
+        code_hash, _, csv_record_list = self.__entry_map[file_name]
+        return code_hash == get_hash(code) and (csv_record_list is not None or not csv_report)
+
+    def refactor(self, corr_code_map, reporter=None, csv_report=False):
+        """Refactor the programs of corr_code_map that are not stored yet. With jobs > 1, the programs are
+            refactored by forked processes, or the rules are applied in parallel if there is only one program.
+            reporter reports on the structures of the programs refactored so far.
+            The CSV records of the refactorings are only stored if csv_report is set, programs stored
+            without them are then refactored again.
+        """
+        global curr_store
+
+        task_list = [(file_name, code, csv_report) for file_name, code in corr_code_map.items()
+                     if not self.__has(file_name, code, csv_report)]
+        if len(task_list) == 0:
+            return
+
+        pool = None
+        if self.__jobs > 1 and len(task_list) > 1:
+            curr_store = self
+            pool = multiprocessing.get_context("fork").Pool(self.__jobs)
+            curr_store = None
+            entry_iter = pool.imap(store_worker, task_list)
+        elif len(task_list) > 1:
+            entry_iter = (self.refactor_file(file_name, code, csv_report) for file_name, code, _ in task_list)
+        else:
+            # A program on its own reports its progress during the search
+            file_name, code, _ = task_list[0]
+            entry_iter = iter([self.refactor_file(file_name, code, csv_report, self.__jobs, reporter)])
+
+        # func_name -> {(structure, indent): cluster}, of the programs refactored so far
+        stru_cluster_map = {}
+        try:
+            for (file_name, _, _), entry in zip(task_list, entry_iter):
+                self.__entry_map[file_name] = entry
+
+                if reporter is not None and len(task_list) > 1:
+                    for func_name, cluster_list in entry[1].items():
+                        for cluster in cluster_list:
+                            stru_cluster_map.setdefault(func_name, {}).setdefault(
+                                (tuple(cluster["stru"]), tuple(cluster["indent"])), cluster)
+                    reporter.report(None, {func_name: list(cluster_map.values())
+                                           for func_name, cluster_map in stru_cluster_map.items()})
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+
+        self.__save()
+
+    def __save(self):
+        # The programs reach many of the same codes, which are pickled once if they are the same objects
+        code_map = {}
+        for _, cluster_list_map, csv_record_list in self.__entry_map.values():
+            for cluster_list in cluster_list_map.values():
+                for cluster in cluster_list:
+                    cluster["code"] = [code_map.setdefault(code, code) for code in cluster["code"]]
+            if csv_record_list is not None:
+                for csv_record in csv_record_list:
+                    csv_record[4] = code_map.setdefault(csv_record[4], csv_record[4])
+                    csv_record[5] = code_map.setdefault(csv_record[5], csv_record[5])
+
+        tmp_path = self.__store_path + ".tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump((self.__version, self.__entry_map), f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, self.__store_path)
+
+    def refactor_file(self, file_name, code, csv_report=False, jobs=1, reporter=None):
+        rft = Refactoring({file_name: code}, self.__timeout, self.__max_depth, reporter, jobs=jobs,
+                          rft_cache=self.__rft_cache)
+        cluster_list_map = rft.ofl_bfs(csv_report=csv_report)
+
+        csv_record_list = None
+        if csv_report:
+            csv_record_list = rft.csv_record_list
+        return get_hash(code), cluster_list_map, csv_record_list
+
+    def get_refactoring(self, corr_code_map, cluster_list_map=None, old_corr_code_list=None):
+        """Return a Refactoring holding the clusters of the stored programs of corr_code_map, merged
+            depth by depth in the order of corr_code_map, into cluster_list_map if given.
+            old_corr_code_list are the programs cluster_list_map was refactored from, which count towards
+            the functions that are not refactored, whose clusters are dropped.
+            The clusters are those of ofl_bfs on corr_code_map if the programs reach no code in common.
+            Otherwise, where ofl_bfs drops a code of a program as a duplicate of another program's, the
+            program may get another code of the same structure into the cluster, and refactor it further.
+            Refactored alone, the program keeps the first code instead, so such codes are left out.
+        """
+        entry_list = [self.__entry_map[file_name] for file_name in corr_code_map.keys()]
+
+        func_cnt_map = {}
+        func_name_list_list = [list(file_cluster_list_map.keys()) for _, file_cluster_list_map, _ in entry_list]
+        if old_corr_code_list is not None:
+            func_name_list_list.extend(list(get_func_map(code).keys()) for code in old_corr_code_list)
+        for func_name_list in func_name_list_list:
+            for func_name in func_name_list:
+                func_cnt_map[func_name] = func_cnt_map.get(func_name, 0) + 1
+        del_func_name_set = set(get_del_func_name_list(func_cnt_map))
+
+        if cluster_list_map is not None:
+            cluster_list_map = {func_name: cluster_list for func_name, cluster_list in cluster_list_map.items()
+                                if func_name not in del_func_name_set}
+
+        rft = Refactoring({}, self.__timeout, self.__max_depth, cluster_list_map=cluster_list_map)
+        for depth in range(self.__max_depth + 1):
+            for _, file_cluster_list_map, _ in entry_list:
+                rft.merge({func_name: cluster_list for func_name, cluster_list in file_cluster_list_map.items()
+                           if func_name not in del_func_name_set}, depth)
+
+        for _, _, csv_record_list in entry_list:
+            if csv_record_list is not None:
+                rft.csv_record_list.extend(csv_record_list)
+        return rft
+
+
 class Refactoring:
-    def __init__(self, corr_code_map=None, timeout=None, max_depth=10, reporter=None, debug=False, track=True):#5*60
+    def __init__(self, corr_code_map=None, timeout=None, max_depth=10, reporter=None, debug=False, track=True, jobs=1, cluster_list_map=None, rft_cache=None):#5*60
         self.corr_code_map = corr_code_map
         self.timeout = timeout
         self.max_depth = max_depth
@@ -72,6 +325,16 @@ class Refactoring:
         self.debug = debug
         self.track = track
 
+        # the number of processes applying rules to the codes of a depth
+        self.jobs = jobs
+        self.__pool = None
+
+        # time spent by the processes, counted towards the timeout
+        self.__worker_time = 0
+
+        # TransitionCache of the refactored codes of each code and rule, if any
+        self.rft_cache = rft_cache
+
         # function name list 
         self.__init_cfl_map()
         
@@ -82,6 +345,30 @@ class Refactoring:
         self.csv_record_list = []
         self.rule_list_map = {}
 
+        # funcName -> {(structure, indent): (cluster, set of its root file names)}
+        self.__cluster_map = {}
+
+        # funcName -> set of hashes of the normalized codes in its clusters
+        self.__code_hash_set_map = {}
+
+        # clusters refactored before, which the codes of corr_code_map are merged into
+        if cluster_list_map is not None:
+            self.cluster_list_map = cluster_list_map
+            for func_name, cluster_list in cluster_list_map.items():
+                self.__init_cluster_index(func_name)
+                for cluster in cluster_list:
+                    key = (tuple(cluster["stru"]), tuple(cluster["indent"]))
+                    self.__cluster_map[func_name][key] = (cluster, set(cluster["root_file_name"]))
+                    for code in cluster["code"]:
+                        self.__code_hash_set_map[func_name].add(get_hash(normalize_code(code)))
+
+    def __init_cluster_index(self, func_name):
+        if func_name not in self.cluster_list_map.keys():
+            self.cluster_list_map[func_name] = []
+        if func_name not in self.__cluster_map.keys():
+            self.__cluster_map[func_name] = {}
+            self.__code_hash_set_map[func_name] = set()
+
     def to_csv(self, csv_path):
         with open(csv_path, 'w') as f:
             csv_w = csv.writer(f)
@@ -94,37 +381,66 @@ class Refactoring:
             for csv_record in self.csv_record_list:
                 csv_w.writerow(csv_record)
 
+    def merge(self, cluster_list_map, depth=None):
+        """Merge the clusters of other root files, e.g. from RefactoringStore, skipping the codes that are
+            already in a cluster. If depth is given, only the codes refactored by depth rules are merged.
+        """
+        for func_name, cluster_list in cluster_list_map.items():
+            self.__init_cluster_index(func_name)
+            for cluster in cluster_list:
+                for code, root_file_name, rule_id_str in zip(cluster["code"], cluster["root_file_name"], cluster["rule_id"]):
+                    rule_id_list = []
+                    if len(rule_id_str) > 0:
+                        rule_id_list = [int(rule_id) for rule_id in rule_id_str.split(",")]
+
+                    if depth is not None and len(rule_id_list) != depth:
+                        continue
+
+                    code_hash = get_hash(normalize_code(code))
+                    if code_hash not in self.__code_hash_set_map[func_name]:
+                        self.__add(func_name, code, code_hash, cluster["stru"], cluster["indent"], root_file_name, rule_id_list)
+
     def __update(self, func_name, new_code, root_file_name, rule_id_list):
-        rule_id_str = ""
-        if len(rule_id_list) > 0:
-            rule_id_str = ",".join(str(rule_id) for rule_id in rule_id_list)
+        # A code already in a cluster, e.g. reached from another root file, is not added nor expanded again
+        code_hash = get_hash(normalize_code(new_code))
+        if code_hash in self.__code_hash_set_map[func_name]:
+            return False
 
-        cluster_list = self.cluster_list_map[func_name]
         _, stru_list, indent_list = get_func_cfs(new_code)
-        for cluster in cluster_list:
-            if cluster["stru"] == stru_list and \
-                    cluster["indent"] == indent_list:
+        return self.__add(func_name, new_code, code_hash, stru_list, indent_list, root_file_name, rule_id_list)
 
-                if root_file_name not in cluster["root_file_name"]:
-                    cluster["code"].append(new_code)
+    def __add(self, func_name, new_code, code_hash, stru_list, indent_list, root_file_name, rule_id_list):
+        rule_id_str = ""
+        if len(rule_id_list) > 0:
+            rule_id_str = ",".join(str(rule_id) for rule_id in rule_id_list)
 
-                    cluster["root_file_name"].append(root_file_name)
+        key = (tuple(stru_list), tuple(indent_list))
+        if key in self.__cluster_map[func_name].keys():
+            cluster, root_file_name_set = self.__cluster_map[func_name][key]
 
-                    cluster["rule_id"].append(rule_id_str)
-                    self.rule_list_map[new_code] = rule_id_list
+            if root_file_name not in root_file_name_set:
+                cluster["code"].append(new_code)
 
-                    return True
-                else:
-                    return False
+                cluster["root_file_name"].append(root_file_name)
+                root_file_name_set.add(root_file_name)
 
+                cluster["rule_id"].append(rule_id_str)
+                self.rule_list_map[new_code] = rule_id_list
+                self.__code_hash_set_map[func_name].add(code_hash)
 
+                return True
+            else:
+                return False
 
-        cluster_list.append({"stru": stru_list,
-                             "indent": indent_list,
-                             "code":[new_code],
-                             "root_file_name":[root_file_name],
-                             "rule_id": [rule_id_str]})
+        cluster = {"stru": stru_list,
+                   "indent": indent_list,
+                   "code":[new_code],
+                   "root_file_name":[root_file_name],
+                   "rule_id": [rule_id_str]}
+        self.cluster_list_map[func_name].append(cluster)
+        self.__cluster_map[func_name][key] = (cluster, {root_file_name})
         self.rule_list_map[new_code] = rule_id_list
+        self.__code_hash_set_map[func_name].add(code_hash)
 
         return True
 
@@ -139,13 +455,8 @@ class Refactoring:
                     corr_func_list_map[func_name] = []
                 corr_func_list_map[func_name].append((file_name, func_code))
 
-        max_len = max([len(corr_func_list_map[func_name]) for func_name in corr_func_list_map.keys()])
-        del_func_name_list = []
-        for func_name in corr_func_list_map.keys():
-            if max_len - len(corr_func_list_map[func_name]) > 5:
-                del_func_name_list.append(func_name)
-
-        for func_name in del_func_name_list:
+        for func_name in get_del_func_name_list({func_name: len(corr_func_list)
+                                                 for func_name, corr_func_list in corr_func_list_map.items()}):
             del corr_func_list_map[func_name]
 
         self.cfl_map = corr_func_list_map
@@ -154,20 +465,43 @@ class Refactoring:
     class TimeoutException(Exception):
         pass
 
+    def get_time(self):
+        return time.process_time() + self.__worker_time
+
     def time_checker(self, start_time):
-        time_elapse = time.process_time() - start_time
+        time_elapse = self.get_time() - start_time
         if time_elapse > self.timeout:
             raise Refactoring.TimeoutException()
 
+    def __iter_rft_code_lists(self, code_list):
+        """Yield the refactored codes of each rule for each code, in the order of code_list"""
+        if self.__pool is None:
+            for code in code_list:
+                yield self.refactor_all(code)
+        else:
+            chunk_size = max(1, len(code_list) // (self.jobs * 4))
+            for rft_code_lists, worker_time in self.__pool.imap(rft_worker, code_list, chunk_size):
+                self.__worker_time += worker_time
+                if isinstance(rft_code_lists, Exception):
+                    raise rft_code_lists
+                yield rft_code_lists
+
     def ofl_bfs(self, csv_report=False):
-        start_time = time.process_time()
+        global curr_rft
+
+        if self.jobs > 1 and self.max_depth > 0:
+            curr_rft = self
+            self.__pool = multiprocessing.get_context("fork").Pool(self.jobs)
+            curr_rft = None
+
+        start_time = self.get_time()
 
         code_list_map = {}
         root_fn_lst_map = {}
 
         try:
             for func_name in self.cfl_map.keys():
-                self.cluster_list_map[func_name] = []
+                self.__init_cluster_index(func_name)
                 code_list_map[func_name] = []
                 root_fn_lst_map[func_name] = []
 
@@ -189,9 +523,9 @@ class Refactoring:
 
                     if self.reporter is not None:
                         if self.timeout is not None:
-                            time_elapse = time.process_time() - start_time
+                            time_elapse = self.get_time() - start_time
                             self.reporter.report(self.timeout - time_elapse, self.cluster_list_map)
-                            start_time = time.process_time()
+                            start_time = self.get_time()
                             self.timeout = self.timeout - time_elapse
                         else:
                             self.reporter.report(None, self.cluster_list_map)
@@ -206,7 +540,10 @@ class Refactoring:
                         tmp_root_fn_list = []
 
                         tmp_code_map = dict(zip(code_list_map[func_name], root_fn_lst_map[func_name]))
-                        for code, root_fn in tmp_code_map.items():
+
+                        # Rules may be applied in parallel, their results are merged here in order
+                        rft_code_lists_iter = self.__iter_rft_code_lists(list(tmp_code_map.keys()))
+                        for (code, root_fn), rft_code_lists in zip(tmp_code_map.items(), rft_code_lists_iter):
                             old_rule_id_list = self.rule_list_map[code]
 
                             if self.timeout is not None:
@@ -214,9 +551,9 @@ class Refactoring:
 
                             if self.reporter is not None:
                                 if self.timeout is not None:
-                                    time_elapse = time.process_time() - start_time
+                                    time_elapse = self.get_time() - start_time
                                     self.reporter.report(self.timeout - time_elapse, self.cluster_list_map)
-                                    start_time = time.process_time()
+                                    start_time = self.get_time()
                                     self.timeout = self.timeout - time_elapse
                                 else:
                                     self.reporter.report(None, self.cluster_list_map)
@@ -224,7 +561,7 @@ class Refactoring:
                             for rule_id in range(1, 22):
 
 
-                                rft_code_list = self.refactor(code, rule_id)
+                                rft_code_list = rft_code_lists[rule_id - 1]
 
                                 for rft_code in rft_code_list:
                                     if self.debug:
@@ -252,6 +589,11 @@ class Refactoring:
             import traceback, sys
             print(str(e), file=sys.stderr)
             traceback.print_exc(file=sys.stderr)
+        finally:
+            if self.__pool is not None:
+                self.__pool.terminate()
+                self.__pool.join()
+                self.__pool = None
 
         if not self.track:
             for func_name, cluster_list in self.cluster_list_map.items():
@@ -261,7 +603,24 @@ class Refactoring:
 
         return self.cluster_list_map
 
+    def refactor_all(self, code):
+        """Return the refactored codes of rules 1..21, skipping the rules that cannot refactor code"""
+        feature_map = get_code_features(code)
+        return [self.refactor(code, rule_id) if is_rule_applicable(rule_id, feature_map) else []
+                for rule_id in range(1, 22)]
+
     def refactor(self, code, rule_id):
+        if self.rft_cache is None:
+            return self.__refactor(code, rule_id)
+
+        key = self.rft_cache.get_key(code, rule_id)
+        rft_code_list = self.rft_cache.get(key)
+        if rft_code_list is None:
+            rft_code_list = self.__refactor(code, rule_id)
+            self.rft_cache.put(key, rft_code_list)
+        return rft_code_list
+
+    def __refactor(self, code, rule_id):
         if rule_id == 2:
             return self.refactor_rule_two(code)
         if rule_id == 3:
@@ -1,4 +1,4 @@
-from . import rule, ruleMatcher, controlFlow, Helper as H
+from . import rule, ruleMatcher, ruleAction, controlFlow, Helper as H
 import ast, os, csv, astunparse
 
 #region: Global Params
@@ -37,11 +37,28 @@ class Refactor:
     def __init__(self, fname, origCode, depth=1):
         self.fname = fname
         self.origCode = origCode
-        self.ruleAppls = {} # {rule-id: [newCode1, newCode2]}
+        self.ruleTrees = {} # {rule-id: [newTree1, newTree2]}
+        self.__ruleAppls = {} # {rule-id: [newCode1, newCode2]}, unparsed from ruleTrees on demand
         self.depth = depth # How many far away (#rule-applications) is it from code in fname?
     
     def addRuleAppl(self, r, replNodes):
-        self.ruleAppls[r.name] = [astunparse.unparse(n) for n in replNodes]
+        self.ruleTrees[r.name] = replNodes
+
+    @property
+    def ruleAppls(self):
+        for rname in self.ruleTrees:
+            if rname not in self.__ruleAppls:
+                self.__ruleAppls[rname] = [astunparse.unparse(n) for n in self.ruleTrees[rname]]
+        return self.__ruleAppls
+
+    def iterNewCodes(self, seenCodes):
+        '''Yield (rule-id, newCode) for each new code not in seenCodes (and add it), unparsing them one at a time'''
+        for rname in self.ruleTrees:
+            for n in self.ruleTrees[rname]:
+                newCode = astunparse.unparse(n)
+                if newCode not in seenCodes:
+                    seenCodes.add(newCode)
+                    yield rname, newCode
 
     def __str__(self):
         stri = 'OrigCode:\n' + self.origCode + 'RuleAppls:\n'
@@ -83,14 +100,15 @@ def writeResults(results):
 def applyRules(refactor:Refactor, untilDepth, results, currDepth=1):
     '''Repeatedly apply rules on refactor object, upto a specified depth'''
     #print(refactor.fname, currDepth)
+    corrParse = ast.parse(refactor.origCode) # Parse once, rule actions copy the modified path only
+    parentMap = ruleAction.getParentMap(corrParse) # and locate it through the same index
     for r in rule.rules:
-        corrParse = ast.parse(refactor.origCode) # Run parse for each rule, since original parse modified!
         verbose =  (r.name in verboseRnames) and (refactor.fname in verboseFnames) 
         if verbose:
             print('-'*50, '\nDebugging fname='+ refactor.fname, 'rname='+r.name, '\n'+'-'*50)               
         else:
             pass
-        tree, nodeO, replNodes = ruleMatcher.matchOrig(corrParse, r, verbose=verbose)
+        tree, nodeO, replNodes = ruleMatcher.matchOrig(corrParse, r, verbose=verbose, parentMap=parentMap)
         refactor.addRuleAppl(r, replNodes)
         
     if 'test' not in refactor.fname:
@@ -101,6 +119,32 @@ def applyRules(refactor:Refactor, untilDepth, results, currDepth=1):
 
     return results
 
+def getRuleAppls(code, transitionCache=None):
+    '''Apply each rule once on code, and return {rule-id: [newCode1, newCode2]}, where a code refactored by several rules
+is only kept for the first. Transitions are looked up in (and added to) transitionCache (cache.TransitionCache), if given'''
+    if transitionCache is not None:
+        ruleAppls = {}
+        for r in rule.rules:
+            newCodes = transitionCache.get(transitionCache.get_key(code, r.name))
+            if newCodes is None: # Not cached, or evicted
+                break
+            ruleAppls[r.name] = newCodes
+        else:
+            return ruleAppls
+
+    refactor = Refactor('', code)
+    applyRules(refactor, untilDepth=1, results=[])
+
+    ruleAppls = {rname: [] for rname in refactor.ruleTrees}
+    for rname, newCode in refactor.iterNewCodes(set()):
+        ruleAppls[rname].append(newCode)
+
+    if transitionCache is not None: # Only the codes kept
+        for rname, newCodes in ruleAppls.items():
+            transitionCache.put(transitionCache.get_key(code, rname), newCodes)
+
+    return ruleAppls
+
 def applyRules_rec(refactor:Refactor, untilDepth, results, currDepth=1):
     for index in range(len(results)): # For each result
         refactor = results[index]
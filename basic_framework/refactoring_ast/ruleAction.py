@@ -2,36 +2,56 @@ import ast, astunparse
 import copy, keyword, builtins
 
 # region: Helper funcs
-def findNode(nodeOrig, currOrig, currCopy):
-    '''Starting from tree (and treeCopy), iterate until nodeOrig found.'''    
-    if currOrig == nodeOrig:
-        return currCopy
-
-    if type(currCopy) is list and type(currOrig) is list:
-        for i, j in zip(currOrig, currCopy):
-            result = findNode(nodeOrig, i, j)
-            if result: return result
-
-    if hasattr(currOrig, '_fields'):
-        for field in currOrig._fields: 
-            i, j = getattr(currOrig, field), getattr(currCopy, field)
-            result = findNode(nodeOrig, i, j)
-            if result: return result
-
-    return None
-
-def findNode_replHash(tree, treeCopy, replHash):
-    replHashCopy = {}
-    for key, value in replHash.items():
-        if type(value) is list:
-            newVal = [findNode(i, tree, treeCopy) for i in value]
+def getParentMap(tree):
+    '''Index a parse once: map id(node) to (parentNode, field, index) for each node inside tree, index=None for non-list fields.'''
+    parentMap = {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        for field in node._fields:
+            attr = getattr(node, field)
+            if type(attr) is list:
+                for index, child in enumerate(attr):
+                    if isinstance(child, ast.AST):
+                        parentMap[id(child)] = (node, field, index)
+                        stack.append(child)
+            elif isinstance(attr, ast.AST):
+                parentMap[id(attr)] = (node, field, None)
+                stack.append(attr)
+
+    return parentMap
+
+def findPath(nodeOrig, tree, parentMap):
+    '''Walk up parentMap from nodeOrig to tree. Return its path of (field, index) steps, None if not found.'''
+    path = []
+    currOrig = nodeOrig
+    while currOrig is not tree:
+        if id(currOrig) not in parentMap:
+            return None
+        currOrig, field, index = parentMap[id(currOrig)]
+        path.append((field, index))
+
+    path.reverse()
+    return path
+
+def copyPath(tree, path):
+    '''Copy-on-write: shallow copy the nodes (and lists) along path only, the rest of treeCopy is shared with tree.
+Return treeCopy and the copy of the node at the end of path.'''
+    treeCopy = copy.copy(tree)
+    currCopy = treeCopy
+    for field, index in path:
+        attr = getattr(currCopy, field)
+        if index is None:
+            childCopy = copy.copy(attr)
         else:
-            newVal = findNode(value, tree, treeCopy)
-        
-        if newVal:
-            replHashCopy[key] = newVal
-        
-    return replHashCopy
+            attr = list(attr)
+            childCopy = copy.copy(attr[index])
+            attr[index] = childCopy
+            
+        setattr(currCopy, field, childCopy if index is None else attr)
+        currCopy = childCopy
+
+    return treeCopy, currCopy
 
 def printTree(node, indent=0):
     '''Given an AST node, print the complete tree structure (with memory references)'''
@@ -46,13 +66,10 @@ def printTree(node, indent=0):
         for child in node.body:
             printTree(child, indent=indent+1)
 
-def prePrint(verbose, replHash, replHashCopy, delNodes, delNodesCopy, tree, treeCopy):
+def prePrint(verbose, replHash, delNodes, tree, treeCopy):
     if verbose:
-        print('applyAction.ReplHash-Orig: '); print(replHash)
-        print('applyAction.ReplHash-Copy: '); print(replHashCopy)
-
-        print('\napplyAction.DelNode-Orig: '); print(delNodes)
-        print('applyAction.DelNode-Copy: '); print(delNodesCopy)
+        print('applyAction.ReplHash: '); print(replHash)
+        print('\napplyAction.DelNode: '); print(delNodes)
 
         print('\napplyAction.Tree-Orig: '); printTree(tree)
         print('applyAction.Tree-Copy: '); printTree(treeCopy)
@@ -113,48 +130,35 @@ def repl_placeholders(nodeA, replHash):
 #endregion
 
 #region: Rule Action
-def recurseDel(nodeO, delNode, depth=0):
-    '''Recursively delete nodes'''
-    #print(nodeO, delNode)
-    if 'body' in nodeO._fields:
-        if delNode in nodeO.body: # If found
-            index = nodeO.body.index(delNode)
-            nodeO.body.remove(delNode)
-            return index, depth # Return its index and depth
-                
-        for child in nodeO.body: # Otherwise
-            i, depth = recurseDel(child, delNode, depth+1) # Search within its children
-            if i is not None:
-                return i, depth
-    
-    return None, depth
-
-
-def applyAction(tree, rule, nodeO, replHash, delNodes, verbose=False):
+def applyAction(tree, rule, nodeO, replHash, delNodes, verbose=False, parentMap=None):
     # Return a copy of the tree, and the corresponding "nodeO" in that copy.
-    treeCopy = copy.deepcopy(tree)
-    nodeCopy = findNode(nodeO, tree, treeCopy) 
-    replHashCopy = findNode_replHash(tree, treeCopy, replHash)
-    delNodesCopy = [findNode(node, tree, treeCopy) for node in delNodes]
+    # Only the path from tree to nodeO is copied, so tree itself is never modified,
+    # and the matched nodes (replHash, delNodes) are shared between tree and its copy.
+    if parentMap is None:
+        parentMap = getParentMap(tree)
+    path = findPath(nodeO, tree, parentMap)
+    if path is None:
+        raise Exception('NodeO: ', nodeO, 'not found in', tree)
+    treeCopy, nodeCopy = copyPath(tree, path)
+    nodeCopy.body = list(nodeCopy.body)
     
-    prePrint(verbose, replHash, replHashCopy, delNodes, delNodesCopy, tree, treeCopy)        
+    prePrint(verbose, replHash, delNodes, tree, treeCopy)        
 
-    # Delete matched nodes, and record its index
+    # Delete matched nodes (children of nodeO), and record its index
     lowestI = float('inf')
-    for delNode in delNodesCopy:
-        index, depth = recurseDel(nodeCopy, delNode)
-        if index is None:
+    for delNode in delNodes:
+        if delNode not in nodeCopy.body:
             raise Exception('DelNode: ', delNode, 'not found in', nodeCopy)
-        if depth == 0: # Add index to min, only if when depth = 0
-            lowestI = min(lowestI, index) # i.e, delNode found at current tree level (nodeO.body)
-        
+        index = nodeCopy.body.index(delNode)
+        nodeCopy.body.remove(delNode)
+        lowestI = min(lowestI, index)
     
     if lowestI == float('inf'): # If no nodes to del
         lowestI = 0  # Insert at beginning
 
     # Replace holes in action nodes
     actionNodes = copy.deepcopy(rule.action)
-    actionNodes = repl_placeholders(actionNodes, replHashCopy)
+    actionNodes = repl_placeholders(actionNodes, replHash)
     
     # Add Action nodes, at lowestI index
     nodeCopy.body = nodeCopy.body[:lowestI] + actionNodes + nodeCopy.body[lowestI:]
@@ -256,16 +256,18 @@ recLevel => recursion level of matchRule func.'''
 
 #region: Match NodeO (original) recursively
 
-def matchOrig(tree, rule, nodeO=None, nodeR=None, verbose=False):    
+def matchOrig(tree, rule, nodeO=None, nodeR=None, verbose=False, parentMap=None):    
     '''Recursively match parse of original code and rule template.
 Each recursion step goes within original code's AST.
 OrigP = Complete AST, rule = Rule object
-nodeO = current AST node, nodeR = current rule node'''
+nodeO = current AST node, nodeR = current rule node
+parentMap = ruleAction.getParentMap(tree), to be shared by all rules matched against tree'''
 
     # init recursion
     replacedNodes = []
     if nodeO is None: nodeO = tree
     if nodeR is None: nodeR = rule.match
+    if parentMap is None: parentMap = ruleAction.getParentMap(tree)
     
     # match current-orig and rule-node
     matcher = Matcher()
@@ -274,13 +276,13 @@ nodeO = current AST node, nodeR = current rule node'''
     # If success (replHash not empty), apply rule action
     for match in matcher.matches:
         if match.success:            
-            treeCopy, nodeCopy = ruleAction.applyAction(tree, rule, nodeO, match.replHash, match.delNodes, verbose=verbose)        
+            treeCopy, nodeCopy = ruleAction.applyAction(tree, rule, nodeO, match.replHash, match.delNodes, verbose=verbose, parentMap=parentMap)        
             replacedNodes.append(treeCopy) # Add the modified tree to return list          
 
     # recurse original code tree
     if hasattr(nodeO, 'body'): # If there exists a 'body'
         for i in nodeO.body: # For each childNode inside the body
-            tree, nodeO, newReplNodes = matchOrig(tree, rule, i, nodeR, verbose=verbose) # match ruleP against child
+            tree, nodeO, newReplNodes = matchOrig(tree, rule, i, nodeR, verbose=verbose, parentMap=parentMap) # match ruleP against child
             replacedNodes += newReplNodes
     
     return tree, nodeO, replacedNodes
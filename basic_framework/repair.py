@@ -3,15 +3,17 @@
 
 import sys
 import os
-import heapq
 from shutil import copyfile
 import time
 import random
 import pickle
 import gc, time
+import queue
+import functools
+import multiprocessing
 from fastcache import clru_cache
 
-from basic_framework.holes import Holes
+from basic_framework.holes import Holes, SynthesisContext, get_syn_ctx, set_syn_ctx
 from basic_framework.f1x import *
 from basic_framework.feedback import *
 from basic_framework.utils import *
@@ -19,39 +21,17 @@ from basic_framework.distance import *
 from basic_framework.block import *
 from basic_framework.cfs import *
 from basic_framework.core_testing import Tester
+from basic_framework.cache import TransitionCache
+from basic_framework.refactoring import get_rules_hash, get_transition_db_path
+from basic_framework.cluster_index import ClusterIndex
 from basic_framework.statement import *
 from basic_framework.hole_injection import *
 from basic_framework.template import *
 from basic_framework.refactoring_ast import astRefactor
+from basic_framework.online_refactoring import OnlineRefactoring, RefactoredCode, get_corr_func_list_map
 from prettytable import PrettyTable
 
 
-class HeapUnit:
-    def __init__(self, rc, bd):
-        self.rc = rc
-        self.bd = bd
-        self.w = len(self.rc.rname.split(",")) + bd
-
-    def __lt__(self, other):
-        return self.w < other.w
-
-    def __eq__(self, other):
-        return self.w == other.w
-
-
-class RefactoredCode:
-    def __init__(self, corr_code, fname, rname):
-        self.corr_code = corr_code
-        self.fname = fname # Original correct code file name
-        self.rname = rname # Set of rules applied
-
-    def __lt__(self, other):
-        return len(self.rname.split(",")) < len(other.rname.split(","))
-
-    def __eq__(self, other):
-        return len(self.rname.split(",")) == len(other.rname.split(","))
-
-
 class ORO:
     """Online Refactoring Only"""
     def __init__(self, ques_dir_path, sr_list, exp_time):
@@ -62,6 +42,10 @@ class ORO:
         self.__sr_list = sr_list
         self.__exp_time = exp_time
 
+        # rules applied to the same programs for all submissions are only applied once
+        self.__rft_cache = TransitionCache(get_rules_hash())
+        self.__ol_rft = OnlineRefactoring(self.__rft_cache)
+
     def run(self, timeout=60):
         print("\n\nOnline refactor submissions in " + self.__ques_dir_path.split("/")[-1] + "\n\n")
 
@@ -102,11 +86,11 @@ class ORO:
                         sel_fn_code_map = dict(sel_corr_fn_code_list)
 
                         ol_refactoring_start_time = time.process_time()
-                        corr_rc_map = self.astar_ol_rfty(bug_code, sel_fn_code_map)
+                        corr_rc_map = self.__ol_rft.astar_ol_rfty(bug_code, sel_fn_code_map)
                         perf_map["or_time"] = time.process_time() - ol_refactoring_start_time
 
                         gcr_start_time = time.process_time()
-                        best_rc = self.astar_get_cls_rc(bug_code,  corr_rc_map)
+                        best_rc = self.__ol_rft.astar_get_cls_rc(bug_code,  corr_rc_map)
                         perf_map["gcr_time"] = time.process_time() - gcr_start_time
 
                         perf_map["code"] = best_rc.corr_code
@@ -141,151 +125,22 @@ class ORO:
             code_map[code_file_name] = code
         return code_map
 
-    # single function astar refactoring
-    def astar_ol_rfty_func(self, bug_func_code, fname_corrFuncCode, max_step=100):
-        h = []
-        rc_list = []
 
-        bug_cfs_map = get_cfs_map(bug_func_code)
+# The function repairing a buggy file, inherited by the forked repair workers
+curr_rep_file_func = None
 
-        # build min binary heap
-        for fname, corrCode in fname_corrFuncCode.items():
-            rc = RefactoredCode(corrCode, fname, "")
-            corr_cfs_map = get_cfs_map(corrCode)
-            if cfs_map_equal(bug_cfs_map, corr_cfs_map):
-                rc_list.append(rc)
-            else:
-                d = multi_func_stru_dist(bug_cfs_map, corr_cfs_map)
-                hu = HeapUnit(rc, d)
-                heapq.heappush(h, hu)
-
-        if len(rc_list) > 0:
-            return rc_list
-
-        # heuristic-guided search (astar alg.)
-        step = 0
-        while len(h) > 0 and step < max_step:
-            hu = h[0]
-            rc = hu.rc
-            d = hu.bd
-            
-            if d == 0:
-                break
-            else:
-                refactor = astRefactor.Refactor(rc.fname, rc.corr_code)
-                refactors = astRefactor.applyRules(refactor, untilDepth=1, results=[])
-
-                heapq.heappop(h)
-                for refactor in refactors:
-                    for rname in refactor.ruleAppls:
-                        for refactoredCode in refactor.ruleAppls[rname]:
-                            if "    def " in refactoredCode:
-                                continue
-                            elif "\nif " in refactoredCode:
-                                continue
-                            corr_cfs_map = get_cfs_map(refactoredCode)
-                            n_d = multi_func_stru_dist(bug_cfs_map, corr_cfs_map)
-                            if "," in rc.rname:
-                                n_d += len(rc.rname.split(","))
-
-                            n_rname = rc.rname
-                            if n_rname == "":
-                                n_rname = rname
-                            else:
-                                n_rname += "," + rname
-
-                            n_rc = RefactoredCode(refactoredCode, refactor.fname, n_rname)
-                            n_hu = HeapUnit(n_rc, n_d)
-                            heapq.heappush(h, n_hu)
-                step += 1
-
-        assert (len(h) > 0)
-
-        # collect code candidates
-        best_d = h[0].bd
-        while len(h) > 0:
-            d = h[0].bd
-            rc = h[0].rc
-            if d == best_d:
-                rc_list.append(rc)
-                heapq.heappop(h)
-            else:
-                break
-        return rc_list
 
-    def __get_corr_func_list_map(self, corr_code_map):
-        corr_func_list_map = {}
-        for file_name, corr_code in corr_code_map.items():
-            func_code_map = get_func_map(corr_code)
-
-            for func_name in func_code_map.keys():
-                func_code = func_code_map[func_name]
-                if func_name not in corr_func_list_map.keys():
-                    corr_func_list_map[func_name] = []
-                corr_func_list_map[func_name].append((file_name, func_code))
-
-        max_len = max([len(corr_func_list_map[func_name]) for func_name in corr_func_list_map.keys()])
-        del_func_name_list = []
-        for func_name in corr_func_list_map.keys():
-            if max_len - len(corr_func_list_map[func_name]) > 5:
-                del_func_name_list.append(func_name)
-
-        for func_name in del_func_name_list:
-            del corr_func_list_map[func_name]
-
-        return corr_func_list_map
-
-    def astar_ol_rfty(self, bug_code, fname_corrCode, max_step=100):
-        # extract func definition from bug code
-        bug_func_map = get_func_map(bug_code)
-        corr_func_list_map = self.__get_corr_func_list_map(fname_corrCode)
-
-        rc_list_map = {}
-        for func_name, bug_func_code in bug_func_map.items():
-            corr_func_code_map = dict(corr_func_list_map[func_name])
-            rc_list = self.astar_ol_rfty_func(bug_func_code, corr_func_code_map, max_step)
-            rc_list_map[func_name] = rc_list
-
-        return rc_list_map
-
-    def astar_get_cls_rc(self, bug_code, rc_list_map):
-        bug_func_map = get_func_map(bug_code)
-
-        code_map = {}
-        file_map = {}
-        rule_map = {}
-        for func_name, bug_func_code in bug_func_map.items():
-            func_rc_list = rc_list_map[func_name]
-            best_func_rc = self.astar_get_cls_func_rc(bug_func_code, func_rc_list)
-
-            code_map[func_name] = best_func_rc.corr_code
-            file_map[func_name] = best_func_rc.fname
-            rule_map[func_name] = best_func_rc.rname
-
-        final_corr_code = "\n\n".join(code_map.values())
-        final_fname = str(file_map)
-        final_rule = str(rule_map)
-        best_rc = RefactoredCode(final_corr_code, final_fname, final_rule)
-
-        return best_rc
-
-    def astar_get_cls_func_rc(self, bug_func_code, rc_list):
-        # choose best one based on ted
-        min_ted, best_rc = None, None
-        for rc in rc_list:
-            if min_ted is None:
-                min_ted = lev_multi_func_code_distance(bug_func_code, rc.corr_code)
-                best_rc = rc
-            else:
-                ted = smt_lev_multi_func_code_distance(bug_func_code, rc.corr_code, min_ted)
-                if ted < min_ted:
-                    min_ted = ted
-                    best_rc = rc
-        return best_rc
+def rep_file_worker(w_idx, task_queue, result_queue):
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        idx, bug_file_name, bug_code = task
+        result_queue.put((w_idx, idx, curr_rep_file_func(bug_file_name, bug_code)))
 
 
 class BlockRepair:
-    def __init__(self, ques_dir_path, is_offline_ref, is_online_ref, is_mutation, sr_list, exp_time):
+    def __init__(self, ques_dir_path, is_offline_ref, is_online_ref, is_mutation, sr_list, exp_time, pool_size=0, is_disk_cache=False, jobs=1):
         self.__ques_dir_path = ques_dir_path
         self.__ans_dir_path = ques_dir_path + "/ans"
         self.__code_dir_path = ques_dir_path + "/code"
@@ -294,36 +149,23 @@ class BlockRepair:
         self.__sr_list = sr_list
         self.__exp_time = exp_time
 
-        self.__tester = Tester(ques_dir_path)
+        self.__tester = Tester(ques_dir_path, pool_size, is_disk_cache, jobs)
+        self.__jobs = jobs
+
+        # Online refactoring transitions are cached, on disk as well if is_disk_cache is set
+        self.__rft_cache = TransitionCache(get_rules_hash(), get_transition_db_path(ques_dir_path, is_disk_cache))
+        self.__ol_rft = OnlineRefactoring(self.__rft_cache)
 
         self.__is_offline_ref = is_offline_ref
         self.__is_online_ref = is_online_ref
         self.__is_mutation = is_mutation
 
-    def __get_corr_func_list_map(self, corr_code_map):
-        corr_func_list_map = {}
-        for file_name, corr_code in corr_code_map.items():
-            func_code_map = get_func_map(corr_code)
-
-            for func_name in func_code_map.keys():
-                func_code = func_code_map[func_name]
-                if func_name not in corr_func_list_map.keys():
-                    corr_func_list_map[func_name] = []
-                corr_func_list_map[func_name].append((file_name, func_code))
-
-        max_len = max([len(corr_func_list_map[func_name]) for func_name in corr_func_list_map.keys()])
-        del_func_name_list = []
-        for func_name in corr_func_list_map.keys():
-            if max_len - len(corr_func_list_map[func_name]) > 5:
-                del_func_name_list.append(func_name)
-
-        for func_name in del_func_name_list:
-            del corr_func_list_map[func_name]
-
-        return corr_func_list_map
+        # Loaded files are kept with their modification time, for later runs
+        self.__ofl_ref_map = {}
+        self.__code_map = {}
 
     def __filter_corr_codes(self, corr_code_map):
-        corr_func_list_map = self.__get_corr_func_list_map(corr_code_map)
+        corr_func_list_map = get_corr_func_list_map(corr_code_map)
 
         new_corr_code_map = {}
         for file_name, corr_code in corr_code_map.items():
@@ -344,14 +186,16 @@ class BlockRepair:
         trace_map = {}
 
         bug_hole_code = add_vari_hist_holes(bug_code, func_name)
+        bug_hole_prog = self.__tester.compile_program(bug_hole_code)
 
+        syn_ctx = get_syn_ctx()
         tc_id_list = self.__tester.get_tc_id_list()
         for tc_id in tc_id_list:
-            Holes.init_global_vars()
-            Holes.vari_hist = {}
-            self.__tester.run_tc(bug_hole_code, tc_id, timeout=1)
+            syn_ctx.reset()
+            syn_ctx.vari_hist = {}
+            self.__tester.run_tc(bug_hole_prog, tc_id, timeout=1)
 
-            trace_map[tc_id] = Holes.vari_hist
+            trace_map[tc_id] = syn_ctx.vari_hist
         return trace_map
 
     def __is_equal(self, object_a, object_b):
@@ -543,44 +387,46 @@ class BlockRepair:
     def synthesize(self, code, timeout):
         start_time = time.process_time()
 
-        Holes.init_global_vars()
-        Holes.ssl = SearchSpaceList()
-        Holes.ssl.add_ss(SearchSpace())
+        syn_ctx = get_syn_ctx()
+        syn_ctx.reset()
+        syn_ctx.ssl = SearchSpaceList()
+        syn_ctx.ssl.add_ss(SearchSpace())
 
         tc_id_list = self.__tester.get_tc_id_list()
+        prog = self.__tester.compile_program(code)
 
         for tc_id in tc_id_list:
             left_timeout = timeout - (time.process_time() - start_time)
             if left_timeout < 0:
                 break
 
-            Holes.ter = TERelation()
-            Holes.curr_tc_id = tc_id
+            syn_ctx.ter = TERelation()
+            syn_ctx.curr_tc_id = tc_id
 
             ssl_new = SearchSpaceList()
-            ss_list = Holes.ssl.get_ss_list()
+            ss_list = syn_ctx.ssl.get_ss_list()
 
             for curr_ss in ss_list:
                 left_timeout = timeout - (time.process_time() - start_time)
                 if left_timeout < 0:
                     break
 
-                Holes.curr_ss = curr_ss
-                Holes.curr_eg.clear()
+                syn_ctx.curr_ss = curr_ss
+                syn_ctx.curr_eg.clear()
 
                 while True:
-                    Holes.ldt_dict = {}
+                    syn_ctx.ldt_dict = {}
 
                     left_timeout = timeout - (time.process_time() - start_time)
                     if left_timeout < 0:
                         break
 
-                    real_output, exp_output = self.__tester.run_tc(code, tc_id, left_timeout)
+                    is_tc_pass = self.__tester.run_tc(prog, tc_id, left_timeout)
 
 
-                    if real_output == exp_output:
+                    if is_tc_pass:
                         ss = SearchSpace()
-                        expr_rec_dict = Holes.curr_eg.get_expr_rec_dict()
+                        expr_rec_dict = syn_ctx.curr_eg.get_expr_rec_dict()
                         for ln in expr_rec_dict.keys():
                             times_list = list(expr_rec_dict[ln].keys())
                             min_times = numpy.min(times_list)
@@ -589,12 +435,12 @@ class BlockRepair:
                         if not ssl_new.is_contain(ss):
                             ssl_new.add_ss(ss)
 
-                    is_continue = Holes.curr_eg.next()
+                    is_continue = syn_ctx.curr_eg.next()
                     if not is_continue:
                         break
 
             comb_ssl = SearchSpaceList()
-            for ss_a in Holes.ssl.ss_list:
+            for ss_a in syn_ctx.ssl.ss_list:
                 for ss_b in ssl_new.ss_list:
                     comb_s = SearchSpace()
                     for ln in ss_b.ss_dict.keys():
@@ -607,16 +453,19 @@ class BlockRepair:
                     if not comb_ssl.is_contain(comb_s):
                         comb_ssl.add_ss(comb_s)
 
-            Holes.ssl = comb_ssl
+            syn_ctx.ssl = comb_ssl
 
-        return Holes.ssl.ss_list, Holes.in_genhole_time
+        return syn_ctx.ssl.ss_list, syn_ctx.in_genhole_time
 
     def rep_bug_code(self, bug_code, corr_code, temp_list, const_list, rep_perf_map, timeout=60.0):
 
         start_time = time.process_time()
 
-        Holes.template_list = temp_list
-        Holes.constant_list = const_list
+        # A context of its own, not the one of the thread or task the repair runs in
+        syn_ctx = SynthesisContext()
+        set_syn_ctx(syn_ctx)
+        syn_ctx.template_list = temp_list
+        syn_ctx.constant_list = const_list
 
         rep_func_map = {}
 
@@ -738,7 +587,7 @@ class BlockRepair:
                                     swt_code = "".join(swt_bb_list)
                                     holed_swt_code = add_iil_holes(swt_code)
 
-                                    tr_dict = self.__tester.tv_code(icpl_corr_code + "\n\n" + holed_swt_code, timeout=2)
+                                    tr_dict = self.__tester.tv_code(icpl_corr_code + "\n\n" + holed_swt_code, timeout=2, is_fail_fast=True)
 
                                     if self.__tester.is_pass(tr_dict):
                                         corr_bb_list[k] = swt_bb_list[k]
@@ -762,7 +611,7 @@ class BlockRepair:
                                         block_success = False
 
                                         for task in task_list:
-                                            Holes.init_global_vars()
+                                            syn_ctx.reset()
                                             gc.collect()
 
                                             holed_swt_code = add_holes(swt_code, task, bb_ln_list)
@@ -790,7 +639,7 @@ class BlockRepair:
 
                                                 holed_func_rep_code = add_iil_holes(func_rep_code)
 
-                                                tr_dict = self.__tester.tv_code(icpl_corr_code + "\n\n" + holed_func_rep_code)
+                                                tr_dict = self.__tester.tv_code(icpl_corr_code + "\n\n" + holed_func_rep_code, is_fail_fast=True)
                                                 if self.__tester.is_pass(tr_dict):
                                                     block_success = True
                                                     rep_bb_list, rep_stru_list, rep_indent_list = get_func_cfs(func_rep_code)
@@ -854,144 +703,31 @@ class BlockRepair:
         for code_file_name in os.listdir(code_dir_path):
             code_path = code_dir_path + "/" + code_file_name
 
-            code = ""
-            with open(code_path, "r") as f:
-                code += f.read()
+            mtime = os.path.getmtime(code_path)
+            if code_path in self.__code_map.keys() and self.__code_map[code_path][0] == mtime:
+                code = self.__code_map[code_path][1]
+            else:
+                code = ""
+                with open(code_path, "r") as f:
+                    code += f.read()
 
-            if not syntax_check(code):
+                if syntax_check(code):
+                    code = regularize(code)
+                else:
+                    code = None
+                self.__code_map[code_path] = (mtime, code)
+
+            if code is None:
                 print(code_file_name + ' has syntax errors.')
                 continue
 
-            code = regularize(code)
-
             code_map[code_file_name] = code
         return code_map
 
-    # single function astar refactoring
-    def astar_ol_rfty_func(self, bug_func_code, fname_corrFuncCode, max_step=100):
-        h = []
-        rc_list = []
-
-        bug_cfs_map = get_cfs_map(bug_func_code)
-
-        # build min binary heap
-        for fname, corrCode in fname_corrFuncCode.items():
-            rc = RefactoredCode(corrCode, fname, "")
-            corr_cfs_map = get_cfs_map(corrCode)
-            if cfs_map_equal(bug_cfs_map, corr_cfs_map):
-                rc_list.append(rc)
-            else:
-                d = multi_func_stru_dist(bug_cfs_map, corr_cfs_map)
-                hu = HeapUnit(rc, d)
-                heapq.heappush(h, hu)
-
-        if len(rc_list) > 0:
-            return rc_list
-
-        # heuristic-guided search (astar alg.)
-        step = 0
-        while len(h) > 0 and step < max_step:
-            hu = h[0]
-            rc = hu.rc
-            d = hu.bd
-
-            if d == 0:
-                break
-            else:
-                refactor = astRefactor.Refactor(rc.fname, rc.corr_code)
-                refactors = astRefactor.applyRules(refactor, untilDepth=1, results=[])
-
-                heapq.heappop(h)
-                for refactor in refactors:
-                    for rname in refactor.ruleAppls:
-                        for refactoredCode in refactor.ruleAppls[rname]:
-                            if "    def " in refactoredCode:
-                                continue
-                            elif "\nif " in refactoredCode:
-                                continue
-                            corr_cfs_map = get_cfs_map(refactoredCode)
-                            n_d = multi_func_stru_dist(bug_cfs_map, corr_cfs_map)
-                            if "," in rc.rname:
-                                n_d += len(rc.rname.split(",")) # add previous refactoring times
-
-                            n_rname = rc.rname
-                            if n_rname == "":
-                                n_rname = rname
-                            else:
-                                n_rname += "," + rname
-
-                            n_rc = RefactoredCode(refactoredCode, refactor.fname, n_rname)
-                            n_hu = HeapUnit(n_rc, n_d)
-                            heapq.heappush(h, n_hu)
-                step += 1
-
-        assert (len(h) > 0)
-
-        # collect code candidates
-        best_d = h[0].bd
-        while len(h) > 0:
-            d = h[0].bd
-            rc = h[0].rc
-            if d == best_d:
-                rc_list.append(rc)
-                heapq.heappop(h)
-            else:
-                break
-        return rc_list
-
-    def astar_ol_rfty(self, bug_code, fname_corrCode, max_step=100):
-        # extract func definition from bug code
-        bug_func_map = get_func_map(bug_code)
-        corr_func_list_map = self.__get_corr_func_list_map(fname_corrCode)
-
-        rc_list_map = {}
-        for func_name, bug_func_code in bug_func_map.items():
-            corr_func_code_map = dict(corr_func_list_map[func_name])
-            rc_list = self.astar_ol_rfty_func(bug_func_code, corr_func_code_map, max_step)
-            rc_list_map[func_name] = rc_list
-
-        return rc_list_map
-
-    def astar_get_cls_rc(self, bug_code, rc_list_map):
-        bug_func_map = get_func_map(bug_code)
-
-        code_map = {}
-        file_map = {}
-        rule_map = {}
-        for func_name, bug_func_code in bug_func_map.items():
-            func_rc_list = rc_list_map[func_name]
-            best_func_rc = self.astar_get_cls_func_rc(bug_func_code, func_rc_list)
-
-            code_map[func_name] = best_func_rc.corr_code
-            file_map[func_name] = best_func_rc.fname
-            rule_map[func_name] = best_func_rc.rname
-
-        final_corr_code = "\n\n".join(code_map.values())
-        final_fname = str(file_map)
-        final_rule = str(rule_map)
-        best_rc = RefactoredCode(final_corr_code, final_fname, final_rule)
-
-        return best_rc
-
-    def astar_get_cls_func_rc(self, bug_func_code, rc_list):
-        # choose best one based on ted
-        min_ted, best_rc = None, None
-        for rc in rc_list:
-            if min_ted is None:
-                min_ted = lev_multi_func_code_distance(bug_func_code, rc.corr_code)
-                best_rc = rc
-            else:
-                ted = smt_lev_multi_func_code_distance(bug_func_code, rc.corr_code, min_ted)
-                if ted < min_ted:
-                    min_ted = ted
-                    best_rc = rc
-        return best_rc
-
     def ol_refactoring(self, bug_code, fname_corrCode):
-        refactors = []
+        fname_ruleAppls_list = []
         for fname, corrCode in fname_corrCode.items():
-            refactor = astRefactor.Refactor(fname, corrCode)
-            refactors += astRefactor.applyRules(refactor, untilDepth=1, results=[])
+            fname_ruleAppls_list.append((fname, astRefactor.getRuleAppls(corrCode, self.__rft_cache)))
 
         debug_test = False
 
@@ -999,14 +735,20 @@ class BlockRepair:
         for fname, corrCode in fname_corrCode.items():
             refactoredCodes.append(RefactoredCode(corrCode, fname, "ori"))
 
-        for refactor in refactors:
-            for rname in refactor.ruleAppls:
-                for refactoredCode in refactor.ruleAppls[rname]:
+        # the same code may be refactored from several programs or by several rules
+        seen_code_set = set()
+        for fname, ruleAppls in fname_ruleAppls_list:
+            for rname in ruleAppls:
+                for refactoredCode in ruleAppls[rname]:
+                    if refactoredCode in seen_code_set:
+                        continue
+                    seen_code_set.add(refactoredCode)
+
                     if "    def " in refactoredCode:
                         continue
                     elif "\nif " in refactoredCode:
                         continue
-                    rc = RefactoredCode(refactoredCode, refactor.fname, rname)
+                    rc = RefactoredCode(refactoredCode, fname, rname)
                     if debug_test:
                         tr = self.__tester.tv_code(refactoredCode)
                         if self.__tester.is_pass(tr):
@@ -1053,7 +795,7 @@ class BlockRepair:
             mr = reporter.get_matching_rate(cluster_list_map)
             print("%.4f" % mr)
 
-        sel_code, rules_map, root_file_map = self.sel_corr_code(bug_code, cluster_list_map)
+        sel_code, rules_map, root_file_map = self.sel_corr_code(bug_code, ClusterIndex(cluster_list_map))
 
         fn = str(root_file_map)
         if sel_code in fn_map.keys():
@@ -1189,11 +931,9 @@ class BlockRepair:
         if self.__is_offline_ref:
 
             for pickle_file in os.listdir(self.__pickle_dir_path):
-                status_list = []
-                time_list = []
-                rps_list = []
+                if not (pickle_file.startswith("refactor_sample_") and pickle_file.endswith(".pickle")):
+                    continue
 
-                pickle_path = self.__pickle_dir_path + "/" + pickle_file
                 pf_str = pickle_file[:pickle_file.find(".")]
                 sr = int(pf_str.split("_")[2])
 
@@ -1202,78 +942,15 @@ class BlockRepair:
                 perf_map[sr] = {}
                 perf_map[sr][exp_idx] = {}
 
-                cluster_list_map = {}
-                with open(pickle_path, 'rb') as f:
-                    cluster_list_map, corr_temp_list, corr_const_list, ori_corr_code_list = pickle.load(f)
-
-                fail_list = []
-
-                code_perf_map = {}
-                for bug_file_name, bug_code in buggy_code_map.items():
-                    print(bug_file_name)
-
-
-                    if any(cfs_map_equal(get_cfs_map(bug_code),
-                                         get_cfs_map(ori_corr_code))
-                           for ori_corr_code in ori_corr_code_list):
-                        code_perf_map["match_ori"] = 1
-                    else:
-                        code_perf_map["match_ori"] = 0
-
-                    start_time = time.process_time()
-
-                    rep_perf_map = {}
-
-                    corr_code = ""
-                    try:
-                        if not syntax_check(bug_code):
-                            print("fail_syntax_error")
-                            code_perf_map["status"] = "fail_syntax_error"
-                            perf_map[sr][exp_idx][bug_file_name] = code_perf_map
-                            continue
-
-                        bug_temp_list, bug_const_list = get_temp_cons_lists([bug_code])
-
-                        stru_match_start_time = time.process_time()
-                        corr_code, rules_map, root_file_map = self.sel_corr_code(bug_code, cluster_list_map)
-                        code_perf_map["stru_match_time"] = time.process_time() - stru_match_start_time
+                cluster_index, corr_temp_list, corr_const_list, ori_corr_code_list = self.load_ofl_ref(sr, exp_idx)
 
-                        code_perf_map["rule_name"] = str(rules_map)
-                        code_perf_map["corr_file_name"] = str(root_file_map)
-
-                        self.rep_bug_code(bug_code,
-                                        corr_code,
-                                        corr_temp_list + bug_temp_list,
-                                        corr_const_list + bug_const_list,
-                                        rep_perf_map,
-                                        timeout)
-                    except Exception as e:
-                        rep_perf_map["status"] = "fail_exception"
-
-                    code_perf_map.update(rep_perf_map)
-                    code_perf_map["total_time"] = time.process_time() - start_time
-
-                    status_list.append(code_perf_map["status"])
-                    if "success" in code_perf_map["status"]:
-                        time_list.append(code_perf_map["total_time"])
-
-                        code_perf_map["patch_size"] = zss_multi_func_code_distance(code_perf_map["ori_bug_code"],
-                                                                                   code_perf_map["rep_code"])
-                        # special case in patch size calculation
-                        if code_perf_map["patch_size"] == 0 and code_perf_map["ori_bug_code"] != code_perf_map["rep_code"]:
-                            code_perf_map["patch_size"] = 1
-                        if code_perf_map["bug_ast_size"] == 0:
-                            code_perf_map["bug_ast_size"] = 1
-                        code_perf_map["rps"] = code_perf_map["patch_size"] / code_perf_map["bug_ast_size"]
-                        rps_list.append(code_perf_map["rps"])
-                    else:# fail
-                        fail_list.append(bug_file_name)
-
-                    self.print_perf(bug_file_name, code_perf_map)
-                    perf_map[sr][exp_idx][bug_file_name] = code_perf_map
-
-                self.print_ques_perf(sr, exp_idx, status_list, time_list, rps_list)
-                self.copy_fail_codes(fail_list)
+                rep_file_func = functools.partial(self.__ofl_rep_file,
+                                                  cluster_index=cluster_index,
+                                                  corr_temp_list=corr_temp_list,
+                                                  corr_const_list=corr_const_list,
+                                                  ori_corr_code_list=ori_corr_code_list,
+                                                  timeout=timeout)
+                self.__rep_files(rep_file_func, buggy_code_map, sr, exp_idx, perf_map)
         else:# online or block repair only
             corr_code_map = self.__get_dir_codes(self.__ques_dir_path + "/code/correct")
 
@@ -1298,100 +975,275 @@ class BlockRepair:
                 perf_map[sr] = {}
                 for exp_idx in range(self.__exp_time):
                     perf_map[sr][exp_idx] = {}
-                    status_list = []
-                    time_list = []
-                    rps_list = []
-
-                    fail_list = []
-                    for bug_file_name, bug_code in buggy_code_map.items():
-                        print(bug_file_name)
-                        corr_code = ""
-
-                        code_perf_map = {}
-
-                        sel_corr_code_list = [code for _,code in sel_corr_fn_code_list]
-                        if any(cfs_map_equal(get_cfs_map(bug_code),
-                                             get_cfs_map(ori_corr_code))
-                               for ori_corr_code in sel_corr_code_list):
-                            code_perf_map["match_ori"] = 1
-                        else:
-                            code_perf_map["match_ori"] = 0
 
-                        start_time = time.process_time()
+                    rep_file_func = functools.partial(self.__ol_rep_file,
+                                                      sel_corr_fn_code_list=sel_corr_fn_code_list,
+                                                      corr_temp_list=corr_temp_list,
+                                                      corr_const_list=corr_const_list,
+                                                      timeout=timeout)
+                    self.__rep_files(rep_file_func, buggy_code_map, sr, exp_idx, perf_map)
 
-                        rep_perf_map = {}
-                        try:
-                            if not syntax_check(bug_code):
-                                print("fail_syntax_error")
-                                code_perf_map["status"] = "fail_syntax_error"
-                                perf_map[sr][exp_idx][bug_file_name] = code_perf_map
-                                continue
 
-                            bug_temp_list, bug_const_list = get_temp_cons_lists([bug_code])
+        return perf_map
 
-                            # online refactoring
-                            sel_fn_code_map = dict(sel_corr_fn_code_list)
-                            ol_refactoring_start_time = time.process_time()
+    def load_ofl_ref(self, sr, exp_idx):
+        """Return (cluster_index, temp_list, const_list, corr_code_list) refactored offline,
+            where cluster_index is the ClusterIndex of the cluster_list_map in the pickle file.
+            They are kept in memory until the pickle file changes.
+        """
+        pickle_path = self.__pickle_dir_path + "/refactor_sample_" + str(sr) + "_" + str(exp_idx) + ".pickle"
+        mtime = os.path.getmtime(pickle_path)
+        if pickle_path not in self.__ofl_ref_map.keys() or self.__ofl_ref_map[pickle_path][0] != mtime:
+            with open(pickle_path, 'rb') as f:
+                ofl_ref = pickle.load(f)
+
+            # Pickle files stored before the token ids were added have no token strings
+            cluster_list_map, corr_temp_list, corr_const_list, ori_corr_code_list = ofl_ref[:4]
+            token_str_list = None
+            if len(ofl_ref) > 4:
+                token_str_list = ofl_ref[4]
+
+            self.__ofl_ref_map[pickle_path] = (mtime, (ClusterIndex(cluster_list_map, token_str_list), corr_temp_list,
+                                                       corr_const_list, ori_corr_code_list))
+        return self.__ofl_ref_map[pickle_path][1]
+
+    def ofl_rep_code(self, bug_code, ofl_ref, timeout=60):
+        """Repair a single submission with the programs refactored offline, see load_ofl_ref,
+            and return its code_perf_map
+        """
+        if not syntax_check(bug_code):
+            return {"status": "fail_syntax_error"}
+        bug_code = regularize(bug_code)
+
+        cluster_index, corr_temp_list, corr_const_list, ori_corr_code_list = ofl_ref
+        return self.__ofl_rep_file("submission", bug_code, cluster_index, corr_temp_list,
+                                   corr_const_list, ori_corr_code_list, timeout)
+
+    def __rep_files(self, rep_file_func, buggy_code_map, sr, exp_idx, perf_map):
+        """Repair all buggy files with rep_file_func and merge their results into perf_map,
+            in the order of buggy_code_map whether they are repaired in parallel or not
+        """
+        status_list = []
+        time_list = []
+        rps_list = []
+
+        fail_list = []
+        for bug_file_name, code_perf_map in self.__iter_rep_files(rep_file_func, buggy_code_map):
+            perf_map[sr][exp_idx][bug_file_name] = code_perf_map
+            if code_perf_map["status"] == "fail_syntax_error":
+                continue
 
-                            corr_rc_map = None
-                            if self.__is_online_ref:
-                                corr_rc_map = self.astar_ol_rfty(bug_code, sel_fn_code_map)
-                                code_perf_map["ol_refactoring_time"] = time.process_time() - ol_refactoring_start_time
-                            else:
-                                corr_rc_map = self.astar_ol_rfty(bug_code, sel_fn_code_map, max_step=0)
-                                code_perf_map["ol_refactoring_time"] = 0
-
-                            gcr_start_time = time.process_time()
-                            best_rc = self.astar_get_cls_rc(bug_code, corr_rc_map)
-                            code_perf_map["gcr_time"] = time.process_time() - gcr_start_time
-
-                            corr_code = best_rc.corr_code
-
-                            code_perf_map["corr_file_name"] = best_rc.fname
-                            code_perf_map["rule_name"] = best_rc.rname
-
-                            self.rep_bug_code(bug_code,
-                                                corr_code,
-                                                corr_temp_list + bug_temp_list,
-                                                corr_const_list + bug_const_list,
-                                                rep_perf_map,
-                                                timeout)
-                        except Exception as e:
-                            rep_perf_map["status"] = "fail_exception"
-
-                        code_perf_map.update(rep_perf_map)
-                        code_perf_map["total_time"] = time.process_time() - start_time
-
-                        if code_perf_map["total_time"] > timeout:
-                            code_perf_map["status"] = "fail_timeout"
-
-                        status_list.append(code_perf_map["status"])
-
-                        if "success" in code_perf_map["status"]:
-                            time_list.append(code_perf_map["total_time"])
-                            code_perf_map["patch_size"] = zss_multi_func_code_distance(code_perf_map["ori_bug_code"],
-                                                                                       code_perf_map["rep_code"])
-                            # special case in patch size calculation
-                            if code_perf_map["patch_size"] == 0 and code_perf_map["ori_bug_code"] != code_perf_map["rep_code"]:
-                                code_perf_map["patch_size"] = 1
-                            if code_perf_map["bug_ast_size"] == 0:
-                                code_perf_map["bug_ast_size"] = 1
-
-                            code_perf_map["rps"] = code_perf_map["patch_size"] / code_perf_map["bug_ast_size"]
-                            rps_list.append(code_perf_map["rps"])
-                        else:
-                            fail_list.append(bug_file_name)
+            status_list.append(code_perf_map["status"])
+            if "success" in code_perf_map["status"]:
+                time_list.append(code_perf_map["total_time"])
+                rps_list.append(code_perf_map["rps"])
+            else:
+                fail_list.append(bug_file_name)
+
+            self.print_perf(bug_file_name, code_perf_map)
+
+        self.print_ques_perf(sr, exp_idx, status_list, time_list, rps_list)
+        self.copy_fail_codes(fail_list)
+
+    def __iter_rep_files(self, rep_file_func, buggy_code_map):
+        """Yield (bug_file_name, code_perf_map) in the order of buggy_code_map.
+            With more than one job, the files are repaired by forked processes, each with its own synthesis context.
+        """
+        bug_fn_code_list = list(buggy_code_map.items())
+        if self.__jobs <= 1 or len(bug_fn_code_list) <= 1:
+            for bug_file_name, bug_code in bug_fn_code_list:
+                yield bug_file_name, rep_file_func(bug_file_name, bug_code)
+            return
+
+        global curr_rep_file_func
+
+        mp_ctx = multiprocessing.get_context("fork")
+        result_queue = mp_ctx.Queue()
+
+        # Files are handed out one at a time, so that the file of a worker that dies is known
+        pending_list = list(range(len(bug_fn_code_list)))
+        pending_list.reverse()
+        idle_list = list(range(min(self.__jobs, len(bug_fn_code_list))))
+        busy_map = {}
+
+        code_perf_map_dict = {}
+        next_idx = 0
+        worker_list = []
+        curr_rep_file_func = rep_file_func
+        try:
+            worker_list = [self.__spawn_rep_worker(mp_ctx, w_idx, result_queue) for w_idx in idle_list]
+
+            while next_idx < len(bug_fn_code_list):
+                if next_idx in code_perf_map_dict.keys():
+                    yield bug_fn_code_list[next_idx][0], code_perf_map_dict.pop(next_idx)
+                    next_idx += 1
+                    continue
 
-                        self.print_perf(bug_file_name, code_perf_map)
-                        perf_map[sr][exp_idx][bug_file_name] = code_perf_map
+                while len(pending_list) > 0 and len(idle_list) > 0:
+                    w_idx = idle_list.pop()
+                    idx = pending_list.pop()
+                    worker_list[w_idx][1].put((idx,) + bug_fn_code_list[idx])
+                    busy_map[w_idx] = idx
+
+                # Workers that died before the get below have sent all they will send,
+                # so their files failed once the results in the queue are read
+                dead_list = [w_idx for w_idx in busy_map.keys() if not worker_list[w_idx][0].is_alive()]
+                try:
+                    w_idx, idx, code_perf_map = result_queue.get(timeout=0 if len(dead_list) > 0 else 1)
+                    code_perf_map_dict[idx] = code_perf_map
+                    del busy_map[w_idx]
+                    idle_list.append(w_idx)
+                except queue.Empty:
+                    for w_idx in dead_list:
+                        # The worker died repairing this file, e.g. out of memory
+                        code_perf_map_dict[busy_map.pop(w_idx)] = {"status": "fail_exception"}
+                        worker_list[w_idx][0].join()
+                        worker_list[w_idx] = self.__spawn_rep_worker(mp_ctx, w_idx, result_queue)
+                        idle_list.append(w_idx)
+        finally:
+            curr_rep_file_func = None
+            for p, task_queue in worker_list:
+                if next_idx < len(bug_fn_code_list):
+                    # The results were not all consumed, the worker may still be repairing a file
+                    p.terminate()
+                else:
+                    task_queue.put(None)
+            for p, _ in worker_list:
+                p.join()
+
+    def __spawn_rep_worker(self, mp_ctx, w_idx, result_queue):
+        # Not daemonic, so that the workers can run their own exec pools
+        task_queue = mp_ctx.Queue()
+        p = mp_ctx.Process(target=rep_file_worker, args=(w_idx, task_queue, result_queue))
+        p.start()
+        return p, task_queue
+
+    def __ofl_rep_file(self, bug_file_name, bug_code, cluster_index, corr_temp_list, corr_const_list,
+                       ori_corr_code_list, timeout):
+        print(bug_file_name)
+
+        code_perf_map = {}
+
+        if any(cfs_map_equal(get_cfs_map(bug_code),
+                             get_cfs_map(ori_corr_code))
+               for ori_corr_code in ori_corr_code_list):
+            code_perf_map["match_ori"] = 1
+        else:
+            code_perf_map["match_ori"] = 0
 
-                    self.print_ques_perf(sr, exp_idx, status_list, time_list, rps_list)
-                    self.copy_fail_codes(fail_list)
+        start_time = time.process_time()
 
+        rep_perf_map = {}
 
-        return perf_map
+        corr_code = ""
+        try:
+            if not syntax_check(bug_code):
+                print("fail_syntax_error")
+                code_perf_map["status"] = "fail_syntax_error"
+                return code_perf_map
+
+            bug_temp_list, bug_const_list = get_temp_cons_lists([bug_code])
+
+            stru_match_start_time = time.process_time()
+            corr_code, rules_map, root_file_map = self.sel_corr_code(bug_code, cluster_index)
+            code_perf_map["stru_match_time"] = time.process_time() - stru_match_start_time
+
+            code_perf_map["rule_name"] = str(rules_map)
+            code_perf_map["corr_file_name"] = str(root_file_map)
+
+            self.rep_bug_code(bug_code,
+                            corr_code,
+                            corr_temp_list + bug_temp_list,
+                            corr_const_list + bug_const_list,
+                            rep_perf_map,
+                            timeout)
+        except Exception as e:
+            rep_perf_map["status"] = "fail_exception"
+
+        code_perf_map.update(rep_perf_map)
+        code_perf_map["total_time"] = time.process_time() - start_time
+
+        if "success" in code_perf_map["status"]:
+            self.__set_rps(code_perf_map)
+        return code_perf_map
+
+    def __ol_rep_file(self, bug_file_name, bug_code, sel_corr_fn_code_list, corr_temp_list, corr_const_list,
+                      timeout):
+        print(bug_file_name)
+        corr_code = ""
+
+        code_perf_map = {}
+
+        sel_corr_code_list = [code for _,code in sel_corr_fn_code_list]
+        if any(cfs_map_equal(get_cfs_map(bug_code),
+                             get_cfs_map(ori_corr_code))
+               for ori_corr_code in sel_corr_code_list):
+            code_perf_map["match_ori"] = 1
+        else:
+            code_perf_map["match_ori"] = 0
+
+        start_time = time.process_time()
+
+        rep_perf_map = {}
+        try:
+            if not syntax_check(bug_code):
+                print("fail_syntax_error")
+                code_perf_map["status"] = "fail_syntax_error"
+                return code_perf_map
+
+            bug_temp_list, bug_const_list = get_temp_cons_lists([bug_code])
+
+            # online refactoring
+            sel_fn_code_map = dict(sel_corr_fn_code_list)
+            ol_refactoring_start_time = time.process_time()
+
+            corr_rc_map = None
+            if self.__is_online_ref:
+                corr_rc_map = self.__ol_rft.astar_ol_rfty(bug_code, sel_fn_code_map)
+                code_perf_map["ol_refactoring_time"] = time.process_time() - ol_refactoring_start_time
+            else:
+                corr_rc_map = self.__ol_rft.astar_ol_rfty(bug_code, sel_fn_code_map, max_step=0)
+                code_perf_map["ol_refactoring_time"] = 0
+
+            gcr_start_time = time.process_time()
+            best_rc = self.__ol_rft.astar_get_cls_rc(bug_code, corr_rc_map)
+            code_perf_map["gcr_time"] = time.process_time() - gcr_start_time
+
+            corr_code = best_rc.corr_code
+
+            code_perf_map["corr_file_name"] = best_rc.fname
+            code_perf_map["rule_name"] = best_rc.rname
 
-    def sel_corr_code(self, bug_code, cluster_list_map):
+            self.rep_bug_code(bug_code,
+                                corr_code,
+                                corr_temp_list + bug_temp_list,
+                                corr_const_list + bug_const_list,
+                                rep_perf_map,
+                                timeout)
+        except Exception as e:
+            rep_perf_map["status"] = "fail_exception"
+
+        code_perf_map.update(rep_perf_map)
+        code_perf_map["total_time"] = time.process_time() - start_time
+
+        if code_perf_map["total_time"] > timeout:
+            code_perf_map["status"] = "fail_timeout"
+
+        if "success" in code_perf_map["status"]:
+            self.__set_rps(code_perf_map)
+        return code_perf_map
+
+    def __set_rps(self, code_perf_map):
+        code_perf_map["patch_size"] = zss_multi_func_code_distance(code_perf_map["ori_bug_code"],
+                                                                   code_perf_map["rep_code"])
+        # special case in patch size calculation
+        if code_perf_map["patch_size"] == 0 and code_perf_map["ori_bug_code"] != code_perf_map["rep_code"]:
+            code_perf_map["patch_size"] = 1
+        if code_perf_map["bug_ast_size"] == 0:
+            code_perf_map["bug_ast_size"] = 1
+        code_perf_map["rps"] = code_perf_map["patch_size"] / code_perf_map["bug_ast_size"]
+
+    def sel_corr_code(self, bug_code, cluster_index):
         bug_cfs_map = get_cfs_map(bug_code)
 
         final_code_map = {}
@@ -1400,64 +1252,24 @@ class BlockRepair:
         root_file_map = {}
 
         for func_name in bug_cfs_map.keys():
-            if func_name not in cluster_list_map.keys():
+            if not cluster_index.has_func(func_name):
                 continue
 
             bb_list, stru_list, indent_list = bug_cfs_map[func_name]
 
-            cluster_list = cluster_list_map[func_name]
-            func_code_list = []
-            rules_list = []
-            root_file_list = []
-            for cluster in cluster_list:
-                if len(cluster["stru"]) != len(stru_list):
-                    continue
-
-                if cluster["stru"] == stru_list and \
-                    cluster["indent"] == indent_list:
-
-                    func_code_list = cluster["code"]
-                    rules_list = cluster["rule_id"]
-                    root_file_list = cluster["root_file_name"]
-                    break
-
-            if len(func_code_list) == 0:
-                bug_stru_str = cpr_stru_list(stru_list)
-
-                min_stru_d = sys.maxsize
-                for cluster in cluster_list:
-                    cluster_stru_str = cpr_stru_list(cluster["stru"])
-                    if abs(len(cluster_stru_str) - len(bug_stru_str)) > min_stru_d:
-                        continue
-                    stru_d = Levenshtein.distance(bug_stru_str, cluster_stru_str)
-                    if stru_d < min_stru_d:
-                        min_stru_d = stru_d
-
-                        func_code_list = cluster["code"]
-                        rules_list = cluster["rule_id"]
-                        root_file_list = cluster["root_file_name"]
-
-            min_d = sys.maxsize
             sel_func_code = ""
             sel_rules = ""
             sel_root_file = ""
 
-            token_list_b = get_token_list("".join(bb_list))
-            for i in range(len(func_code_list)):
-                func_code = func_code_list[i]
-                rules = rules_list[i]
-                root_file = root_file_list[i]
-
-                token_list_f = get_token_list(func_code)
-                if abs(len(token_list_b)-len(token_list_f)) > min_d:
-                    continue
+            cluster_idx = cluster_index.get_cluster_idx(func_name, stru_list, indent_list)
+            if cluster_idx is not None:
+                cluster = cluster_index.cluster_list_map[func_name][cluster_idx]
 
-                lev_d = smt_lev_tl_dist(token_list_b, token_list_f, min_d)
-                if lev_d < min_d:
-                    min_d = lev_d
-                    sel_func_code = func_code
-                    sel_rules = rules
-                    sel_root_file = root_file
+                code_idx = cluster_index.get_code_idx(func_name, cluster_idx, get_token_ids("".join(bb_list)))
+                if code_idx is not None:
+                    sel_func_code = cluster["code"][code_idx]
+                    sel_rules = cluster["rule_id"][code_idx]
+                    sel_root_file = cluster["root_file_name"][code_idx]
 
             final_code_map[func_name] = sel_func_code
             rules_map[func_name] = sel_rules
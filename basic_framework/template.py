@@ -5,9 +5,12 @@ from basic_framework.utils import *
 from basic_framework.statement import *
 
 
-def get_temp_cons_lists(corr_code_list):
-    ref_temp_list = []
-    ref_const_list = []
+def get_temp_cons_lists(corr_code_list, ref_temp_list=None, ref_const_list=None):
+    """Extract the templates and constants of corr_code_list, following those of
+        ref_temp_list and ref_const_list if given
+    """
+    ref_temp_list = [] if ref_temp_list is None else list(ref_temp_list)
+    ref_const_list = [] if ref_const_list is None else list(ref_const_list)
 
     
     for corr_code in corr_code_list:
@@ -65,19 +65,19 @@ def perf_to_csv(ques_dir_path, perf_map_dict, online_or_offline):
                     csv_w.writerow(row)
 
 
-def repair_ques(ques_dir_path, is_offline_ref, is_online_ref, is_mutation, sr_list, exp_time):
-    br = BlockRepair(ques_dir_path, is_offline_ref=is_offline_ref, is_online_ref=is_online_ref, is_mutation=is_mutation, sr_list=sr_list, exp_time=exp_time)
+def repair_ques(ques_dir_path, is_offline_ref, is_online_ref, is_mutation, sr_list, exp_time, pool_size=0, is_disk_cache=False, jobs=1):
+    br = BlockRepair(ques_dir_path, is_offline_ref=is_offline_ref, is_online_ref=is_online_ref, is_mutation=is_mutation, sr_list=sr_list, exp_time=exp_time, pool_size=pool_size, is_disk_cache=is_disk_cache, jobs=jobs)
     return br.run()
 
 
-def repair_dataset(data_dir_path, ques_name_list, is_offline_ref, is_online_ref, sr_list, exp_time, is_csv_log, is_mutation):
+def repair_dataset(data_dir_path, ques_name_list, is_offline_ref, is_online_ref, sr_list, exp_time, is_csv_log, is_mutation, pool_size=0, is_disk_cache=False, jobs=1):
     if ques_name_list is None:
         ques_name_list = list(os.listdir(data_dir_path))
 
     for ques_dir_name in ques_name_list:
         ques_dir_path = data_dir_path + "/" + ques_dir_name
 
-        ques_perf_map = repair_ques(ques_dir_path, is_offline_ref, is_online_ref, is_mutation, sr_list, exp_time)
+        ques_perf_map = repair_ques(ques_dir_path, is_offline_ref, is_online_ref, is_mutation, sr_list, exp_time, pool_size, is_disk_cache, jobs)
 
         online_or_offline = None
         if is_online_ref:
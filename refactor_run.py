@@ -6,12 +6,37 @@ import shutil
 import pickle
 import random
 import operator
-from basic_framework.refactoring import Refactoring, Reporter
+from basic_framework.refactoring import RefactoringStore, Reporter, get_rules_hash, get_transition_db_path
+from basic_framework.cache import TransitionCache
 from basic_framework.utils import regularize
 from basic_framework.core_testing import Tester
+from basic_framework.cluster_index import add_cluster_token_ids
 from basic_framework.template import *
 
 
+# ques_dir_path -> TransitionCache, shared by the runs on all sampling rates and experiments of the question
+rft_cache_map = {}
+
+
+def get_rft_cache(ques_dir_path, is_disk_cache):
+    if ques_dir_path not in rft_cache_map.keys():
+        rft_cache_map[ques_dir_path] = TransitionCache(get_rules_hash(),
+                                                       get_transition_db_path(ques_dir_path, is_disk_cache))
+    return rft_cache_map[ques_dir_path]
+
+
+# ques_dir_path -> RefactoringStore, which the runs on all sampling rates and experiments of the question are merged from
+rft_store_map = {}
+
+
+def get_rft_store(ques_dir_path, timeout, max_depth, jobs, is_disk_cache):
+    if ques_dir_path not in rft_store_map.keys():
+        rft_store_map[ques_dir_path] = RefactoringStore(ques_dir_path + "/code/refactor/refactor_store.pickle",
+                                                        timeout, max_depth, jobs,
+                                                        get_rft_cache(ques_dir_path, is_disk_cache))
+    return rft_store_map[ques_dir_path]
+
+
 def shf_corr_path_list(ques_dir_path):
     corr_dir_path = ques_dir_path + "/code/correct"
 
@@ -23,7 +48,7 @@ def shf_corr_path_list(ques_dir_path):
     return corr_path_list
 
 
-def ofl_refactor_ques(ques_dir_path, timeout, max_depth, sampling_rate, exp_idx, is_resume=False, verbose=False):
+def ofl_refactor_ques(ques_dir_path, timeout, max_depth, sampling_rate, exp_idx, is_resume=False, verbose=False, pool_size=0, is_disk_cache=False, jobs=1, is_incremental=False):
 
     print("Current Setting:", ques_dir_path, sampling_rate, exp_idx)
 
@@ -38,6 +63,25 @@ def ofl_refactor_ques(ques_dir_path, timeout, max_depth, sampling_rate, exp_idx,
         if os.path.isfile(pickle_path):
             return
 
+    # incremental refactoring only refactors the correct programs not refactored before
+    ofl_ref = None
+    if is_incremental and os.path.isfile(pickle_path):
+        if sampling_rate == 100:
+            with open(pickle_path, 'rb') as f:
+                ofl_ref = pickle.load(f)
+            if len(ofl_ref) < 6:
+                print("The offline refactoring results do not name their programs, refactor all.")
+                ofl_ref = None
+        else:
+            print("Incremental refactoring only applies to the sampling rate 100, refactor all.")
+
+    old_cluster_list_map, old_temp_list, old_const_list, old_corr_code_list, old_token_str_list = None, None, None, [], None
+    old_corr_file_name_list = []
+    if ofl_ref is not None:
+        old_cluster_list_map, old_temp_list, old_const_list, old_corr_code_list, old_token_str_list, \
+            old_corr_file_name_list = ofl_ref
+    rft_file_name_set = set(old_corr_file_name_list)
+
     corr_dir_path = ques_dir_path + "/code/correct"
     ref_dir_path = ques_dir_path + "/code/reference"
     wrong_dir_path = ques_dir_path + "/code/wrong"
@@ -62,15 +106,21 @@ def ofl_refactor_ques(ques_dir_path, timeout, max_depth, sampling_rate, exp_idx,
         l = len(corr_path_list)
         corr_path_list = corr_path_list[:int(sampling_rate / 100 * l)]
 
+    corr_path_list = [corr_code_path for corr_code_path in corr_path_list
+                      if corr_code_path.split("/")[-1] not in rft_file_name_set]
+
+    ref_file_name_list = [file_name for file_name in os.listdir(ref_dir_path)
+                          if file_name not in rft_file_name_set]
+
     corr_code_map = {}
-    for file_name in os.listdir(ref_dir_path):
+    for file_name in ref_file_name_list:
         ref_code_path = ref_dir_path + "/" + file_name
         with open(ref_code_path, "r") as f:
             ref_code = regularize(f.read())
             corr_code_map[file_name] = ref_code
 
     # test correct programs
-    t = Tester(ques_dir_path)
+    t = Tester(ques_dir_path, pool_size, is_disk_cache)
 
     pseudo_corr_dir_path = ques_dir_path + "/code/pseudo_correct"
     if not os.path.isdir(pseudo_corr_dir_path):
@@ -80,7 +130,7 @@ def ofl_refactor_ques(ques_dir_path, timeout, max_depth, sampling_rate, exp_idx,
         with open(corr_code_path, "r") as f:
             file_name = corr_code_path.split("/")[-1]
             corr_code = regularize(f.read())
-            tr = t.tv_code(corr_code)
+            tr = t.tv_code(corr_code, is_fail_fast=True)
             if t.is_pass(tr):
                 corr_code_map[file_name] = corr_code
             else:
@@ -88,19 +138,28 @@ def ofl_refactor_ques(ques_dir_path, timeout, max_depth, sampling_rate, exp_idx,
                 print(tr)
                 print(corr_code_path)
                 shutil.move(corr_code_path, pseudo_corr_dir_path)
+    t.close()
 
     print(
     	"Filter Pseudo Corr. Code:",
-    	len(corr_path_list) + len(os.listdir(ref_dir_path)),
+    	len(corr_path_list) + len(ref_file_name_list),
     	"->",
     	len(list(corr_code_map.values())))
 
+    if ofl_ref is not None and len(corr_code_map) == 0:
+        print("No new correct program to refactor.")
+        return
+
     assert(len(list(corr_code_map.values())) > 0)
 
-    # offline refactoring
+    # offline refactoring of the programs not refactored for another sample yet,
+    # merged into the clusters refactored before if incremental
     rpt = Reporter(buggy_code_list) # printing logs
-    rft = Refactoring(corr_code_map, timeout, max_depth, rpt)
-    cluster_list_map = rft.ofl_bfs(csv_report=verbose) # offline breadth-first-search
+    rft_store = get_rft_store(ques_dir_path, timeout, max_depth, jobs, is_disk_cache)
+    rft_store.refactor(corr_code_map, rpt, verbose) # offline breadth-first-search of each program
+    print()
+    rft = rft_store.get_refactoring(corr_code_map, old_cluster_list_map, old_corr_code_list)
+    cluster_list_map = rft.cluster_list_map
 
     if verbose:
         # to csv
@@ -110,19 +169,23 @@ def ofl_refactor_ques(ques_dir_path, timeout, max_depth, sampling_rate, exp_idx,
         rft.to_csv(csv_path)
 
     # extract expression templates, for constant repl in block repair
-    corr_code_list = list(corr_code_map.values())
-    temp_list, const_list = get_temp_cons_lists(corr_code_list)
+    temp_list, const_list = get_temp_cons_lists(list(corr_code_map.values()), old_temp_list, old_const_list)
+    corr_code_list = old_corr_code_list + list(corr_code_map.values())
+    corr_file_name_list = old_corr_file_name_list + list(corr_code_map.keys())
+
+    # tokenize refactored correct programs, so that repairs do not have to
+    token_str_list = add_cluster_token_ids(cluster_list_map, old_token_str_list)
 
     # store refacotered correct programs to pickle file
     with open(pickle_path, 'wb') as f:
-        #(cluster_list_map, expression_templates, constant_list)
-        pickle.dump((cluster_list_map, temp_list, const_list, corr_code_list), f, protocol=pickle.HIGHEST_PROTOCOL)
+        #(cluster_list_map, expression_templates, constant_list, correct_code_list, token_strings, correct_file_names)
+        pickle.dump((cluster_list_map, temp_list, const_list, corr_code_list, token_str_list, corr_file_name_list), f, protocol=pickle.HIGHEST_PROTOCOL)
 
 
-def ofl_refactor(data_dir_path, ques_name_list, sampling_rate, exp_idx):
+def ofl_refactor(data_dir_path, ques_name_list, sampling_rate, exp_idx, pool_size=0, is_disk_cache=False, jobs=1, is_incremental=False):
     if ques_name_list is None:
         ques_name_list = list(os.listdir(data_dir_path))
 
     for ques_dir_name in ques_name_list:
         ques_dir_path = data_dir_path + "/" + ques_dir_name
-        ofl_refactor_ques(ques_dir_path, timeout=None, max_depth=2, exp_idx=exp_idx, sampling_rate=sampling_rate)
+        ofl_refactor_ques(ques_dir_path, timeout=None, max_depth=2, exp_idx=exp_idx, sampling_rate=sampling_rate, pool_size=pool_size, is_disk_cache=is_disk_cache, jobs=jobs, is_incremental=is_incremental)
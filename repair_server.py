@@ -0,0 +1,183 @@
+# Developers:   Yang Hu, et al.
+# Email:    huyang0905@gmail.com
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+import traceback
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from basic_framework.engine import RepairEngine
+
+
+# Set up before the workers are forked, which then share the loaded questions
+engine = None
+
+
+def load_engine(data_dir_path, ques_name_list, sr, exp_idx, is_mutation):
+    global engine
+
+    engine = RepairEngine(data_dir_path, is_mutation)
+
+    if ques_name_list is None:
+        ques_name_list = list(os.listdir(data_dir_path))
+
+    for ques_name in ques_name_list:
+        if not os.path.isdir(data_dir_path + "/" + ques_name):
+            print(ques_name + " does not exist.")
+            continue
+
+        try:
+            engine.load_ques(ques_name, sr, exp_idx)
+        except FileNotFoundError:
+            print(ques_name + " has no offline refactoring results, run run.py with -f first.")
+            continue
+        print("Loaded", ques_name)
+
+
+def silence_worker():
+    """Run by each worker process when it starts, so that the repair logs do not flood the server's output"""
+    sys.stdout = open(os.devnull, "w")
+
+
+def repair_submission(ques_name, bug_code, timeout):
+    """Run by a worker process, with the engine it inherited from the server"""
+    return engine.repair(ques_name, bug_code, timeout)
+
+
+class RepairServer:
+    """Serve repair requests, one JSON object per line, e.g.
+        {"question": "question_1", "code": "def search(x, seq): ...", "timeout": 60}
+        and answer each with a JSON line holding the status, the repair and the code_perf_map.
+        Timeouts are capped at max_timeout, which is also the timeout of requests without one.
+        Requests wait in a bounded queue, so that clients are slowed down when the workers are busy.
+    """
+    def __init__(self, worker_num, queue_size, max_timeout=60):
+        self.__worker_num = worker_num
+        self.__queue_size = queue_size
+        self.__max_timeout = max_timeout
+        self.__queue = None
+        self.__executor = None
+
+    def __new_executor(self):
+        # Forked, so that the workers share the questions loaded by the server
+        return ProcessPoolExecutor(self.__worker_num, mp_context=multiprocessing.get_context("fork"),
+                                   initializer=silence_worker)
+
+    async def serve(self, host, port):
+        self.__queue = asyncio.Queue(maxsize=self.__queue_size)
+        self.__executor = self.__new_executor()
+        for _ in range(self.__worker_num):
+            asyncio.ensure_future(self.__consume())
+
+        server = await asyncio.start_server(self.__handle, host, port)
+        print("Serving on " + host + ":" + str(port))
+        async with server:
+            await server.serve_forever()
+
+    async def __handle(self, reader, writer):
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+
+            res = None
+            try:
+                req = json.loads(line)
+                timeout = req.get("timeout", self.__max_timeout)
+                if isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not timeout > 0:
+                    raise ValueError()
+                req["timeout"] = min(timeout, self.__max_timeout)
+                if not isinstance(req["code"], str):
+                    raise ValueError()
+
+                if not engine.has_ques(req["question"]):
+                    res = {"status": "fail_unknown_question"}
+                else:
+                    fut = asyncio.get_running_loop().create_future()
+                    await self.__queue.put((req, fut))
+                    res = await fut
+            except (ValueError, KeyError, TypeError, AttributeError):
+                res = {"status": "fail_bad_request"}
+
+            writer.write((json.dumps(res, default=str) + "\n").encode("utf-8"))
+            await writer.drain()
+        writer.close()
+
+    async def __consume(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            req, fut = await self.__queue.get()
+
+            res = None
+            executor = self.__executor
+            try:
+                code_perf_map = await loop.run_in_executor(executor, repair_submission,
+                                                           req["question"], req["code"], req["timeout"])
+                res = {"status": code_perf_map["status"],
+                       "rep_code": code_perf_map.get("rep_code", ""),
+                       "perf": code_perf_map}
+            except BrokenProcessPool:
+                # A worker died, e.g. out of memory. The other consumers waiting on the same executor
+                # fail as well, only the first of them replaces it.
+                if self.__executor is executor:
+                    executor.shutdown(wait=False)
+                    self.__executor = self.__new_executor()
+                res = {"status": "fail_exception"}
+            except Exception as e:
+                traceback.print_exc(file=sys.stderr)
+                res = {"status": "fail_exception"}
+
+            if not fut.cancelled():
+                fut.set_result(res)
+            self.__queue.task_done()
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data_dir", help="the path of the data directory.",
+                        nargs='?', required=True)
+    parser.add_argument("-q", "--questions", help="a sequence of question names.",
+                        nargs='+', default=None)
+    parser.add_argument("-s", "--sampling_rate", help="the sampling rate of the offline refactoring results to load.",
+                        nargs='?', type=int, default=100)
+    parser.add_argument("-e", "--exp_idx", help="the experiment id of the offline refactoring results to load.",
+                        nargs='?', type=int, default=0)
+    parser.add_argument("-m", "--mutation", help="allow structure mutation.",
+                        action="store_true", default=False)
+    parser.add_argument("-w", "--workers", help="the number of worker processes repairing submissions.",
+                        nargs='?', type=int, default=os.cpu_count())
+    parser.add_argument("-l", "--queue_size", help="the number of requests waiting for a worker before clients are slowed down.",
+                        nargs='?', type=int, default=64)
+    parser.add_argument("-T", "--max_timeout", help="the largest timeout in seconds a request may ask for, also the timeout of requests without one.",
+                        nargs='?', type=float, default=60)
+    parser.add_argument("--host", help="the address to listen on.",
+                        nargs='?', default="127.0.0.1")
+    parser.add_argument("--port", help="the port to listen on.",
+                        nargs='?', type=int, default=8765)
+
+    args = parser.parse_args()
+
+    if args.workers is None or args.workers <= 0:
+        print("Illegal --workers.")
+        exit(0)
+
+    if args.queue_size is None or args.queue_size <= 0:
+        print("Illegal --queue_size.")
+        exit(0)
+
+    if args.max_timeout is None or not args.max_timeout > 0:
+        print("Illegal --max_timeout.")
+        exit(0)
+
+    load_engine(args.data_dir, args.questions, args.sampling_rate, args.exp_idx, args.mutation)
+    if len(engine.get_ques_name_list()) == 0:
+        print("No question loaded.")
+        exit(0)
+
+    rs = RepairServer(args.workers, args.queue_size, args.max_timeout)
+    asyncio.run(rs.serve(args.host, args.port))
@@ -23,6 +23,14 @@ if __name__ == "__main__":
 
     parser.add_argument("-m", "--mutation", help="allow structure mutation.",
                         action="store_true", default=False)
+    parser.add_argument("-p", "--pool_size", help="the number of worker processes running test cases (0 runs them in the main process, no value uses all cores).",
+                        nargs='?', type=int, default=0)
+    parser.add_argument("-t", "--test_cache", help="cache test results and refactoring transitions on disk, in code/refactor of each question.",
+                        action="store_true", default=False)
+    parser.add_argument("-j", "--jobs", help="the number of buggy programs repaired, or of processes refactoring correct programs, in parallel.",
+                        nargs='?', type=int, default=1)
+    parser.add_argument("-i", "--incremental", help="only refactor the correct programs not in the offline refactoring results yet (-f with sampling rate 100).",
+                        action="store_true", default=False)
     parser.add_argument("-c", "--cmb_log", help="combine log files into one.",
                         action="store_true", default=False)
     parser.add_argument("-y", "--oro_json", help="only do only refactoring and store the results.",
@@ -40,6 +48,14 @@ if __name__ == "__main__":
         print("Illegal --exp_num.")
         exit(0)
 
+    if args.pool_size is not None and args.pool_size < 0:
+        print("Illegal --pool_size.")
+        exit(0)
+
+    if args.jobs is None or args.jobs <= 0:
+        print("Illegal --jobs.")
+        exit(0)
+
     if args.offline_refactoring and args.online_refactoring:
         print("-f and -o are mutually exclusive.")
         exit(0)
@@ -55,13 +71,13 @@ if __name__ == "__main__":
     if args.offline_refactoring:
         for sr in sr_list:
             if sr == 0 or sr == 100:  # No repetitions since no real sampling
-                ofl_refactor(args.data_dir, args.questions, sampling_rate=sr, exp_idx=0)
+                ofl_refactor(args.data_dir, args.questions, sampling_rate=sr, exp_idx=0, pool_size=args.pool_size, is_disk_cache=args.test_cache, jobs=args.jobs, is_incremental=args.incremental)
             else:
                 for exp_idx in range(exp_time):  # Number of repetitions, for random sample
-                    ofl_refactor(args.data_dir, args.questions, sampling_rate=sr, exp_idx=exp_idx)
+                    ofl_refactor(args.data_dir, args.questions, sampling_rate=sr, exp_idx=exp_idx, pool_size=args.pool_size, is_disk_cache=args.test_cache, jobs=args.jobs, is_incremental=args.incremental)
 
     if args.block_repair:
-        repair_dataset(args.data_dir, args.questions, args.offline_refactoring, args.online_refactoring, sr_list, exp_time, True, args.mutation)
+        repair_dataset(args.data_dir, args.questions, args.offline_refactoring, args.online_refactoring, sr_list, exp_time, True, args.mutation, args.pool_size, args.test_cache, args.jobs)
 
     if args.cmb_log:
         if args.online_refactoring:
@@ -0,0 +1,64 @@
+import os
+import sys
+import shutil
+import zipfile
+import pytest
+
+repo_dir_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, repo_dir_path)
+
+
+@pytest.fixture(scope="session")
+def data_dir_path(tmp_path_factory):
+    """The questions of data.zip, extracted once"""
+    dir_path = tmp_path_factory.mktemp("data")
+    with zipfile.ZipFile(repo_dir_path + "/data.zip") as z:
+        z.extractall(str(dir_path))
+    return str(dir_path) + "/data"
+
+
+def read_code_map(ques_dir_path, dir_name, cnt=None):
+    """The regularized codes of the first cnt files of code/dir_name, by file name"""
+    from basic_framework.utils import regularize
+
+    dir_path = ques_dir_path + "/code/" + dir_name
+    code_map = {}
+    for file_name in sorted(os.listdir(dir_path))[:cnt]:
+        with open(dir_path + "/" + file_name, "r") as f:
+            code_map[file_name] = regularize(f.read())
+    return code_map
+
+
+@pytest.fixture(scope="session")
+def load_code_map():
+    """read_code_map, for the tests to load programs of the questions"""
+    return read_code_map
+
+
+@pytest.fixture(scope="session")
+def make_ques(data_dir_path, tmp_path_factory):
+    """Return a function copying a question with only the first corr_cnt correct and wrong_cnt wrong programs
+        into a data directory of its own, for the tests that write into the question directory
+    """
+    def copy_ques(ques_name, corr_cnt, wrong_cnt):
+        ques_dir_path = data_dir_path + "/" + ques_name
+        new_ques_dir_path = str(tmp_path_factory.mktemp("data")) + "/" + ques_name
+        shutil.copytree(ques_dir_path, new_ques_dir_path,
+                        ignore=shutil.ignore_patterns("correct", "wrong", "fail", "refactor", "*.csv"))
+        for dir_name, cnt in [("correct", corr_cnt), ("wrong", wrong_cnt)]:
+            os.makedirs(new_ques_dir_path + "/code/" + dir_name)
+            for file_name in sorted(os.listdir(ques_dir_path + "/code/" + dir_name))[:cnt]:
+                shutil.copy(ques_dir_path + "/code/" + dir_name + "/" + file_name,
+                            new_ques_dir_path + "/code/" + dir_name)
+        return new_ques_dir_path
+    return copy_ques
+
+
+@pytest.fixture(scope="session")
+def ofl_ques_dir_path(make_ques):
+    """question_1 with 5 correct and 6 wrong programs, refactored offline with the sampling rate 100"""
+    from refactor_run import ofl_refactor_ques
+
+    ques_dir_path = make_ques("question_1", 5, 6)
+    ofl_refactor_ques(ques_dir_path, timeout=None, max_depth=2, sampling_rate=100, exp_idx=0)
+    return ques_dir_path
@@ -0,0 +1,44 @@
+import ast
+import astunparse
+from basic_framework.refactoring_ast import astRefactor
+from basic_framework.cache import TransitionCache
+
+code = """def search(x, seq):
+    for i in range(len(seq)):
+        if x <= seq[i]:
+            return i
+    return len(seq)
+"""
+
+
+def get_ref_rule_appls(code):
+    """Each rule matched against its own parse, and every replacement unparsed"""
+    ref_rule_appls = {}
+    for r in astRefactor.rule.rules:
+        _, _, repl_nodes = astRefactor.ruleMatcher.matchOrig(ast.parse(code), r)
+        ref_rule_appls[r.name] = [astunparse.unparse(n) for n in repl_nodes]
+    return ref_rule_appls
+
+
+def test_get_rule_appls_drops_repeats():
+    ref_rule_appls = get_ref_rule_appls(code)
+    assert sum(len(new_code_list) for new_code_list in ref_rule_appls.values()) > 0
+
+    seen_code_set = set()
+    exp_rule_appls = {}
+    for rname, new_code_list in ref_rule_appls.items():
+        exp_rule_appls[rname] = []
+        for new_code in new_code_list:
+            if new_code not in seen_code_set:
+                seen_code_set.add(new_code)
+                exp_rule_appls[rname].append(new_code)
+
+    assert astRefactor.getRuleAppls(code) == exp_rule_appls
+
+
+def test_get_rule_appls_cached():
+    rft_cache = TransitionCache("rules")
+    rule_appls = astRefactor.getRuleAppls(code, rft_cache)
+    for rname, new_code_list in rule_appls.items():
+        assert rft_cache.get(rft_cache.get_key(code, rname)) == new_code_list
+    assert astRefactor.getRuleAppls(code, rft_cache) == rule_appls
@@ -0,0 +1,126 @@
+import random
+from basic_framework import cache, core_testing
+from basic_framework.refactoring import Refactoring, get_rules_hash
+
+
+def check_test_result_cache(tr_cache, is_disk, max_size, op_cnt=3000):
+    """Random puts and gets, checked against the last results put for each key,
+        which may only be missing without the disk tier
+    """
+    rnd = random.Random(0)
+    key_list = [tr_cache.get_key("code" + str(i), 2) for i in range(3 * max_size)]
+    last_map = {}
+    for _ in range(op_cnt):
+        key = rnd.choice(key_list)
+        is_fail_fast = rnd.random() < 0.5
+        if rnd.random() < 0.4:
+            tr_dict = {str(j): rnd.random() < 0.7 for j in range(rnd.randint(1, 5))}
+            is_full = rnd.random() < 0.5
+            tr_cache.put(key, tr_dict, is_full)
+            last_map[key] = (dict(tr_dict), is_full)
+            tr_dict.clear()
+        else:
+            tr_dict = tr_cache.get(key, is_fail_fast)
+            if key not in last_map.keys():
+                assert tr_dict is None
+                continue
+
+            exp_tr_dict, is_full = last_map[key]
+            if not (is_full or is_fail_fast):
+                assert tr_dict is None
+            elif is_disk:
+                assert tr_dict == exp_tr_dict
+            else:
+                assert tr_dict is None or tr_dict == exp_tr_dict
+
+            if tr_dict is not None:
+                # A copy, which the caller may change
+                tr_dict["x"] = True
+
+
+def test_test_result_cache_memory():
+    check_test_result_cache(cache.TestResultCache("suite", None, 16), False, 16)
+
+
+def test_test_result_cache_lru():
+    tr_cache = cache.TestResultCache("suite", None, 4)
+    key_list = [tr_cache.get_key("code" + str(i), 2) for i in range(6)]
+    for key in key_list[:4]:
+        tr_cache.put(key, {"001": True}, True)
+    assert tr_cache.get(key_list[0]) == {"001": True}
+
+    # The least recently used are evicted
+    tr_cache.put(key_list[4], {"001": True}, True)
+    tr_cache.put(key_list[5], {"001": False}, False)
+    assert [tr_cache.get(key, True) is not None for key in key_list] == [True, False, False, True, True, True]
+
+
+def test_test_result_cache_disk(tmp_path):
+    db_path = str(tmp_path) + "/test_result.sqlite"
+    tr_cache = cache.TestResultCache("suite", db_path, 16)
+    check_test_result_cache(tr_cache, True, 16)
+
+    # Stored for later runs, but only for the same test suite
+    key = tr_cache.get_key("code0", 2)
+    tr_cache.put(key, {"001": True, "002": False}, True)
+    tr_cache.close()
+    assert cache.TestResultCache("suite", db_path).get(key) == {"001": True, "002": False}
+    assert cache.TestResultCache("suite", db_path).get_key("code0", 2) == key
+    assert cache.TestResultCache("other suite", db_path).get_key("code0", 2) != key
+
+
+def test_tester_cached_results(data_dir_path, load_code_map):
+    ques_dir_path = data_dir_path + "/question_1"
+    code_list = list(load_code_map(ques_dir_path, "correct", 5).values()) + \
+                list(load_code_map(ques_dir_path, "wrong", 5).values())
+
+    t = core_testing.Tester(ques_dir_path)
+    tr_list = [t.tv_code(code) for code in code_list]
+    t.close()
+    assert any(all(tr.values()) for tr in tr_list) and not all(all(tr.values()) for tr in tr_list)
+
+    for is_disk_cache in [False, True, True]:
+        t = core_testing.Tester(ques_dir_path, is_disk_cache=is_disk_cache)
+        for code, tr in zip(code_list, tr_list):
+            for is_fail_fast in [True, False, True, False]:
+                cache_tr = t.tv_code(code, is_fail_fast=is_fail_fast)
+                if is_fail_fast:
+                    # Up to the first failure, in the order of the most failed test cases
+                    assert t.is_pass(cache_tr) == t.is_pass(tr)
+                    assert all(cache_tr[tc_id] == tr[tc_id] for tc_id in cache_tr.keys())
+                else:
+                    assert cache_tr == tr
+        t.close()
+
+
+def test_transition_cache(tmp_path):
+    db_path = str(tmp_path) + "/transition.sqlite"
+    rft_cache = cache.TransitionCache("rules", db_path, 4)
+    key_list = [rft_cache.get_key("code" + str(i), 1) for i in range(8)]
+    for i in range(len(key_list)):
+        rft_cache.put(key_list[i], ["code" + str(i) + "_" + str(j) for j in range(i)])
+    assert rft_cache.get_key("code0", 2) not in key_list
+
+    # Evicted from memory, but stored in the SQLite file for later runs and other rules
+    for rft_cache in [rft_cache, cache.TransitionCache("rules", db_path, 4)]:
+        for i in range(len(key_list)):
+            assert rft_cache.get(key_list[i]) == ["code" + str(i) + "_" + str(j) for j in range(i)]
+    assert cache.TransitionCache("other rules", db_path).get_key("code0", 1) != key_list[0]
+
+    rft_cache = cache.TransitionCache("rules", None, 4)
+    for i in range(len(key_list)):
+        rft_cache.put(key_list[i], [])
+    assert [rft_cache.get(key) is not None for key in key_list] == [False] * 4 + [True] * 4
+
+
+def test_cached_ofl_bfs(data_dir_path, load_code_map, tmp_path):
+    ques_dir_path = data_dir_path + "/question_1"
+    corr_code_map = load_code_map(ques_dir_path, "correct", 6)
+
+    cluster_list_map = Refactoring(corr_code_map, None, 2).ofl_bfs()
+
+    # Cold, warm and from the disk tier alone
+    db_path = str(tmp_path) + "/transition.sqlite"
+    rft_cache = cache.TransitionCache(get_rules_hash(), db_path)
+    for rft_cache in [rft_cache, rft_cache, cache.TransitionCache(get_rules_hash(), db_path, 0)]:
+        assert repr(Refactoring(corr_code_map, None, 2, rft_cache=rft_cache).ofl_bfs()) == repr(cluster_list_map)
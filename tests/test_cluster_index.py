@@ -0,0 +1,132 @@
+import sys
+import copy
+import random
+import Levenshtein
+import pytest
+from basic_framework.cluster_index import BKTree, ClusterIndex, add_cluster_token_ids
+from basic_framework.refactoring import Refactoring
+from basic_framework.distance import cpr_stru_list, get_token_ids, lev_id_dist
+from basic_framework.cfs import get_cfs_map
+from basic_framework.statement import get_token_list
+
+
+def test_bk_tree_nearest():
+    rnd = random.Random(0)
+    s_list = ["".join(rnd.choice("abcd") for _ in range(rnd.randint(0, 8))) for _ in range(300)]
+    bk_tree = BKTree()
+    assert bk_tree.get_nearest_idx("a") is None
+    for idx in range(len(s_list)):
+        bk_tree.add(s_list[idx], idx)
+
+    for _ in range(300):
+        s = "".join(rnd.choice("abcde") for _ in range(rnd.randint(0, 10)))
+        d_list = [Levenshtein.distance(s, t) for t in s_list]
+        assert bk_tree.get_nearest_idx(s) == d_list.index(min(d_list))
+
+
+@pytest.fixture(scope="module")
+def ques_clusters(data_dir_path, load_code_map):
+    """The clusters refactored from programs of question_2, and buggy programs to select from them"""
+    ques_dir_path = data_dir_path + "/question_2"
+    corr_code_map = load_code_map(ques_dir_path, "correct", 12)
+    cluster_list_map = Refactoring(corr_code_map, None, 2).ofl_bfs()
+
+    bug_code_list = []
+    for bug_code in load_code_map(ques_dir_path, "wrong", 150).values():
+        try:
+            get_cfs_map(bug_code)
+        except Exception:
+            continue
+        bug_code_list.append(bug_code)
+    return cluster_list_map, bug_code_list
+
+
+def ref_sel(cluster_list, stru_list, indent_list, token_ids):
+    """Return (cluster idx, code idx) selected by scanning all clusters and codes, as sel_corr_code used to"""
+    sel_cluster_idx = None
+    for i in range(len(cluster_list)):
+        if cluster_list[i]["stru"] == stru_list and cluster_list[i]["indent"] == indent_list:
+            sel_cluster_idx = i
+            break
+
+    if sel_cluster_idx is None:
+        stru_str = cpr_stru_list(stru_list)
+        min_stru_d = sys.maxsize
+        for i in range(len(cluster_list)):
+            stru_d = Levenshtein.distance(stru_str, cpr_stru_list(cluster_list[i]["stru"]))
+            if stru_d < min_stru_d:
+                min_stru_d, sel_cluster_idx = stru_d, i
+
+    min_d, sel_code_idx = sys.maxsize, None
+    code_list = cluster_list[sel_cluster_idx]["code"]
+    for i in range(len(code_list)):
+        d = lev_id_dist(token_ids, get_token_ids(code_list[i]))
+        if d < min_d:
+            min_d, sel_code_idx = d, i
+    return sel_cluster_idx, sel_code_idx
+
+
+def check_sel(cluster_index, cluster_list_map, bug_code_list):
+    sel_cnt, near_cnt = 0, 0
+    for bug_code in bug_code_list:
+        for func_name, (bb_list, stru_list, indent_list) in get_cfs_map(bug_code).items():
+            if func_name not in cluster_list_map.keys():
+                assert not cluster_index.has_func(func_name)
+                continue
+
+            token_ids = get_token_ids("".join(bb_list))
+            ref_cluster_idx, ref_code_idx = ref_sel(cluster_list_map[func_name], stru_list, indent_list, token_ids)
+            cluster_idx = cluster_index.get_cluster_idx(func_name, stru_list, indent_list)
+            assert cluster_idx == ref_cluster_idx
+            assert cluster_index.get_code_idx(func_name, cluster_idx, token_ids) == ref_code_idx
+
+            sel_cnt += 1
+            near_cnt += cluster_list_map[func_name][cluster_idx]["stru"] != stru_list
+    # Both exact and nearest structures are selected
+    assert sel_cnt > near_cnt > 0
+
+
+def test_cluster_index_sel(ques_clusters):
+    cluster_list_map, bug_code_list = ques_clusters
+    check_sel(ClusterIndex(cluster_list_map), cluster_list_map, bug_code_list)
+
+
+def check_token_ids(cluster_list_map, token_str_list):
+    for cluster_list in cluster_list_map.values():
+        for cluster in cluster_list:
+            assert len(cluster["token_ids"]) == len(cluster["code"])
+            for code, local_ids in zip(cluster["code"], cluster["token_ids"]):
+                assert [token_str_list[local_id] for local_id in local_ids] == \
+                       [token.string for token in get_token_list(code)]
+
+
+def test_cluster_token_ids(ques_clusters):
+    cluster_list_map, bug_code_list = ques_clusters
+    cluster_list_map = copy.deepcopy(cluster_list_map)
+    token_str_list = add_cluster_token_ids(cluster_list_map)
+    check_token_ids(cluster_list_map, token_str_list)
+    check_sel(ClusterIndex(cluster_list_map, token_str_list), cluster_list_map, bug_code_list)
+
+
+def test_cluster_token_ids_incremental(ques_clusters):
+    cluster_list_map, _ = ques_clusters
+
+    # Half of the codes of each cluster first, as stored by an earlier incremental run
+    part_cluster_list_map = copy.deepcopy(cluster_list_map)
+    for cluster_list in part_cluster_list_map.values():
+        for cluster in cluster_list:
+            cluster["code"] = cluster["code"][:len(cluster["code"]) // 2]
+    token_str_list = add_cluster_token_ids(part_cluster_list_map)
+    part_token_ids_map = {func_name: [list(cluster["token_ids"]) for cluster in cluster_list]
+                          for func_name, cluster_list in part_cluster_list_map.items()}
+
+    for func_name, cluster_list in part_cluster_list_map.items():
+        for cluster, full_cluster in zip(cluster_list, cluster_list_map[func_name]):
+            cluster["code"] = list(full_cluster["code"])
+    token_str_list = add_cluster_token_ids(part_cluster_list_map, token_str_list)
+    check_token_ids(part_cluster_list_map, token_str_list)
+
+    # The ids stored before are kept
+    for func_name, cluster_list in part_cluster_list_map.items():
+        for cluster, part_token_ids in zip(cluster_list, part_token_ids_map[func_name]):
+            assert cluster["token_ids"][:len(part_token_ids)] == part_token_ids
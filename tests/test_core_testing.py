@@ -0,0 +1,87 @@
+import sys
+import subprocess
+import pytest
+from basic_framework import core_testing
+from basic_framework.holes import Holes
+
+
+def ref_is_output_equal(real_output, exp_output):
+    """The comparison of the printed outputs the value comparison replaced, except that
+        two outputs that cannot be evaluated used to be equal
+    """
+    if real_output == exp_output:
+        return True
+
+    if "{" in real_output and "{" in exp_output:
+        a, b = None, None
+        try:
+            a = eval(real_output.strip())
+        except:
+            pass
+        try:
+            b = eval(exp_output.strip())
+        except:
+            pass
+        return a is not None and a == b
+    return False
+
+
+def ref_is_pass(entry_code, exp_output_str, real_value, real_output):
+    """Print the value as the entry code used to be, only a list and a tuple with the same items
+        returned without printing anything are equal as well
+    """
+    if "print(" not in entry_code:
+        if real_output == "" and Holes.is_object_equal(real_value, eval(exp_output_str)):
+            return True
+        real_output += str(real_value) + "\n"
+    return ref_is_output_equal(real_output, str(eval(exp_output_str)) + "\n")
+
+
+value_list = [0, 1, -1, 1.0, True, None, "", "a", "1", [], (), [1, 2], (1, 2), [(1, 2)], [[1], 2],
+              {}, {"a": 1}, {"a": 1, "b": [1, 2]}, {1, 2}, {1: 2}, "{'a': 1}", "{bad"]
+
+
+@pytest.mark.parametrize("entry_code", ["f(x)\n", "print(f(x))\n"])
+@pytest.mark.parametrize("exp_value", value_list)
+def test_is_pass_matches_printed_output(entry_code, exp_value):
+    exp_output_str = repr(exp_value)
+    tc = core_testing.TestCase("001", entry_code, exp_output_str)
+    for value in value_list:
+        # An entry code that prints returns None, its printed output holds the value
+        real_value = None if "print(" in entry_code else value
+        for real_output in ["", str(value) + "\n", "x\n" + str(value) + "\n"]:
+            assert tc.is_pass(real_value, real_output) == \
+                   ref_is_pass(entry_code, exp_output_str, real_value, real_output)
+
+
+def run_ref(code, entry_code, timeout=2):
+    """The output of printing the entry code after code in a separate process, None on a timeout"""
+    if "print(" not in entry_code:
+        entry_code = "print(" + entry_code.strip() + ")\n"
+    try:
+        return subprocess.run([sys.executable, "-c", code + "\n" + entry_code], stdout=subprocess.PIPE,
+                              stderr=subprocess.DEVNULL, timeout=timeout, universal_newlines=True).stdout
+    except subprocess.TimeoutExpired:
+        return None
+
+
+def test_tv_code_matches_printed_output(data_dir_path, load_code_map):
+    ques_dir_path = data_dir_path + "/question_1"
+    t = core_testing.Tester(ques_dir_path)
+
+    code_list = list(load_code_map(ques_dir_path, "correct", 3).values()) + \
+                list(load_code_map(ques_dir_path, "wrong", 12).values())
+
+    ans_dir_path = ques_dir_path + "/ans"
+    for code in code_list:
+        tr = t.tv_code(code)
+        for tc_id, is_tc_pass in tr.items():
+            with open(ans_dir_path + "/input_" + tc_id + ".txt", "r") as f:
+                entry_code = f.read()
+            with open(ans_dir_path + "/output_" + tc_id + ".txt", "r") as f:
+                exp_output = str(eval(f.read().strip())) + "\n"
+
+            real_output = run_ref(code, entry_code)
+            if real_output is not None:
+                assert is_tc_pass == ref_is_output_equal(real_output, exp_output)
+    t.close()
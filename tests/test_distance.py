@@ -0,0 +1,49 @@
+import random
+import pytest
+from basic_framework.distance import lev_id_dist, band_lev_id_dist
+
+
+def ref_lev_dist(ids_a, ids_b):
+    """Levenshtein distance by the full dynamic programming table"""
+    prev = list(range(len(ids_b) + 1))
+    for i in range(1, len(ids_a) + 1):
+        cur = [i] + [0] * len(ids_b)
+        for j in range(1, len(ids_b) + 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ids_a[i - 1] != ids_b[j - 1]))
+        prev = cur
+    return prev[len(ids_b)]
+
+
+def get_rand_pair(rnd, max_len):
+    ids_a = tuple(rnd.randrange(4) for _ in range(rnd.randint(0, max_len)))
+    if rnd.random() < 0.5:
+        return ids_a, tuple(rnd.randrange(4) for _ in range(rnd.randint(0, max_len)))
+
+    # A few edits away, so that distances fall within small limits
+    ids_b = list(ids_a)
+    for _ in range(rnd.randint(0, 6)):
+        k = rnd.randint(0, len(ids_b))
+        op = rnd.randrange(3)
+        if op == 0:
+            ids_b.insert(k, rnd.randrange(4))
+        elif k < len(ids_b):
+            if op == 1:
+                del ids_b[k]
+            else:
+                ids_b[k] = rnd.randrange(4)
+    return ids_a, tuple(ids_b)
+
+
+@pytest.mark.parametrize("max_len", [5, 70, 300])
+def test_lev_id_dist(max_len):
+    rnd = random.Random(max_len)
+    for _ in range(300 if max_len < 300 else 60):
+        ids_a, ids_b = get_rand_pair(rnd, max_len)
+        d = ref_lev_dist(ids_a, ids_b)
+        assert lev_id_dist(ids_a, ids_b) == d
+
+        # Distances beyond the limit are cut off to limit + 1
+        for limit in [0, 1, 2, 3, 5, 8, d - 1, d, d + 1]:
+            if limit >= 0:
+                assert lev_id_dist(ids_a, ids_b, limit) == min(d, limit + 1)
+                assert band_lev_id_dist(ids_a, ids_b, limit) == min(d, limit + 1)
@@ -0,0 +1,31 @@
+import os
+import pickle
+from basic_framework import engine, repair
+from basic_framework.engine import RepairEngine
+
+
+def test_load_once(ofl_ques_dir_path, load_code_map, monkeypatch):
+    cnt_map = {"load": 0, "init": 0}
+    pickle_load = pickle.load
+    block_repair_init = repair.BlockRepair.__init__
+
+    def pickle_load_hook(f):
+        cnt_map["load"] += 1
+        return pickle_load(f)
+
+    def block_repair_init_hook(self, *args, **kwargs):
+        cnt_map["init"] += 1
+        block_repair_init(self, *args, **kwargs)
+    monkeypatch.setattr(repair.pickle, "load", pickle_load_hook)
+    monkeypatch.setattr(engine.BlockRepair, "__init__", block_repair_init_hook)
+
+    rep_engine = RepairEngine(os.path.dirname(ofl_ques_dir_path))
+    rep_engine.load_ques("question_1")
+    assert rep_engine.get_ques_name_list() == ["question_1"]
+    assert cnt_map == {"load": 1, "init": 1}
+
+    # Both submissions are repaired with what was loaded for the question
+    bug_code_list = list(load_code_map(ofl_ques_dir_path, "wrong", 2).values())
+    status_list = [rep_engine.repair("question_1", bug_code, 10)["status"] for bug_code in bug_code_list]
+    assert status_list == ["success_wo_mut"] * 2
+    assert cnt_map == {"load": 1, "init": 1}
@@ -0,0 +1,101 @@
+import time
+import multiprocessing
+import pytest
+from basic_framework import core_testing
+from basic_framework.exec import ExecPool, compile_code, compile_program
+
+code = """import os
+import time
+
+def f(x):
+    if x == "loop":
+        while True:
+            pass
+    elif x == "sleep":
+        time.sleep(2)
+    elif x == "exit":
+        exit()
+    elif x == "os_exit":
+        os._exit(0)
+    elif x == "fail":
+        return None
+    return x
+"""
+
+tc_map = {x: core_testing.TestCase(x, "f('" + x + "')\n", "'" + x + "'")
+          for x in ["a", "b", "c", "loop", "sleep", "exit", "os_exit", "fail"]}
+
+
+@pytest.fixture
+def prog():
+    return compile_program(code, compile_code(""), compile_code(""))
+
+
+@pytest.fixture
+def exec_pool():
+    exec_pool = ExecPool(2, tc_map)
+    yield exec_pool
+    exec_pool.close()
+
+
+def get_pid_list(exec_pool):
+    return [p.pid for p, _ in exec_pool._ExecPool__worker_list]
+
+
+def test_timeout_kill(prog, exec_pool):
+    pid_list = get_pid_list(exec_pool)
+    start_time = time.monotonic()
+    assert exec_pool.run_program_list(prog, ["a", "loop", "b"], 0.5) == [True, False, True]
+    assert time.monotonic() - start_time < 2
+
+    # Only the worker running the loop was killed and replaced
+    new_pid_list = get_pid_list(exec_pool)
+    assert sum(pid != new_pid for pid, new_pid in zip(pid_list, new_pid_list)) == 1
+    assert exec_pool.run_program_list(prog, ["a", "b", "c", "a"], 1) == [True] * 4
+    assert get_pid_list(exec_pool) == new_pid_list
+
+
+@pytest.mark.parametrize("tc_id", ["exit", "os_exit"])
+def test_exit_respawn(prog, exec_pool, tc_id):
+    pid_list = get_pid_list(exec_pool)
+    assert exec_pool.run_program_list(prog, [tc_id, "a", tc_id, "b", "c"], 1) == [False, True, False, True, True]
+    assert get_pid_list(exec_pool) != pid_list
+    assert exec_pool.run_program_list(prog, ["a", "b", "c", "a"], 1) == [True] * 4
+
+
+def test_fail_fast_stop(prog, exec_pool):
+    start_time = time.monotonic()
+    tr_list = exec_pool.run_program_list(prog, ["sleep", "fail", "sleep", "a", "b"], 5,
+                                         lambda j_idx, is_tc_pass: not is_tc_pass)
+
+    # The sleeping test case in flight is abandoned, and the test cases left are not dispatched
+    assert tr_list == [None, False, None, None, None]
+    assert time.monotonic() - start_time < 1.5
+    assert exec_pool.run_program_list(prog, ["a", "b", "c"], 1) == [True] * 3
+
+
+def run_in_child(exec_pool, prog, queue):
+    queue.put((exec_pool.run_program_list(prog, ["a", "loop", "b", "c"], 0.5), exec_pool.get_pool_size()))
+    exec_pool.close()
+
+
+def test_forked_pool(prog):
+    exec_pool = ExecPool(4, tc_map, jobs=2)
+    pid_list = get_pid_list(exec_pool)
+
+    # A forked job starts its own share of the workers
+    mp_ctx = multiprocessing.get_context("fork")
+    queue = mp_ctx.Queue()
+    p_list = [mp_ctx.Process(target=run_in_child, args=(exec_pool, prog, queue)) for _ in range(2)]
+    for p in p_list:
+        p.start()
+    res_list = [queue.get(timeout=30) for _ in p_list]
+    for p in p_list:
+        p.join()
+    assert res_list == [([True, False, True, True], 2)] * 2
+
+    # The workers of the parent are left alone
+    assert exec_pool.get_pool_size() == 4
+    assert exec_pool.run_program_list(prog, ["a", "b", "c", "a"], 1) == [True] * 4
+    assert get_pid_list(exec_pool) == pid_list
+    exec_pool.close()
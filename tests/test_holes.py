@@ -0,0 +1,56 @@
+import asyncio
+import threading
+from basic_framework.holes import SynthesisContext, get_syn_ctx, set_syn_ctx
+
+
+def synthesize(name, barrier):
+    """Fill the synthesis state, wait for the others to fill theirs, and return what is left of it"""
+    set_syn_ctx(SynthesisContext())
+    syn_ctx = get_syn_ctx()
+    syn_ctx.vari_hist[name] = [name]
+    syn_ctx.ssl.add_ss(name)
+    barrier()
+    syn_ctx = get_syn_ctx()
+    return syn_ctx.vari_hist, syn_ctx.ssl.get_ss_list()
+
+
+def test_threads_keep_separate_contexts():
+    outer_syn_ctx = get_syn_ctx()
+    barrier = threading.Barrier(2)
+    res_map = {}
+
+    def run(name):
+        res_map[name] = synthesize(name, barrier.wait)
+
+    t_list = [threading.Thread(target=run, args=(name,)) for name in ["a", "b"]]
+    for t in t_list:
+        t.start()
+    for t in t_list:
+        t.join()
+
+    assert res_map == {"a": ({"a": ["a"]}, ["a"]), "b": ({"b": ["b"]}, ["b"])}
+    assert get_syn_ctx() is outer_syn_ctx
+
+
+def test_tasks_keep_separate_contexts():
+    async def run_all():
+        # Tasks created after the context of the caller was set share it until they set their own
+        outer_syn_ctx = get_syn_ctx()
+        assert await asyncio.create_task(asyncio.sleep(0, get_syn_ctx())) is outer_syn_ctx
+
+        event = asyncio.Event()
+
+        async def run(name):
+            vari_hist, ss_list = synthesize(name, lambda: None)
+            await event.wait()
+            syn_ctx = get_syn_ctx()
+            return vari_hist is syn_ctx.vari_hist, vari_hist, ss_list
+
+        task_list = [asyncio.create_task(run(name)) for name in ["a", "b"]]
+        await asyncio.sleep(0)
+        event.set()
+        res_list = await asyncio.gather(*task_list)
+        assert get_syn_ctx() is outer_syn_ctx
+        return res_list
+
+    assert asyncio.run(run_all()) == [(True, {"a": ["a"]}, ["a"]), (True, {"b": ["b"]}, ["b"])]
@@ -0,0 +1,147 @@
+import pytest
+from basic_framework.online_refactoring import OnlineRefactoring, get_cfs_stru_key, get_corr_func_list_map
+from basic_framework.refactoring_ast import astRefactor
+from basic_framework.distance import multi_func_stru_dist_list, get_stru_str_map
+from basic_framework.cfs import get_cfs_map, get_func_map
+
+
+@pytest.fixture(scope="module")
+def ques_funcs(data_dir_path, load_code_map):
+    """The functions of correct programs of question_2, and the buggy functions to refactor them towards"""
+    ques_dir_path = data_dir_path + "/question_2"
+    corr_func_list_map = get_corr_func_list_map(load_code_map(ques_dir_path, "correct", 8))
+
+    bug_func_list = []
+    for bug_code in load_code_map(ques_dir_path, "wrong", 40).values():
+        try:
+            bug_func_map = get_func_map(bug_code)
+            get_cfs_map(bug_code)
+        except Exception:
+            continue
+        bug_func_list.extend((func_name, bug_func_code) for func_name, bug_func_code in bug_func_map.items()
+                             if func_name in corr_func_list_map.keys())
+    return corr_func_list_map, bug_func_list
+
+
+def get_stru_key(code):
+    return get_cfs_stru_key(get_cfs_map(code))
+
+
+def is_reachable(rc, fname_corrFuncCode):
+    """Whether applying the rules of rc in turn to its correct code can give its code"""
+    code_set = {fname_corrFuncCode[rc.fname]}
+    if rc.rname != "":
+        for rname in rc.rname.split(","):
+            code_set = {new_code for code in code_set
+                        for new_code in astRefactor.getRuleAppls(code).get(rname, [])}
+    return rc.corr_code in code_set
+
+
+def test_astar_closed_set(ques_funcs, monkeypatch):
+    corr_func_list_map, bug_func_list = ques_funcs
+
+    called_code_list = []
+    get_rule_appls = astRefactor.getRuleAppls
+
+    def get_rule_appls_hook(code, transitionCache=None):
+        called_code_list.append(code)
+        return get_rule_appls(code, transitionCache)
+    monkeypatch.setattr(astRefactor, "getRuleAppls", get_rule_appls_hook)
+
+    search_cnt = 0
+    for func_name, bug_func_code in bug_func_list[::3]:
+        fname_corrFuncCode = dict(corr_func_list_map[func_name])
+        called_code_list.clear()
+        rc_list, step = OnlineRefactoring().astar_ol_rfty_func(bug_func_code, fname_corrFuncCode, 10)
+        expanded_code_list = list(called_code_list)
+
+        # Each structure is expanded once, within the budget
+        assert step == len(expanded_code_list) <= 10
+        assert len({get_stru_key(code) for code in expanded_code_list}) == step
+        search_cnt += step > 0
+
+        # The codes with the least distance of all the codes reached
+        bug_stru_str_map = get_stru_str_map(get_cfs_map(bug_func_code))
+        code_set = set(fname_corrFuncCode.values())
+        for code in expanded_code_list:
+            code_set.update(new_code for new_code_list in astRefactor.getRuleAppls(code).values()
+                            for new_code in new_code_list
+                            if "    def " not in new_code and "\nif " not in new_code)
+        min_d = min(multi_func_stru_dist_list(bug_stru_str_map,
+                                              [get_stru_str_map(get_cfs_map(code)) for code in code_set]))
+        d_list = multi_func_stru_dist_list(bug_stru_str_map,
+                                           [get_stru_str_map(get_cfs_map(rc.corr_code)) for rc in rc_list])
+        assert d_list == [min_d] * len(rc_list)
+        for rc in rc_list:
+            assert is_reachable(rc, fname_corrFuncCode)
+    assert search_cnt > 0
+
+
+def get_rc_tuple_list(rc_list):
+    return [(rc.corr_code, rc.fname, rc.rname) for rc in rc_list]
+
+
+def test_shared_graph(ques_funcs):
+    corr_func_list_map, bug_func_list = ques_funcs
+
+    ol_rft = OnlineRefactoring()
+    lookup_cnt = 0
+    for func_name, bug_func_code in bug_func_list:
+        # Several selections of the correct functions, as for different submissions
+        for corr_func_list in [corr_func_list_map[func_name], corr_func_list_map[func_name][::2]]:
+            fname_corrFuncCode = dict(corr_func_list)
+            rc_list, step = ol_rft.astar_ol_rfty_func(bug_func_code, fname_corrFuncCode, 10)
+            fresh_rc_list, fresh_step = OnlineRefactoring().astar_ol_rfty_func(bug_func_code, fname_corrFuncCode, 10)
+
+            if step > 0 or fresh_step == 0:
+                assert step == fresh_step
+                assert get_rc_tuple_list(rc_list) == get_rc_tuple_list(fresh_rc_list)
+            else:
+                # Looked up: codes of the same structure, reached from the selected functions
+                lookup_cnt += 1
+                bug_stru_key = get_stru_key(bug_func_code)
+                for rc in rc_list:
+                    assert get_stru_key(rc.corr_code) == bug_stru_key
+                    assert is_reachable(rc, fname_corrFuncCode)
+    assert lookup_cnt > 0
+
+
+def test_lookup_without_steps(ques_funcs):
+    corr_func_list_map, bug_func_list = ques_funcs
+
+    ol_rft = OnlineRefactoring()
+    lookup_cnt = 0
+    for func_name, bug_func_code in bug_func_list:
+        fname_corrFuncCode = dict(corr_func_list_map[func_name])
+        bug_stru_key = get_stru_key(bug_func_code)
+        rc_list, step = ol_rft.astar_ol_rfty_func(bug_func_code, fname_corrFuncCode, 10)
+        if step == 0 or get_stru_key(rc_list[0].corr_code) != bug_stru_key:
+            continue
+
+        # A function whose share of the steps is used up still finds the structure reached before
+        lookup_cnt += 1
+        rc_list, step = ol_rft.astar_ol_rfty_func(bug_func_code, fname_corrFuncCode, 0)
+        assert step == 0 and len(rc_list) > 0
+        assert all(get_stru_key(rc.corr_code) == bug_stru_key for rc in rc_list)
+
+        # Unless online refactoring is disabled
+        rc_list, _ = ol_rft.astar_ol_rfty_func(bug_func_code, fname_corrFuncCode, 0, False)
+        assert all(rc.rname == "" for rc in rc_list)
+    assert lookup_cnt > 0
+
+
+def test_bounded_graph(ques_funcs):
+    corr_func_list_map, bug_func_list = ques_funcs
+
+    ol_rft = OnlineRefactoring(max_size=16)
+    for func_name, bug_func_code in bug_func_list[::4]:
+        fname_corrFuncCode = dict(corr_func_list_map[func_name])
+        rc_list, step = ol_rft.astar_ol_rfty_func(bug_func_code, fname_corrFuncCode, 10, False)
+        fresh_rc_list, fresh_step = OnlineRefactoring().astar_ol_rfty_func(bug_func_code, fname_corrFuncCode, 10, False)
+        assert step == fresh_step
+        assert get_rc_tuple_list(rc_list) == get_rc_tuple_list(fresh_rc_list)
+
+    # Only the most recently used codes and structures are kept
+    assert ol_rft._OnlineRefactoring__get_node.cache_info().currsize <= 16
+    assert ol_rft._OnlineRefactoring__get_succ_list.cache_info().currsize <= 16
+    assert len(ol_rft._OnlineRefactoring__stru_rc_map) <= 16
@@ -0,0 +1,98 @@
+import os
+import pickle
+import random
+import shutil
+import pytest
+import refactor_run
+from basic_framework import core_testing
+from basic_framework.refactoring import RefactoringStore
+
+
+def load_ofl_ref(ques_dir_path):
+    with open(ques_dir_path + "/code/refactor/refactor_sample_100_0.pickle", "rb") as f:
+        return pickle.load(f)
+
+
+def get_cluster_key(cluster_list_map):
+    """The codes of each cluster with their root files, regardless of the order they were merged in"""
+    return {func_name: {(tuple(cluster["stru"]), tuple(cluster["indent"])):
+                        sorted(zip(cluster["code"], cluster["root_file_name"]))
+                        for cluster in cluster_list}
+            for func_name, cluster_list in cluster_list_map.items()}
+
+
+@pytest.fixture
+def ofl_call_list(monkeypatch):
+    """The programs tested and refactored by ofl_refactor_ques, which takes the correct programs in file name order"""
+    monkeypatch.setattr(random, "shuffle", list.sort)
+
+    call_list = []
+    tv_code = core_testing.Tester.tv_code
+    store_refactor = RefactoringStore.refactor
+
+    def tv_code_hook(self, code, *args, **kwargs):
+        call_list.append(("test", code))
+        return tv_code(self, code, *args, **kwargs)
+
+    def store_refactor_hook(self, corr_code_map, *args, **kwargs):
+        call_list.extend(("refactor", file_name) for file_name in corr_code_map.keys())
+        return store_refactor(self, corr_code_map, *args, **kwargs)
+    monkeypatch.setattr(core_testing.Tester, "tv_code", tv_code_hook)
+    monkeypatch.setattr(RefactoringStore, "refactor", store_refactor_hook)
+    return call_list
+
+
+@pytest.mark.parametrize("ofl_ref_len", [6, 5, 4])
+def test_incremental(make_ques, load_code_map, ofl_call_list, ofl_ref_len):
+    full_ques_dir_path = make_ques("question_1", 8, 2)
+    refactor_run.ofl_refactor_ques(full_ques_dir_path, None, 2, 100, 0)
+    full_ofl_ref = load_ofl_ref(full_ques_dir_path)
+
+    # Refactor the first 5 correct programs, then add the others
+    ques_dir_path = make_ques("question_1", 5, 2)
+    refactor_run.ofl_refactor_ques(ques_dir_path, None, 2, 100, 0)
+    if ofl_ref_len < 6:
+        # As stored before the file names, and the clusters' token ids, were
+        ofl_ref = load_ofl_ref(ques_dir_path)[:ofl_ref_len]
+        if ofl_ref_len < 5:
+            for cluster_list in ofl_ref[0].values():
+                for cluster in cluster_list:
+                    del cluster["token_ids"]
+        with open(ques_dir_path + "/code/refactor/refactor_sample_100_0.pickle", "wb") as f:
+            pickle.dump(ofl_ref, f)
+
+    corr_dir_path = full_ques_dir_path + "/code/correct"
+    new_file_name_list = sorted(os.listdir(corr_dir_path))[5:]
+    for file_name in new_file_name_list:
+        shutil.copy(corr_dir_path + "/" + file_name, ques_dir_path + "/code/correct")
+    ofl_call_list.clear()
+    refactor_run.ofl_refactor_ques(ques_dir_path, None, 2, 100, 0, is_incremental=True)
+
+    # Only the programs added are tested and refactored, all of them if the results do not name their programs
+    test_file_name_list = new_file_name_list
+    store_file_name_list = new_file_name_list
+    if ofl_ref_len < 6:
+        test_file_name_list = sorted(os.listdir(corr_dir_path))
+        store_file_name_list = ["reference.py"] + test_file_name_list
+    new_code_map = load_code_map(ques_dir_path, "correct")
+    assert ofl_call_list == [("test", new_code_map[file_name]) for file_name in test_file_name_list] + \
+                             [("refactor", file_name) for file_name in store_file_name_list]
+
+    # into the same results as refactoring all of them
+    ofl_ref = load_ofl_ref(ques_dir_path)
+    assert len(ofl_ref) == 6
+    assert get_cluster_key(ofl_ref[0]) == get_cluster_key(full_ofl_ref[0])
+    assert ofl_ref[1:4] == full_ofl_ref[1:4]
+    assert sorted(ofl_ref[4]) == sorted(full_ofl_ref[4])
+    assert ofl_ref[5] == full_ofl_ref[5]
+
+
+def test_incremental_nothing_new(make_ques, ofl_call_list):
+    ques_dir_path = make_ques("question_1", 5, 2)
+    refactor_run.ofl_refactor_ques(ques_dir_path, None, 2, 100, 0)
+    ofl_ref = load_ofl_ref(ques_dir_path)
+
+    ofl_call_list.clear()
+    refactor_run.ofl_refactor_ques(ques_dir_path, None, 2, 100, 0, is_incremental=True)
+    assert ofl_call_list == []
+    assert repr(load_ofl_ref(ques_dir_path)) == repr(ofl_ref)
@@ -0,0 +1,82 @@
+import ast
+import pytest
+from basic_framework.refactoring import Refactoring, normalize_code
+from basic_framework.cfs import get_func_cfs, get_func_map
+
+
+@pytest.fixture(scope="module")
+def corr_code_map(data_dir_path, load_code_map):
+    corr_code_map = load_code_map(data_dir_path + "/question_2", "reference")
+    corr_code_map.update(load_code_map(data_dir_path + "/question_2", "correct", 10))
+    return corr_code_map
+
+
+def test_parallel_ofl_bfs(corr_code_map):
+    rft = Refactoring(corr_code_map, None, 2)
+    cluster_list_map = rft.ofl_bfs()
+    prl_rft = Refactoring(corr_code_map, None, 2, jobs=2)
+    prl_cluster_list_map = prl_rft.ofl_bfs()
+
+    # The same clusters and codes, in the same order
+    assert sum(len(cluster["code"]) for cluster_list in cluster_list_map.values() for cluster in cluster_list) > \
+        len(corr_code_map)
+    assert repr(prl_cluster_list_map) == repr(cluster_list_map)
+    assert repr(prl_rft.rule_list_map) == repr(rft.rule_list_map)
+
+
+def get_cluster(code_list, root_file_name_list):
+    _, stru_list, indent_list = get_func_cfs(code_list[0])
+    return {"stru": stru_list, "indent": indent_list, "code": list(code_list),
+            "root_file_name": list(root_file_name_list), "rule_id": [""] * len(code_list)}
+
+
+def test_merge_dedup():
+    code = "def f(x):\n    if x:\n        return 1\n    return 0"
+    dup_code = "def f(x):  \n\n    if x:\n        return 1\n    return 0\n"
+    other_code = "def f(y):\n    if y:\n        return 1\n    return 0"
+
+    rft = Refactoring({})
+    rft.merge({"f": [get_cluster([code, dup_code, other_code], ["a.py", "b.py", "c.py"])]})
+    rft.merge({"f": [get_cluster([dup_code, other_code], ["d.py", "e.py"])]})
+
+    # Codes equal but for trailing spaces and blank lines are stored once, distinct codes of a structure are kept
+    assert repr(rft.cluster_list_map) == repr({"f": [get_cluster([code, other_code], ["a.py", "c.py"])]})
+
+
+def test_ofl_bfs_dedup(corr_code_map):
+    corr_code_map = dict(corr_code_map)
+    file_name, code = next(iter(corr_code_map.items()))
+    corr_code_map["dup_" + file_name] = code + "\n\n"
+    cluster_list_map = Refactoring(corr_code_map, None, 2).ofl_bfs()
+
+    for func_name, cluster_list in cluster_list_map.items():
+        code_list = [normalize_code(code) for cluster in cluster_list for code in cluster["code"]]
+        assert len(code_list) == len(set(code_list))
+
+        # Each distinct function of the programs is kept, the one of the copy only once
+        assert all("dup_" not in root_file_name
+                   for cluster in cluster_list for root_file_name in cluster["root_file_name"])
+        for code in corr_code_map.values():
+            func_map = get_func_map(code)
+            if func_name in func_map.keys():
+                assert normalize_code(func_map[func_name]) in code_list
+
+
+@pytest.mark.parametrize("ques_name", ["question_1", "question_2", "question_3", "question_4", "question_5"])
+def test_prefilter_keeps_rules(data_dir_path, load_code_map, ques_name):
+    code_map = load_code_map(data_dir_path + "/" + ques_name, "correct", 6)
+    rft = Refactoring(code_map, None, 2)
+    code_list = [code for cluster_list in rft.ofl_bfs().values()
+                 for cluster in cluster_list for code in cluster["code"]]
+    assert len(code_list) > len(code_map)
+
+    # Skipping the rules whose features a code lacks leaves the refactored codes of every rule as they were
+    for code in code_list:
+        try:
+            ast.parse(code)
+        except SyntaxError:
+            # Left by rules breaking nested functions, which no rule can refactor
+            with pytest.raises(Exception):
+                rft.refactor_all(code)
+            continue
+        assert rft.refactor_all(code) == [rft.refactor(code, rule_id) for rule_id in range(1, 22)]
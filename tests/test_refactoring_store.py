@@ -0,0 +1,56 @@
+import pytest
+from basic_framework.refactoring import Refactoring, RefactoringStore, normalize_code
+
+
+def get_code_root_set(cluster_list):
+    return {(code, root_file_name) for cluster in cluster_list
+            for code, root_file_name in zip(cluster["code"], cluster["root_file_name"])}
+
+
+@pytest.fixture(scope="module")
+def rft_store(data_dir_path, load_code_map, tmp_path_factory):
+    corr_code_map = load_code_map(data_dir_path + "/question_2", "reference")
+    corr_code_map.update(load_code_map(data_dir_path + "/question_2", "correct", 20))
+    store = RefactoringStore(str(tmp_path_factory.mktemp("store")) + "/refactor_store.pickle")
+    store.refactor(corr_code_map)
+    return store, corr_code_map
+
+
+def test_store_equals_ofl_bfs_without_common_codes(rft_store):
+    store, corr_code_map = rft_store
+
+    # The programs whose codes are not reached by the programs before them
+    sel_code_map = {}
+    func_code_set_map = {}
+    for file_name, code in corr_code_map.items():
+        cluster_list_map = store.get_refactoring({file_name: code}).cluster_list_map
+        code_set_map = {func_name: {normalize_code(code) for code, _ in get_code_root_set(cluster_list)}
+                        for func_name, cluster_list in cluster_list_map.items()}
+        if all(len(code_set & func_code_set_map.get(func_name, set())) == 0
+               for func_name, code_set in code_set_map.items()):
+            sel_code_map[file_name] = code
+            for func_name, code_set in code_set_map.items():
+                func_code_set_map.setdefault(func_name, set()).update(code_set)
+    assert len(sel_code_map) > 1
+
+    cluster_list_map = Refactoring(sel_code_map, None, 2).ofl_bfs()
+    assert repr(store.get_refactoring(sel_code_map).cluster_list_map) == repr(cluster_list_map)
+
+
+def test_store_approximates_ofl_bfs(rft_store):
+    store, corr_code_map = rft_store
+
+    cluster_list_map = Refactoring(corr_code_map, None, 2).ofl_bfs()
+    mrg_cluster_list_map = store.get_refactoring(corr_code_map).cluster_list_map
+    assert list(mrg_cluster_list_map.keys()) == list(cluster_list_map.keys())
+
+    for func_name, cluster_list in cluster_list_map.items():
+        mrg_cluster_list = mrg_cluster_list_map[func_name]
+        assert [(cluster["stru"], cluster["indent"]) for cluster in mrg_cluster_list] == \
+               [(cluster["stru"], cluster["indent"]) for cluster in cluster_list]
+
+        # Only codes that a program reaches through a code dropped as another program's are left out
+        code_root_set = get_code_root_set(cluster_list)
+        mrg_code_root_set = get_code_root_set(mrg_cluster_list)
+        assert mrg_code_root_set <= code_root_set
+        assert len(code_root_set) - len(mrg_code_root_set) <= len(code_root_set) // 100
@@ -0,0 +1,42 @@
+import os
+from basic_framework.repair import BlockRepair
+
+
+def get_status_list(perf_map):
+    return [(sr, exp_idx, bug_file_name, code_perf_map["status"])
+            for sr, exp_perf_map in perf_map.items()
+            for exp_idx, file_perf_map in exp_perf_map.items()
+            for bug_file_name, code_perf_map in file_perf_map.items()]
+
+
+def test_parallel_repair(make_ques):
+    ques_dir_path = make_ques("question_1", 5, 8)
+
+    status_list_list = []
+    for jobs in [1, 3]:
+        br = BlockRepair(ques_dir_path, is_offline_ref=False, is_online_ref=True, is_mutation=False,
+                         sr_list=[100], exp_time=1, jobs=jobs)
+        status_list_list.append(get_status_list(br.run(timeout=10)))
+
+    # The same statuses, in the order of the buggy files
+    assert len(status_list_list[0]) == 8
+    assert status_list_list[1] == status_list_list[0]
+    assert len({status for _, _, _, status in status_list_list[0]}) > 1
+
+
+def rep_file_or_die(bug_file_name, bug_code):
+    if bug_file_name.startswith("die"):
+        os._exit(1)
+    return {"status": "success_" + bug_file_name}
+
+
+def test_parallel_repair_dead_worker(make_ques):
+    br = BlockRepair(make_ques("question_1", 0, 0), is_offline_ref=False, is_online_ref=False, is_mutation=False,
+                     sr_list=[100], exp_time=1, jobs=2)
+    buggy_code_map = {file_name: "" for file_name in ["a.py", "die_1.py", "b.py", "c.py", "die_2.py", "d.py"]}
+
+    # The file of a worker that dies fails, the others are repaired and all are yielded in order
+    res_list = list(br._BlockRepair__iter_rep_files(rep_file_or_die, buggy_code_map))
+    assert [bug_file_name for bug_file_name, _ in res_list] == list(buggy_code_map.keys())
+    assert [code_perf_map["status"] for _, code_perf_map in res_list] == \
+           ["success_a.py", "fail_exception", "success_b.py", "success_c.py", "fail_exception", "success_d.py"]
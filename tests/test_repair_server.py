@@ -0,0 +1,87 @@
+import os
+import json
+import socket
+import asyncio
+import threading
+import pytest
+import repair_server
+from repair_server import RepairServer, load_engine
+
+
+def get_free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+@pytest.fixture(scope="module")
+def server_port(ofl_ques_dir_path):
+    """The port of a RepairServer with two workers, serving question_1 from a thread of its own"""
+    load_engine(os.path.dirname(ofl_ques_dir_path), ["question_1"], 100, 0, False)
+
+    port = get_free_port()
+    task_list = []
+
+    async def serve():
+        task_list.append((asyncio.get_running_loop(), asyncio.current_task()))
+        try:
+            await RepairServer(2, 4, 10).serve("127.0.0.1", port)
+        except asyncio.CancelledError:
+            pass
+
+    t = threading.Thread(target=asyncio.run, args=(serve(),))
+    t.start()
+
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", port)).close()
+            break
+        except ConnectionRefusedError:
+            t.join(0.1)
+    yield port
+
+    # asyncio.run cancels the consumers left once serve returns
+    loop, task = task_list[0]
+    loop.call_soon_threadsafe(task.cancel)
+    t.join()
+
+
+def request(port, line_list):
+    """Send the lines on one connection and return the answers, in order"""
+    with socket.create_connection(("127.0.0.1", port)) as s, s.makefile("rw") as f:
+        for line in line_list:
+            f.write(line + "\n")
+        f.flush()
+        return [json.loads(f.readline()) for _ in line_list]
+
+
+def test_bad_request(server_port):
+    line_list = ["not json",
+                 "[]",
+                 json.dumps({"code": "def f(): pass"}),
+                 json.dumps({"question": "question_1"}),
+                 json.dumps({"question": "question_1", "code": None}),
+                 json.dumps({"question": "question_1", "code": "def f(): pass", "timeout": 0}),
+                 json.dumps({"question": "question_1", "code": "def f(): pass", "timeout": True}),
+                 json.dumps({"question": "question_1", "code": "def f(): pass", "timeout": "10"})]
+    assert request(server_port, line_list) == [{"status": "fail_bad_request"}] * len(line_list)
+
+
+def test_unknown_question(server_port):
+    line_list = [json.dumps({"question": "question_0", "code": "def f(): pass"})]
+    assert request(server_port, line_list) == [{"status": "fail_unknown_question"}]
+
+
+def test_round_trip(server_port, ofl_ques_dir_path, load_code_map):
+    bug_code_map = load_code_map(ofl_ques_dir_path, "wrong")
+    line_list = [json.dumps({"question": "question_1", "code": bug_code, "timeout": 10})
+                 for bug_code in bug_code_map.values()]
+    res_list = request(server_port, line_list)
+
+    # As repaired by the engine of the server itself, in the order of the requests
+    assert len(res_list) == len(bug_code_map)
+    for bug_code, res in zip(bug_code_map.values(), res_list):
+        code_perf_map = repair_server.engine.repair("question_1", bug_code, 10)
+        assert res["status"] == res["perf"]["status"] == code_perf_map["status"]
+        assert res["rep_code"] == code_perf_map.get("rep_code", "")
+    assert any(res["status"].startswith("success") for res in res_list)